@@ -1,6 +1,8 @@
 from .chunk import Chunk
 from .block import Block, OldBlock
 from .region import Region
+from .region_cache import RegionCache
+from .chunk_cache import ChunkCache
 from .empty_region import EmptyRegion
 from .empty_chunk import EmptyChunk
 from .empty_section import EmptySection
@@ -2,18 +2,27 @@ from nbt import nbt
 from frozendict import frozendict
 from .legacy import LEGACY_ID_MAP
 
+# Shared instances handed out by Block.from_palette, Block.from_numeric_id and OldBlock,
+# a world only has a few thousand distinct block states
+_PALETTE_BLOCKS = {}
+_NUMERIC_BLOCKS = {}
+_OLD_BLOCKS = {}
+
 class Block:
     """
     Represents a minecraft block.
 
+    Blocks are immutable, as :meth:`Block.from_palette` and :meth:`Block.from_numeric_id`
+    share them between every chunk they're read from.
+
     Attributes
     ----------
     namespace: :class:`str`
         Namespace of the block, most of the time this is ``minecraft``
     id: :class:`str`
         ID of the block, for example: stone, diamond_block, etc...
-    properties: :class:`dict`
-        Block properties as a dict
+    properties: :class:`frozendict`
+        Block properties as a frozendict
     """
     __slots__ = ('namespace', 'id', 'properties')
 
@@ -29,12 +38,16 @@ class Block:
             Block properties
         """
         if block_id is None:
-            self.namespace = 'minecraft'
-            self.id = namespace
-        else:
-            self.namespace = namespace
-            self.id = block_id
-        self.properties = properties or {}
+            namespace, block_id = 'minecraft', namespace
+        object.__setattr__(self, 'namespace', namespace)
+        object.__setattr__(self, 'id', block_id)
+        object.__setattr__(self, 'properties', frozendict(properties or {}))
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f'Block is immutable, can\'t set {name!r}')
+
+    def __reduce__(self):
+        return (type(self), (self.namespace, self.id, self.properties))
 
     def name(self) -> str:
         """
@@ -71,7 +84,10 @@ class Block:
     @classmethod
     def from_palette(cls, tag: nbt.TAG_Compound):
         """
-        Creates a new Block from the tag format on Section.Palette
+        Returns the Block for the tag format on Section.Palette
+
+        Blocks are interned: every palette entry with the same name and properties
+        gives back the same instance, with its properties in a :class:`frozendict`.
 
         Parameters
         ----------
@@ -80,14 +96,19 @@ class Block:
         """
         name = tag['Name'].value
         properties = tag.get('Properties')
-        if properties:
-            properties = dict(properties)
-        return cls.from_name(name, properties=properties)
+        properties = frozendict({key: value.value for key, value in properties.items()}) if properties else frozendict()
+        key = (cls, name, properties)
+        block = _PALETTE_BLOCKS.get(key)
+        if block is None:
+            block = _PALETTE_BLOCKS[key] = cls.from_name(name, properties=properties)
+        return block
 
     @classmethod
     def from_numeric_id(cls, block_id: int, data: int=0):
         """
-        Creates a new Block from the block_id:data fromat used pre-flattening (pre-1.13)
+        Returns the Block for the block_id:data fromat used pre-flattening (pre-1.13)
+
+        Blocks are interned like in :meth:`Block.from_palette`
 
         Parameters
         ----------
@@ -98,16 +119,23 @@ class Block:
         """
         # See https://minecraft.gamepedia.com/Java_Edition_data_value/Pre-flattening
         # and https://minecraft.gamepedia.com/Java_Edition_data_value for current values
+        block = _NUMERIC_BLOCKS.get((cls, block_id, data))
+        if block is not None:
+            return block
         key = f'{block_id}:{data}'
         if key not in LEGACY_ID_MAP:
             raise KeyError(f'Block {key} not found')
         name, properties = LEGACY_ID_MAP[key]
-        return cls('minecraft', name, properties=properties)
+        block = cls('minecraft', name, properties=properties)
+        _NUMERIC_BLOCKS[(cls, block_id, data)] = block
+        return block
 
 class OldBlock:
     """
     Represents a pre 1.13 minecraft block, with a numeric id.
 
+    OldBlocks are immutable and interned, ``OldBlock(1, 2) is OldBlock(1, 2)``
+
     Attributes
     ----------
     id: :class:`int`
@@ -117,7 +145,7 @@ class OldBlock:
     """
     __slots__ = ('id', 'data')
 
-    def __init__(self, block_id: int, data: int=0):
+    def __new__(cls, block_id: int, data: int=0):
         """
         Parameters
         ----------
@@ -126,8 +154,20 @@ class OldBlock:
         data
             Block data
         """
-        self.id = block_id
-        self.data = data
+        key = (cls, block_id, data)
+        block = _OLD_BLOCKS.get(key)
+        if block is None:
+            block = super().__new__(cls)
+            object.__setattr__(block, 'id', block_id)
+            object.__setattr__(block, 'data', data)
+            _OLD_BLOCKS[key] = block
+        return block
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f'OldBlock is immutable, can\'t set {name!r}')
+
+    def __reduce__(self):
+        return (type(self), (self.id, self.data))
 
     def convert(self) -> Block:
         return Block.from_numeric_id(self.id, self.data)
@@ -138,7 +178,7 @@ class OldBlock:
     def __eq__(self, other):
         if isinstance(other, int):
             return self.id == other
-        elif not isinstance(other, Block):
+        elif not isinstance(other, OldBlock):
             return False
         else:
             return self.id == other.id and self.data == other.data
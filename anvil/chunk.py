@@ -1,9 +1,11 @@
-from typing import Union, Tuple, Generator, Optional
+from typing import Union, Tuple, Generator, Optional, Dict
 from nbt import nbt
 from .block import Block, OldBlock
 from .region import Region
 from .errors import OutOfBoundsCoordinates, ChunkNotFound
+from functools import lru_cache
 import math
+import numpy as np
 
 
 # This version removes block state value stretching from the storage
@@ -29,6 +31,67 @@ def nibble(byte_array, index):
     else:
         return value & 0b1111
 
+def nibbles(byte_array) -> np.ndarray:
+    """
+    Vectorized version of ``nibble``,
+    returns every nibble of the byte array as an ``uint8`` array twice as long
+    """
+    packed = np.frombuffer(byte_array, dtype=np.uint8)
+    unpacked = np.empty(packed.size * 2, dtype=np.uint8)
+    unpacked[0::2] = packed & 0b1111
+    unpacked[1::2] = packed >> 4
+    return unpacked
+
+@lru_cache(maxsize=None)
+def _blockstates_layout(bits: int, stretches: bool) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Returns, for each of the 4096 blocks, the BlockStates element its bits start in,
+    how far they are shifted in it, and whether some of them spill over into the next element
+    """
+    index = np.arange(4096, dtype=np.uint64)
+    if stretches:
+        bit = index * np.uint64(bits)
+        state = bit >> np.uint64(6)
+        shift = bit & np.uint64(63)
+        spill = shift + np.uint64(bits) > 64
+    else:
+        per_state = np.uint64(64 // bits)
+        state = index // per_state
+        shift = index % per_state * np.uint64(bits)
+        spill = np.zeros(4096, dtype=bool)
+    return state.astype(np.intp), shift, spill
+
+def unpack_blockstates(states, bits: int, stretches: bool) -> np.ndarray:
+    """
+    Vectorized BlockStates decoding, returns the palette index of all 4096 blocks
+    of a section as an ``uint16`` array, in the YZX order
+
+    Parameters
+    ----------
+    states
+        The section's ``BlockStates`` values, signed or unsigned 64 bit numbers
+    bits
+        Number of bits each block takes
+    stretches
+        Whether a block can be split between two elements, which is the case before 20w17a
+    """
+    try:
+        longs = np.array(states, dtype=np.int64).view(np.uint64)
+    except OverflowError:
+        # nbt was patched to read them as unsigned
+        longs = np.array(states, dtype=np.uint64)
+    # Extra element so blocks at the very end can look at the "next" one
+    longs = np.append(longs, np.uint64(0))
+
+    state, shift, spill = _blockstates_layout(bits, stretches)
+    values = longs[state] >> shift
+    if stretches:
+        # bits that didn't fit are at the start of the next element,
+        # (x << 1) << (63 - n) is x << (64 - n) without ever shifting by 64
+        spilled = (longs[state + 1] << np.uint64(1)) << (np.uint64(63) - shift)
+        values |= np.where(spill, spilled, np.uint64(0))
+    return (values & np.uint64((1 << bits) - 1)).astype(np.uint16)
+
 class Chunk:
     """
     Represents a chunk from a ``.mca`` file.
@@ -45,17 +108,34 @@ class Chunk:
         Version of the chunk NBT structure
     data: :class:`nbt.TAG_Compound`
         Raw NBT data of the chunk
-    tile_entities: :class:`nbt.TAG_Compound`
-        ``self.data['TileEntities']`` as an attribute for easier use
     """
-    __slots__ = ('version', 'data', 'x', 'z', 'tile_entities')
-
-    def __init__(self, nbt_data: nbt.NBTFile):
+    __slots__ = ('version', 'data', 'x', 'z', '_sections', '_tile_entity_index', '_palettes')
 
+    def __init__(self, nbt_data: nbt.TAG_Compound):
+        """
+        Parameters
+        ----------
+        nbt_data
+            Chunk's root NBT tag, either a full :class:`nbt.NBTFile`
+            or a :class:`anvil.lazy_nbt.LazyCompound` which only parses the tags that get used
+        """
+        # Pre 1.9 chunks (like NationsGlory's 1.6 worlds) don't have a DataVersion
+        self.version = nbt_data['DataVersion'].value if 'DataVersion' in nbt_data else None
         self.data = nbt_data['Level']
         self.x = self.data['xPos'].value
         self.z = self.data['zPos'].value
-        self.tile_entities = self.data['TileEntities']
+        # Sections by Y index, built on first access by get_section
+        self._sections = None
+        # Tile entities by position, built on first access by tile_entity_index
+        self._tile_entity_index = None
+        # Decoded palettes, id(Palette tag) -> (Palette tag, blocks)
+        # the tag is kept so its id can't be reused
+        self._palettes = {}
+
+    @property
+    def tile_entities(self) -> nbt.TAG_List:
+        """``self.data['TileEntities']`` as an attribute for easier use"""
+        return self.data['TileEntities']
 
     def get_section(self, y: int) -> nbt.TAG_Compound:
         """
@@ -75,18 +155,21 @@ class Chunk:
         if y < 0 or y > 15:
             raise OutOfBoundsCoordinates(f'Y ({y!r}) must be in range of 0 to 15')
 
-        try:
-            sections = self.data["Sections"]
-        except KeyError:
-            return None
+        if self._sections is None:
+            self._sections = [None] * 16
+            sections = self.data['Sections'] if 'Sections' in self.data else ()
+            for section in sections:
+                index = section['Y'].value
+                # Keep the first one, like a linear search would
+                if 0 <= index <= 15 and self._sections[index] is None:
+                    self._sections[index] = section
 
-        for section in sections:
-            if section['Y'].value == y:
-                return section
+        return self._sections[y]
 
     def get_palette(self, section: Union[int, nbt.TAG_Compound]) -> Tuple[Block]:
         """
-        Returns the block palette for given section
+        Returns the block palette for given section,
+        it is only decoded once per section
 
         Parameters
         ----------
@@ -100,7 +183,116 @@ class Chunk:
             section = self.get_section(section)
         if section is None:
             return
-        return tuple(Block.from_palette(i) for i in section['Palette'])
+        palette = section['Palette']
+        cached = self._palettes.get(id(palette))
+        if cached is None:
+            cached = self._palettes[id(palette)] = (palette, tuple(Block.from_palette(i) for i in palette))
+        return cached[1]
+
+    def section_array(self, section: Union[int, nbt.TAG_Compound]) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Returns the numeric block ids and block data of a pre-flattening (pre-1.13) section
+        as two arrays of shape ``(16, 16, 16)``, indexed as ``[y, z, x]``
+
+        Missing sections are returned as air, aka zeros
+
+        Parameters
+        ----------
+        section
+            Either a section NBT tag or an index
+
+        Raises
+        ------
+        anvil.OutOfBoundsCoordinates
+            If the section index is not in range of 0 to 15
+        ValueError
+            If the chunk uses the flattened, palette based, format
+
+        Returns
+        -------
+        Tuple[:class:`numpy.ndarray`, :class:`numpy.ndarray`]
+            Block ids as ``uint16`` (``Blocks`` plus the ``Add`` nibbles) and block data as ``uint8``
+        """
+        if self.version is not None and self.version >= _VERSION_17w47a:
+            raise ValueError(f'Chunk version {self.version} has no numeric block ids')
+        if isinstance(section, int):
+            section = self.get_section(section)
+
+        if section is None or 'Blocks' not in section:
+            return np.zeros((16, 16, 16), dtype=np.uint16), np.zeros((16, 16, 16), dtype=np.uint8)
+
+        ids = np.frombuffer(section['Blocks'].value, dtype=np.uint8).astype(np.uint16)
+        if 'Add' in section:
+            ids |= nibbles(section['Add'].value).astype(np.uint16) << 8
+        data = nibbles(section['Data'].value)
+        return ids.reshape(16, 16, 16), data.reshape(16, 16, 16)
+
+    def to_volume(self) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Returns the numeric block ids and block data of the whole pre-flattening (pre-1.13) chunk
+        as two contiguous arrays of shape ``(256, 16, 16)``, indexed as ``[y, z, x]``
+
+        Missing sections are left as air, aka zeros
+
+        Raises
+        ------
+        ValueError
+            If the chunk uses the flattened, palette based, format
+
+        Returns
+        -------
+        Tuple[:class:`numpy.ndarray`, :class:`numpy.ndarray`]
+            Block ids as ``uint16`` and block data as ``uint8``, see :meth:`Chunk.section_array`
+        """
+        if self.version is not None and self.version >= _VERSION_17w47a:
+            raise ValueError(f'Chunk version {self.version} has no numeric block ids')
+
+        ids = np.zeros((256, 16, 16), dtype=np.uint16)
+        data = np.zeros((256, 16, 16), dtype=np.uint8)
+        for y in range(16):
+            section = self.get_section(y)
+            if section is not None and 'Blocks' in section:
+                ids[y * 16 : y * 16 + 16], data[y * 16 : y * 16 + 16] = self.section_array(section)
+        return ids, data
+
+    def section_palette_indices(self, section: Union[int, nbt.TAG_Compound]) -> Tuple[Optional[nbt.TAG_List], np.ndarray]:
+        """
+        Returns the raw palette of a flattened (1.13+) section and the palette index
+        of each of its blocks as an array of shape ``(16, 16, 16)``, indexed as ``[y, z, x]``.
+        No :class:`anvil.Block` gets created, use :meth:`Chunk.get_palette` for that.
+
+        Missing sections are returned as ``(None, zeros)``
+
+        Parameters
+        ----------
+        section
+            Either a section NBT tag or an index
+
+        Raises
+        ------
+        anvil.OutOfBoundsCoordinates
+            If the section index is not in range of 0 to 15
+        ValueError
+            If the chunk uses the pre-flattening, numeric id, format
+
+        Returns
+        -------
+        Tuple[:class:`nbt.TAG_List`, :class:`numpy.ndarray`]
+            The section's ``Palette`` tag and the ``uint16`` palette indexes
+        """
+        if self.version is None or self.version < _VERSION_17w47a:
+            raise ValueError(f'Chunk version {self.version} has no block palette, use section_array')
+        if isinstance(section, int):
+            section = self.get_section(section)
+
+        if section is None or 'BlockStates' not in section:
+            return None, np.zeros((16, 16, 16), dtype=np.uint16)
+
+        palette = section['Palette']
+        bits = max((len(palette) - 1).bit_length(), 4)
+        stretches = self.version < _VERSION_20w17a
+        indices = unpack_blockstates(section['BlockStates'].value, bits, stretches)
+        return palette, indices.reshape(16, 16, 16)
 
     def get_block(self, x: int, y: int, z: int, section: Union[int, nbt.TAG_Compound]=None, force_new: bool=False) -> Union[Block, OldBlock]:
         """
@@ -218,8 +410,7 @@ class Chunk:
         # which are the palette index
         palette_id = shifted_data & 2**bits - 1
 
-        block = section['Palette'][palette_id]
-        return Block.from_palette(block)
+        return self.get_palette(section)[palette_id]
 
     def stream_blocks(self, index: int=0, section: Union[int, nbt.TAG_Compound]=None, force_new: bool=False) -> Generator[Block, None, None]:
         """
@@ -256,83 +447,32 @@ class Chunk:
         if section is None or isinstance(section, int):
             section = self.get_section(section or 0)
 
-        if self.version < _VERSION_17w47a:
+        if self.version is None or self.version < _VERSION_17w47a:
             if section is None or 'Blocks' not in section:
                 air = Block.from_name('minecraft:air') if force_new else OldBlock(0)
-                for i in range(4096):
+                for i in range(index, 4096):
                     yield air
                 return
 
-            while index < 4096:
-                block_id = section['Blocks'][index]
-                if 'Add' in section:
-                    block_id += nibble(section['Add'], index) << 8
-
-                block_data = nibble(section['Data'], index)
-
+            ids, data = self.section_array(section)
+            for block_id, block_data in zip(ids.ravel()[index:].tolist(), data.ravel()[index:].tolist()):
                 block = OldBlock(block_id, block_data)
                 if force_new:
                     yield block.convert()
                 else:
                     yield block
-
-                index += 1
             return
 
         if section is None or 'BlockStates' not in section:
             air = Block.from_name('minecraft:air')
-            for i in range(4096):
+            for i in range(index, 4096):
                 yield air
             return
 
-        states = section['BlockStates'].value
-        palette = section['Palette']
-
-        bits = max((len(palette) - 1).bit_length(), 4)
-
-        stretches = self.version < _VERSION_20w17a
-
-        if stretches:
-            state = index * bits // 64
-        else:
-            state = index // (64 // bits)
-
-        data = states[state]
-        if data < 0:
-            data += 2**64
-
-        bits_mask = 2**bits - 1
-
-        if stretches:
-            offset = (bits * index) % 64
-        else:
-            offset = index % (64 // bits) * bits
-
-        data_len = 64 - offset
-        data >>= offset
-
-        while index < 4096:
-            if data_len < bits:
-                state += 1
-                new_data = states[state]
-                if new_data < 0:
-                    new_data += 2**64
-
-                if stretches:
-                    leftover = data_len
-                    data_len += 64
-
-                    data = bin_append(new_data, data, leftover)
-                else:
-                    data = new_data
-                    data_len = 64
-
-            palette_id = data & bits_mask
-            yield Block.from_palette(palette[palette_id])
-
-            index += 1
-            data >>= bits
-            data_len -= bits
+        palette = self.get_palette(section)
+        _, indices = self.section_palette_indices(section)
+        for palette_id in indices.ravel()[index:].tolist():
+            yield palette[palette_id]
 
     def stream_chunk(self, index: int=0, section: Union[int, nbt.TAG_Compound]=None) -> Generator[Block, None, None]:
         """
@@ -354,13 +494,23 @@ class Chunk:
 
         To iterate through all tile entities in the chunk, use :class:`Chunk.tile_entities`
         """
-        for tile_entity in self.tile_entities:
-            t_x, t_y, t_z = [tile_entity[k].value for k in 'xyz']
-            if x == t_x and y == t_y and z == t_z:
-                return tile_entity
+        return self.tile_entity_index().get((x, y, z))
+
+    def tile_entity_index(self) -> Dict[Tuple[int, int, int], nbt.TAG_Compound]:
+        """
+        Returns the chunk's tile entities keyed by their ``(x, y, z)`` coordinates,
+        the dict is built once and reused
+        """
+        if self._tile_entity_index is None:
+            tile_entities = self.tile_entities if 'TileEntities' in self.data else ()
+            self._tile_entity_index = {
+                (tile_entity['x'].value, tile_entity['y'].value, tile_entity['z'].value): tile_entity
+                for tile_entity in tile_entities
+            }
+        return self._tile_entity_index
 
     @classmethod
-    def from_region(cls, region: Union[str, Region], chunk_x: int, chunk_z: int):
+    def from_region(cls, region: Union[str, Region], chunk_x: int, chunk_z: int, lazy: bool=False):
         """
         Creates a new chunk from region and the chunk's X and Z
 
@@ -368,6 +518,9 @@ class Chunk:
         ----------
         region
             Either a :class:`anvil.Region` or a region file name (like ``r.0.0.mca``)
+        lazy
+            Only parse the NBT tags when they are accessed,
+            see :meth:`anvil.Region.chunk_data`
 
         Raises
         ----------
@@ -376,7 +529,7 @@ class Chunk:
         """
         if isinstance(region, str):
             region = Region.from_file(region)
-        nbt_data = region.chunk_data(chunk_x, chunk_z)
+        nbt_data = region.chunk_data(chunk_x, chunk_z, lazy=lazy)
         if nbt_data is None:
             raise ChunkNotFound(f'Could not find chunk ({chunk_x}, {chunk_z})')
         return cls(nbt_data)
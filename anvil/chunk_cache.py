@@ -0,0 +1,180 @@
+from typing import Dict, List, Optional, Tuple
+from collections import OrderedDict
+import hashlib
+import os
+import tempfile
+import threading
+import numpy as np
+from .region import Region
+
+# (timestamp, sector offset, sector count) of a chunk in its region's header
+_Stamp = Tuple[int, int, int]
+# (block ids, block data) as returned by Chunk.to_volume
+_Volume = Tuple[np.ndarray, np.ndarray]
+
+def _pack_stamp(stamp: _Stamp) -> List[int]:
+    """Splits a stamp into 16 bit words, to store it along the blocks"""
+    timestamp, offset, count = stamp
+    return [timestamp >> 16, timestamp & 0xFFFF, offset >> 16, offset & 0xFFFF, count]
+
+class ChunkCache:
+    """
+    Cache of decoded chunk volumes (see :meth:`anvil.Chunk.to_volume`),
+    so analysing a world again only decodes the chunks that changed since.
+
+    Chunks are keyed by region path and chunk coordinates, and validated against
+    the chunk's timestamp, sector offset and sector count in the region header:
+    Minecraft rewrites at least one of those whenever it saves a chunk.
+
+    Volumes are kept in memory up to ``max_bytes``, least recently used first out,
+    and also saved as ``.npy`` files if a ``directory`` is given,
+    which only hold the non empty sections.
+    Returned arrays are read only, as they are shared.
+
+    Attributes
+    ----------
+    max_bytes: :class:`int`
+        Byte budget of the in memory cache
+    directory: Optional[:class:`str`]
+        Folder of the on disk cache, ``None`` to only cache in memory
+    """
+    __slots__ = ('max_bytes', 'directory', '_volumes', '_size', '_lock')
+    def __init__(self, max_bytes: int=512 * 1024 * 1024, directory: str=None):
+        self.max_bytes = max_bytes
+        self.directory = directory
+        # (region path, x, z) -> (stamp, volume), least recently used first
+        self._volumes: Dict[Tuple[str, int, int], Tuple[_Stamp, _Volume]] = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def __reduce__(self):
+        # Sent to worker processes as an empty in memory cache over the same directory,
+        # the files on disk are what they share
+        return ChunkCache, (self.max_bytes, self.directory)
+
+    def __len__(self) -> int:
+        return len(self._volumes)
+
+    def get_volume(self, region: Region, chunk_x: int, chunk_z: int) -> Optional[_Volume]:
+        """
+        Returns the block ids and block data arrays of the chunk at given coordinates,
+        decoding it only if it isn't cached or if it changed since it was.
+        Returns ``None`` if the chunk hasn't been generated yet.
+
+        Regions that weren't read from a path are decoded without being cached
+
+        Parameters
+        ----------
+        region
+            Region the chunk is in
+        chunk_x
+            Chunk's X value
+        chunk_z
+            Chunk's Z value
+        """
+        index = chunk_x % 32 + chunk_z % 32 * 32
+        if region.offsets[index] == 0 and region.sector_counts[index] == 0:
+            return
+        if region.path is None:
+            return region.get_chunk(chunk_x, chunk_z, lazy=True).to_volume()
+
+        stamp = (int(region.timestamps[index]), int(region.offsets[index]), int(region.sector_counts[index]))
+        key = (os.path.abspath(region.path), chunk_x % 32, chunk_z % 32)
+        with self._lock:
+            entry = self._volumes.get(key)
+            if entry is not None and entry[0] == stamp:
+                self._volumes.move_to_end(key)
+                return entry[1]
+
+        volume = self._load(key, stamp)
+        if volume is None:
+            volume = region.get_chunk(chunk_x, chunk_z, lazy=True).to_volume()
+            for array in volume:
+                array.flags.writeable = False
+            self._save(key, stamp, volume)
+        self._store(key, stamp, volume)
+        return volume
+
+    def clear(self):
+        """Empties the in memory cache, files on disk are kept"""
+        with self._lock:
+            self._volumes.clear()
+            self._size = 0
+
+    def _store(self, key: Tuple[str, int, int], stamp: _Stamp, volume: _Volume):
+        """Puts a volume in the in memory cache and evicts the oldest ones if needed"""
+        with self._lock:
+            old = self._volumes.pop(key, None)
+            if old is not None:
+                self._size -= sum(array.nbytes for array in old[1])
+            self._volumes[key] = (stamp, volume)
+            self._size += sum(array.nbytes for array in volume)
+            while self._size > self.max_bytes and len(self._volumes) > 1:
+                _, (_, evicted) = self._volumes.popitem(last=False)
+                self._size -= sum(array.nbytes for array in evicted)
+
+    def _file(self, key: Tuple[str, int, int]) -> str:
+        """Returns the on disk cache file of a chunk"""
+        path, x, z = key
+        region_dir = hashlib.sha1(path.encode('utf-8')).hexdigest()[:16]
+        return os.path.join(self.directory, region_dir, f'c.{x}.{z}.npy')
+
+    def _load(self, key: Tuple[str, int, int], stamp: _Stamp) -> Optional[_Volume]:
+        """Returns the volume saved on disk, if there is one and it's still valid"""
+        if self.directory is None:
+            return
+        file = self._file(key)
+        try:
+            saved = np.load(file)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError, EOFError):
+            # Truncated or not a .npy file, decoded and saved again by the caller
+            self._remove(file)
+            return
+        try:
+            if saved[0, :5].tolist() != _pack_stamp(stamp):
+                return
+            # Then one row per non empty section: its Y index and its 4096 blocks as id << 4 | data
+            packed = np.zeros((16, 4096), dtype=np.uint16)
+            packed[saved[1:, 0]] = saved[1:, 1:]
+        except (IndexError, ValueError, TypeError):
+            # Not an array written by _save
+            self._remove(file)
+            return
+        ids = (packed >> 4).reshape(256, 16, 16)
+        data = (packed & 0b1111).astype(np.uint8).reshape(256, 16, 16)
+        ids.flags.writeable = False
+        data.flags.writeable = False
+        return ids, data
+
+    @staticmethod
+    def _remove(file: str):
+        """Deletes a broken cache file, if it's still there"""
+        try:
+            os.remove(file)
+        except OSError:
+            pass
+
+    def _save(self, key: Tuple[str, int, int], stamp: _Stamp, volume: _Volume):
+        """Writes the volume to disk, replacing the file atomically"""
+        if self.directory is None:
+            return
+        # Block ids are 12 bits and block data 4 bits, they fit together in 16 bits
+        packed = (volume[0] << 4 | volume[1]).reshape(16, 4096)
+        sections = np.flatnonzero(packed.any(axis=1))
+        saved = np.zeros((len(sections) + 1, 4097), dtype=np.uint16)
+        saved[0, :5] = _pack_stamp(stamp)
+        saved[1:, 0] = sections
+        saved[1:, 1:] = packed[sections]
+
+        file = self._file(key)
+        os.makedirs(os.path.dirname(file), exist_ok=True)
+        fd, temp = tempfile.mkstemp(dir=os.path.dirname(file), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                np.save(f, saved)
+            os.replace(temp, file)
+        except BaseException:
+            os.remove(temp)
+            raise
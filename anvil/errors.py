@@ -11,4 +11,13 @@ class EmptySectionAlreadyExists(Exception):
     """
 
 class GZipChunkData(Exception):
-    """Exception used when trying to get chunk data compressed in gzip"""
\ No newline at end of file
+    """
+    Exception used when trying to get chunk data compressed in gzip.
+    Not raised anymore since gzip chunks are supported, kept for compatibility
+    """
+
+class UnknownChunkCompression(Exception):
+    """Exception used when a chunk's compression type has no registered codec"""
+
+class CorruptChunk(Exception):
+    """Exception used when a chunk's location or length in the region header points outside of the file"""
@@ -0,0 +1,219 @@
+from typing import Dict, Tuple, Union
+from io import BytesIO
+from struct import Struct, error as StructError
+from nbt import nbt
+
+_BYTE = Struct('>b')
+_USHORT = Struct('>H')
+_INT = Struct('>i')
+
+# Payload size of the tags that don't have a length prefix
+_FIXED_SIZES = {
+    nbt.TAG_BYTE: 1,
+    nbt.TAG_SHORT: 2,
+    nbt.TAG_INT: 4,
+    nbt.TAG_LONG: 8,
+    nbt.TAG_FLOAT: 4,
+    nbt.TAG_DOUBLE: 8,
+}
+
+# Item size of the array tags, which are prefixed by their item count
+_ARRAY_SIZES = {
+    nbt.TAG_BYTE_ARRAY: 1,
+    nbt.TAG_INT_ARRAY: 4,
+    nbt.TAG_LONG_ARRAY: 8,
+}
+
+def _skip(data: bytes, pos: int, tag_id: int) -> int:
+    """
+    Returns the position right after the payload of a tag starting at ``pos``,
+    without reading the payload
+    """
+    if tag_id in _FIXED_SIZES:
+        return pos + _FIXED_SIZES[tag_id]
+    if tag_id in _ARRAY_SIZES:
+        return pos + 4 + max(_INT.unpack_from(data, pos)[0], 0) * _ARRAY_SIZES[tag_id]
+    if tag_id == nbt.TAG_STRING:
+        return pos + 2 + _USHORT.unpack_from(data, pos)[0]
+    if tag_id == nbt.TAG_LIST:
+        item_id = _BYTE.unpack_from(data, pos)[0]
+        length = max(_INT.unpack_from(data, pos + 1)[0], 0)
+        pos += 5
+        if item_id in _FIXED_SIZES:
+            return pos + length * _FIXED_SIZES[item_id]
+        for _ in range(length):
+            pos = _skip(data, pos, item_id)
+        return pos
+    if tag_id == nbt.TAG_COMPOUND:
+        return _scan_compound(data, pos)[1]
+    raise ValueError(f'Unrecognised tag type {tag_id}')
+
+def _scan_compound(data: bytes, pos: int) -> Tuple[Dict[str, Tuple[int, int]], int]:
+    """
+    Walks the compound payload starting at ``pos`` and returns the
+    ``name -> (tag id, payload position)`` of its children, plus the position after it
+    """
+    offsets = {}
+    while True:
+        tag_id = data[pos]
+        pos += 1
+        if tag_id == nbt.TAG_END:
+            return offsets, pos
+        length = _USHORT.unpack_from(data, pos)[0]
+        name = data[pos + 2 : pos + 2 + length].decode('utf-8')
+        pos += 2 + length
+        offsets[name] = (tag_id, pos)
+        pos = _skip(data, pos, tag_id)
+
+def _read_tag(data: bytes, tag_id: int, pos: int, name: str=None) -> nbt.TAG:
+    """
+    Reads the tag whose payload starts at ``pos``.
+    Compounds, and lists of compounds, are read as :class:`LazyCompound`
+    """
+    if tag_id == nbt.TAG_COMPOUND:
+        offsets = _scan_compound(data, pos)[0]
+        return LazyCompound(data, offsets, name=name)
+
+    if tag_id == nbt.TAG_LIST and data[pos] == nbt.TAG_COMPOUND:
+        tag = nbt.TAG_List(type=nbt.TAG_Compound, name=name)
+        length = _INT.unpack_from(data, pos + 1)[0]
+        pos += 5
+        for _ in range(length):
+            offsets, pos = _scan_compound(data, pos)
+            tag.tags.append(LazyCompound(data, offsets))
+        return tag
+
+    try:
+        tag = nbt.TAGLIST[tag_id]()
+    except KeyError:
+        raise ValueError(f'Unrecognised tag type {tag_id}')
+    tag.name = name
+    # BytesIO shares the bytes object instead of copying it
+    buffer = BytesIO(data)
+    buffer.seek(pos)
+    tag._parse_buffer(buffer)
+    return tag
+
+class LazyCompound(nbt.TAG_Compound):
+    """
+    Read only :class:`nbt.TAG_Compound` that only parses its children when they are accessed.
+
+    Compounds found inside are lazy as well, so for example a chunk
+    section's light arrays are never read if only ``Blocks`` and ``Data`` are used.
+    Anything that needs every child (mutating, saving, printing) parses them all first.
+    """
+    def __init__(self, data: bytes, offsets: Dict[str, Tuple[int, int]], name: str=None):
+        """
+        Parameters
+        ----------
+        data
+            The whole NBT data
+        offsets
+            ``name -> (tag id, payload position)`` of this compound's children
+        name
+            Name of the compound
+        """
+        super().__init__(name=name)
+        self._data = data
+        # Set to None once every child is parsed, then it acts as a plain TAG_Compound
+        self._offsets = offsets
+        self._loaded = {}
+
+    def _load(self, name: str) -> nbt.TAG:
+        """Returns the child with given name, parsing it if needed"""
+        tag = self._loaded.get(name)
+        if tag is None:
+            tag_id, pos = self._offsets[name]
+            tag = _read_tag(self._data, tag_id, pos, name)
+            self._loaded[name] = tag
+        return tag
+
+    def _load_all(self):
+        """Parses every child, in their original order"""
+        if self._offsets is None:
+            return
+        self.tags = [self._load(name) for name in self._offsets]
+        self._offsets = None
+        self._loaded = None
+
+    def __len__(self):
+        if self._offsets is None:
+            return super().__len__()
+        return len(self._offsets)
+
+    def __iter__(self):
+        if self._offsets is None:
+            return super().__iter__()
+        return iter(list(self._offsets))
+
+    def __contains__(self, key):
+        if self._offsets is None or not isinstance(key, str):
+            self._load_all()
+            return super().__contains__(key)
+        return key in self._offsets
+
+    def __getitem__(self, key):
+        if self._offsets is None or not isinstance(key, str):
+            self._load_all()
+            return super().__getitem__(key)
+        try:
+            return self._load(key)
+        except KeyError:
+            raise KeyError(f'Tag {key} does not exist')
+
+    def keys(self):
+        if self._offsets is None:
+            return super().keys()
+        return list(self._offsets)
+
+    def __setitem__(self, key, value):
+        self._load_all()
+        super().__setitem__(key, value)
+
+    def __delitem__(self, key):
+        self._load_all()
+        super().__delitem__(key)
+
+    def iteritems(self):
+        self._load_all()
+        return super().iteritems()
+
+    def _render_buffer(self, buffer):
+        self._load_all()
+        super()._render_buffer(buffer)
+
+    def __str__(self):
+        self._load_all()
+        return super().__str__()
+
+    def valuestr(self):
+        self._load_all()
+        return super().valuestr()
+
+    def pretty_tree(self, indent=0):
+        self._load_all()
+        return super().pretty_tree(indent)
+
+def parse(data: Union[bytes, bytearray]) -> LazyCompound:
+    """
+    Returns the root compound of uncompressed NBT data, without parsing its children
+
+    Parameters
+    ----------
+    data
+        Uncompressed NBT data, like :meth:`anvil.Region.chunk_bytes` returns
+
+    Raises
+    ------
+    nbt.MalformedFileError
+        If the data doesn't start with a compound tag or is truncated
+    """
+    if not data or data[0] != nbt.TAG_COMPOUND:
+        raise nbt.MalformedFileError('First record is not a Compound Tag')
+    data = bytes(data)
+    try:
+        length = _USHORT.unpack_from(data, 1)[0]
+        name = data[3 : 3 + length].decode('utf-8')
+        return _read_tag(data, nbt.TAG_COMPOUND, 3 + length, name)
+    except (IndexError, ValueError, StructError) as e:
+        raise nbt.MalformedFileError(f'Partial File Parse: {e}')
@@ -1,9 +1,77 @@
-from typing import Tuple, Union, BinaryIO
+from typing import Tuple, Union, BinaryIO, Optional, Generator, Iterable, Iterator, Dict, List, Callable, Type
+from concurrent.futures import Executor, ThreadPoolExecutor, ProcessPoolExecutor
+from collections import deque
 from nbt import nbt
+import copyreg
+import struct
+import mmap
 import zlib
+import numpy as np
 from io import BytesIO
 import anvil
-from .errors import GZipChunkData
+from .errors import CorruptChunk, UnknownChunkCompression
+from . import lazy_nbt
+
+# Chunk compression types, from the byte after the payload length
+COMPRESSION_GZIP = 1
+COMPRESSION_ZLIB = 2
+COMPRESSION_NONE = 3
+
+# Initial output buffer size for decompression, grown to the largest chunk seen.
+# Python's zlib can't inflate into a caller owned buffer, but giving it one that is
+# already big enough saves growing and joining the output blocks
+_DEFAULT_BUFSIZE = 64 * 1024
+
+def _decompress_gzip(payload: memoryview, bufsize: int) -> bytes:
+    # 16 + MAX_WBITS makes zlib expect a gzip header and trailer
+    return zlib.decompress(payload, 16 + zlib.MAX_WBITS, bufsize)
+
+def _decompress_zlib(payload: memoryview, bufsize: int) -> bytes:
+    return zlib.decompress(payload, zlib.MAX_WBITS, bufsize)
+
+def _decompress_none(payload: memoryview, bufsize: int) -> bytes:
+    return bytes(payload)
+
+# nbt's array tags keep the struct.Struct they were parsed with,
+# which can't be pickled when chunks are sent back from worker processes
+copyreg.pickle(struct.Struct, lambda s: (struct.Struct, (s.format,)))
+
+def _ordered_map(executor: Executor, func, items: Iterable[tuple], ahead: int,
+                 skip_errors: Tuple[Type[Exception], ...]=()) -> Iterator:
+    """
+    Same as ``executor.map(func, *zip(*items))`` but only keeps
+    ``ahead`` calls submitted at a time, results are yielded in order.
+    Calls raising one of ``skip_errors`` are left out
+    """
+    pending = deque()
+    for item in items:
+        pending.append(executor.submit(func, *item))
+        if len(pending) >= ahead:
+            yield from _result(pending.popleft(), skip_errors)
+    while pending:
+        yield from _result(pending.popleft(), skip_errors)
+
+def _result(future, skip_errors: Tuple[Type[Exception], ...]) -> Iterator:
+    """Yields the result of a future, or nothing if it raised one of ``skip_errors``"""
+    try:
+        result = future.result()
+    except skip_errors:
+        return
+    yield result
+
+def _parse_chunk(raw: bytes, lazy: bool=False) -> 'anvil.Chunk':
+    """Parses decompressed chunk NBT data"""
+    if lazy:
+        return anvil.Chunk(lazy_nbt.parse(raw))
+    return anvil.Chunk(nbt.NBTFile(buffer=BytesIO(raw)))
+
+def _load_chunk(payload: bytes, codec: Callable[[memoryview, int], bytes], lazy: bool=False) -> 'anvil.Chunk':
+    """
+    Decompresses and parses a chunk payload, used by worker processes.
+    The codec is sent along since the worker's registry may not hold it
+    (registered on a subclass, or at runtime before the worker was spawned)
+    """
+    return _parse_chunk(codec(payload, _DEFAULT_BUFSIZE), lazy)
 
 class Region:
     """
@@ -12,12 +80,86 @@ class Region:
     Attributes
     ----------
     data: :class:`bytes`
-        Region file (``.mca``) as bytes
+        Region file (``.mca``) as bytes, or a :class:`memoryview` over
+        the mapped file for regions made with :meth:`Region.open_mmap`
+    offsets: :class:`numpy.ndarray`
+        Chunk offsets in 4KiB sectors from the location header, indexed by ``x + z * 32``
+    sector_counts: :class:`numpy.ndarray`
+        Chunk lengths in 4KiB sectors from the location header, same indexing as ``offsets``
+    timestamps: :class:`numpy.ndarray`
+        Last modification times (epoch seconds) from the timestamp header, same indexing as ``offsets``
+    path: Optional[:class:`str`]
+        Path of the region file, ``None`` if the region wasn't read from a path
+    codecs: Dict[:class:`int`, Callable]
+        Decompression function for each chunk compression type, called as ``codec(payload, bufsize)``.
+        Supports gzip (1), zlib (2) and uncompressed (3) chunks, see :meth:`Region.register_codec`
     """
-    __slots__ = ('data',)
-    def __init__(self, data: bytes):
+    __slots__ = ('data', 'offsets', 'sector_counts', 'timestamps', 'path', '_mmap', '_bufsize')
+
+    codecs: Dict[int, Callable[[memoryview, int], bytes]] = {
+        COMPRESSION_GZIP: _decompress_gzip,
+        COMPRESSION_ZLIB: _decompress_zlib,
+        COMPRESSION_NONE: _decompress_none,
+    }
+
+    def __init__(self, data: Union[bytes, memoryview]):
         """Makes a Region object from data, which is the region file content"""
         self.data = data
+        self.path = None
+        self._mmap = None
+        self._bufsize = _DEFAULT_BUFSIZE
+        self._parse_header()
+
+    @classmethod
+    def register_codec(cls, compression: int, decompress: Callable[[memoryview, int], bytes]):
+        """
+        Registers how to decompress chunks of given compression type,
+        replacing the current codec if there is one
+
+        Parameters
+        ----------
+        compression
+            Compression type, the byte right after the chunk's length
+        decompress
+            Function taking the compressed payload and an output size hint,
+            and returning the uncompressed NBT data.
+            It is pickled to worker processes by :meth:`Region.iter_chunks`, so define it at module level
+        """
+        # Subclasses get their own registry instead of changing Region's
+        if 'codecs' not in cls.__dict__:
+            cls.codecs = dict(cls.codecs)
+        cls.codecs[compression] = decompress
+
+    def _parse_header(self):
+        """Decodes the location and timestamp tables once, as 1024 entry arrays"""
+        # Truncated or empty files (mapwriter leaves those around) have no chunks
+        if len(self.data) >= 4096:
+            locations = np.frombuffer(self.data, dtype='>u4', count=1024).astype(np.uint32)
+        else:
+            locations = np.zeros(1024, dtype=np.uint32)
+        if len(self.data) >= 8192:
+            self.timestamps = np.frombuffer(self.data, dtype='>u4', count=1024, offset=4096).astype(np.uint32)
+        else:
+            self.timestamps = np.zeros(1024, dtype=np.uint32)
+        self.offsets = locations >> 8
+        self.sector_counts = (locations & 0xFF).astype(np.uint8)
+
+    def __enter__(self) -> 'Region':
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """
+        Unmaps and closes the region file if it was opened with :meth:`Region.open_mmap`,
+        does nothing for regions made from bytes
+        """
+        if self._mmap is None:
+            return
+        self.data.release()
+        self._mmap.close()
+        self._mmap = None
 
     @staticmethod
     def header_offset(chunk_x: int, chunk_z: int) -> int:
@@ -47,14 +189,14 @@ class Region:
         chunk_z
             Chunk's Z value
         """
-        b_off = self.header_offset(chunk_x, chunk_z)
-        off = int.from_bytes(self.data[b_off : b_off + 3], byteorder='big')
-        sectors = self.data[b_off + 3]
-        return (off, sectors)
+        index = chunk_x % 32 + chunk_z % 32 * 32
+        return (int(self.offsets[index]), int(self.sector_counts[index]))
 
-    def chunk_data(self, chunk_x: int, chunk_z: int) -> nbt.NBTFile:
+    def chunk_timestamp(self, chunk_x: int, chunk_z: int) -> int:
         """
-        Returns the NBT data for a chunk
+        Returns the last time the chunk was saved, in seconds since epoch
+
+        Will return ``0`` if chunk hasn't been generated yet
 
         Parameters
         ----------
@@ -62,25 +204,117 @@ class Region:
             Chunk's X value
         chunk_z
             Chunk's Z value
+        """
+        return int(self.timestamps[chunk_x % 32 + chunk_z % 32 * 32])
 
-        Raises
-        ------
-        anvil.GZipChunkData
-            If the chunk's compression is gzip
+    def chunk_stamps(self) -> np.ndarray:
+        """
+        Returns a 32x32 array identifying the saved version of each chunk, indexed as ``stamps[z, x]``:
+        the timestamp, sector offset and sector count of the chunk packed as
+        ``timestamp << 32 | offset << 8 | count``.
+
+        Minecraft changes at least one of those whenever it saves a chunk,
+        so comparing stamps finds the chunks that changed between two reads of a region.
+        Chunks that haven't been generated yet have a stamp of ``0``.
+        """
+        stamps = self.timestamps.astype(np.uint64) << np.uint64(32)
+        stamps |= self.offsets.astype(np.uint64) << np.uint64(8)
+        stamps |= self.sector_counts
+        return stamps.reshape(32, 32)
+
+    def present_chunks(self) -> np.ndarray:
+        """
+        Returns a 32x32 boolean mask of the chunks that exist in the region file,
+        indexed as ``mask[z, x]``
+
+        A chunk is considered to exist if its location is not (0, 0).
+        """
+        return ((self.offsets != 0) | (self.sector_counts != 0)).reshape(32, 32)
+
+    def _payload_bounds(self, chunk_x: int, chunk_z: int) -> Optional[Tuple[int, int, int]]:
+        """
+        Returns the ``(start, end)`` byte range of the chunk's compressed payload
+        followed by its compression type, or ``None`` if the chunk doesn't exist,
+        raises :class:`anvil.errors.CorruptChunk` if it lies past the end of the file
         """
         off = self.chunk_location(chunk_x, chunk_z)
         # (0, 0) means it hasn't generated yet, aka it doesn't exist yet
         if off == (0, 0):
             return
         off = off[0] * 4096
+        # Truncated files, or headers written before their sectors were
+        if off + 5 > len(self.data):
+            raise CorruptChunk(f'Chunk ({chunk_x}, {chunk_z}) starts past the end of the region file')
+        # length counts the compression type byte too
         length = int.from_bytes(self.data[off:off + 4], byteorder='big')
         compression = self.data[off + 4] # 2 most of the time
-        if compression == 1:
-            raise GZipChunkData('GZip is not supported')
-        compressed_data = self.data[off + 5 : off + 5 + length - 1]
-        return nbt.NBTFile(buffer=BytesIO(zlib.decompress(compressed_data)))
+        if length < 1 or off + 4 + length > len(self.data):
+            raise CorruptChunk(f'Chunk ({chunk_x}, {chunk_z}) has length {length}, past the end of the region file')
+        return (off + 5, off + 5 + length - 1, compression)
+
+    def chunk_bytes(self, chunk_x: int, chunk_z: int) -> Optional[bytes]:
+        """
+        Returns the decompressed, still unparsed, NBT data for a chunk
+
+        Parameters
+        ----------
+        chunk_x
+            Chunk's X value
+        chunk_z
+            Chunk's Z value
+
+        Raises
+        ------
+        anvil.UnknownChunkCompression
+            If there is no codec for the chunk's compression type
+        anvil.errors.CorruptChunk
+            If the chunk's payload lies past the end of the file
+        """
+        bounds = self._payload_bounds(chunk_x, chunk_z)
+        if bounds is None:
+            return
+        start, end, compression = bounds
+        codec = self.codecs.get(compression)
+        if codec is None:
+            raise UnknownChunkCompression(f'Chunk ({chunk_x}, {chunk_z}) has unknown compression type {compression}')
+        # memoryview slices don't copy, release them right away
+        # so the mmap can be closed afterwards
+        with memoryview(self.data)[start:end] as compressed_data:
+            raw = codec(compressed_data, self._bufsize)
+        if len(raw) > self._bufsize:
+            self._bufsize = len(raw)
+        return raw
+
+    def chunk_data(self, chunk_x: int, chunk_z: int, lazy: bool=False) -> nbt.TAG_Compound:
+        """
+        Returns the NBT data for a chunk
+
+        Parameters
+        ----------
+        chunk_x
+            Chunk's X value
+        chunk_z
+            Chunk's Z value
+        lazy
+            Return a :class:`anvil.lazy_nbt.LazyCompound` that only records where the tags are,
+            and parses them when they are accessed. Tags that are never used,
+            like entities or light arrays, are skipped without being allocated.
+
+        Raises
+        ------
+        anvil.UnknownChunkCompression
+            If there is no codec for the chunk's compression type
+        anvil.errors.CorruptChunk
+            If the chunk's payload lies past the end of the file
+        """
+        raw = self.chunk_bytes(chunk_x, chunk_z)
+        if raw is None:
+            return
+        if lazy:
+            return lazy_nbt.parse(raw)
+        return nbt.NBTFile(buffer=BytesIO(raw))
 
-    def get_chunk(self, chunk_x: int, chunk_z: int) -> 'anvil.Chunk':
+    def get_chunk(self, chunk_x: int, chunk_z: int, lazy: bool=False) -> 'anvil.Chunk':
         """
         Returns the chunk at given coordinates,
         same as doing ``Chunk.from_region(region, chunk_x, chunk_z)``
@@ -91,11 +325,13 @@ class Region:
             Chunk's X value
         chunk_z
             Chunk's Z value
+        lazy
+            Only parse the NBT tags when they are accessed, see :meth:`Region.chunk_data`
 
 
         :rtype: :class:`anvil.Chunk`
         """
-        return anvil.Chunk.from_region(self, chunk_x, chunk_z)
+        return anvil.Chunk.from_region(self, chunk_x, chunk_z, lazy=lazy)
 
     def get_chunk_coordinates(self) -> list[Tuple[int, int]]:
         """
@@ -103,17 +339,130 @@ class Region:
 
         A chunk is considered to exist if its location is not (0, 0).
 
-        Returnszzzzzzz
+        Returns
         -------
         list[Tuple[int, int]]
             List of (x, z) coordinates for all existing chunks
         """
-        coordinates = []
-        for x in range(32):
-            for z in range(32):
-                if self.chunk_location(x, z) != (0, 0):
-                    coordinates.append((x, z))
-        return coordinates
+        xs, zs = np.nonzero(self.present_chunks().T)
+        return list(zip(xs.tolist(), zs.tolist()))
+
+    def iter_chunks(self, workers: int=None, processes: bool=False, lazy: bool=False,
+                    executor: Executor=None,
+                    skip_errors: Tuple[Type[Exception], ...]=()) -> Generator['anvil.Chunk', None, None]:
+        """
+        Returns a generator for all the chunks in the region,
+        in the same order as :meth:`Region.get_chunk_coordinates`
+
+        Parameters
+        ----------
+        workers
+            Number of threads decompressing chunks ahead of the parsing,
+            zlib releases the GIL so they run in parallel.
+            Chunks are read one by one on the calling thread if not given.
+        processes
+            Also parse the NBT in a pool of ``workers`` processes, since parsing holds the GIL.
+            Chunks are then pickled back to this process.
+        lazy
+            Only parse the NBT tags when they are accessed, see :meth:`Region.chunk_data`
+        executor
+            Run the work on this executor, left running afterwards, instead of starting a
+            pool of ``workers`` for this region only. Share one over the regions of a
+            dimension to start its threads or processes once.
+            A :class:`concurrent.futures.ProcessPoolExecutor` parses the NBT too, as with ``processes``.
+            ``workers`` must then be its number of workers, it sizes the chunks kept in flight
+        skip_errors
+            Leave out the chunks whose reading raises one of these exceptions, for example
+            ``(anvil.errors.CorruptChunk, zlib.error)``, instead of stopping the iteration
+
+        Yields
+        ------
+        :class:`anvil.Chunk`
+
+        Raises
+        ------
+        ValueError
+            If an ``executor`` is given without ``workers``
+        """
+        if executor is not None and not workers:
+            raise ValueError('workers must be given along with executor')
+        coordinates = self.get_chunk_coordinates()
+        if not workers:
+            for chunk_x, chunk_z in coordinates:
+                try:
+                    data = self.chunk_data(chunk_x, chunk_z, lazy=lazy)
+                except skip_errors:
+                    continue
+                yield anvil.Chunk(data)
+            return
+
+        # Keep a bounded amount of decompressed chunks in flight
+        ahead = workers * 4
+        if executor is None:
+            pool = ProcessPoolExecutor(workers) if processes else ThreadPoolExecutor(workers)
+        else:
+            pool = executor
+            processes = isinstance(executor, ProcessPoolExecutor)
+        try:
+            if processes:
+                yield from _ordered_map(pool, _load_chunk, self._payloads(coordinates, lazy, skip_errors),
+                                        ahead, skip_errors)
+            else:
+                for raw in _ordered_map(pool, self.chunk_bytes, coordinates, ahead, skip_errors):
+                    try:
+                        chunk = _parse_chunk(raw, lazy)
+                    except skip_errors:
+                        continue
+                    yield chunk
+        finally:
+            if executor is None:
+                pool.shutdown()
+
+    def _payloads(self, coordinates: Iterable[Tuple[int, int]], lazy: bool,
+                  skip_errors: Tuple[Type[Exception], ...]=()) -> Iterator[Tuple[bytes, Callable, bool]]:
+        """
+        Yields the arguments of :func:`_load_chunk` for each chunk, copying the payloads
+        out of the region's data only as they are submitted to worker processes
+        """
+        for chunk_x, chunk_z in coordinates:
+            try:
+                start, end, compression = self._payload_bounds(chunk_x, chunk_z)
+                codec = self.codecs.get(compression)
+                if codec is None:
+                    raise UnknownChunkCompression(f'Chunk ({chunk_x}, {chunk_z}) has unknown compression type {compression}')
+            except skip_errors:
+                continue
+            yield bytes(self.data[start:end]), codec, lazy
+
+    def index_tile_entities(self, ids: Iterable[str]=None, workers: int=None, executor: Executor=None,
+                            skip_errors: Tuple[Type[Exception], ...]=()) -> Dict[str, List[nbt.TAG_Compound]]:
+        """
+        Returns the tile entities of every chunk in the region grouped by their ``id``
+        (``Chest``, ``MobSpawner``, mod machines...)
+
+        Chunks are parsed lazily, so only their ``TileEntities`` tag is read
+
+        Parameters
+        ----------
+        ids
+            Only keep tile entities with these ids, all of them are kept if not given
+        workers
+            Passed on to :meth:`Region.iter_chunks`
+        executor
+            Passed on to :meth:`Region.iter_chunks`
+        skip_errors
+            Passed on to :meth:`Region.iter_chunks`
+        """
+        ids = None if ids is None else set(ids)
+        index = {}
+        for chunk in self.iter_chunks(workers=workers, lazy=True, executor=executor, skip_errors=skip_errors):
+            if 'TileEntities' not in chunk.data:
+                continue
+            for tile_entity in chunk.tile_entities:
+                tile_id = tile_entity['id'].value
+                if ids is None or tile_id in ids:
+                    index.setdefault(tile_id, []).append(tile_entity)
+        return index
 
     @classmethod
     def from_file(cls, file: Union[str, BinaryIO]):
@@ -127,6 +476,37 @@ class Region:
         """
         if isinstance(file, str):
             with open(file, 'rb') as f:
-                return cls(data=f.read())
+                region = cls(data=f.read())
+            region.path = file
+            return region
         else:
             return cls(data=file.read())
+
+    @classmethod
+    def open_mmap(cls, file: str) -> 'Region':
+        """
+        Creates a new region backed by a read-only memory map of the given file,
+        so the header and chunk payloads are read from the page cache without copies
+
+        The file stays mapped until :meth:`Region.close` is called or the region is garbage collected,
+        use the region as a context manager to unmap it right away::
+
+            with anvil.Region.open_mmap('r.0.0.mca') as region:
+                chunk = region.get_chunk(0, 0)
+
+        Parameters
+        ----------
+        file
+            Path to the region file
+        """
+        # The map keeps its own handle on the file, it doesn't need to stay open
+        with open(file, 'rb') as f:
+            try:
+                mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                # Empty files can't be mapped, mapwriter leaves those around
+                mapped = None
+        region = cls(data=b'' if mapped is None else memoryview(mapped))
+        region.path = file
+        region._mmap = mapped
+        return region
@@ -0,0 +1,97 @@
+from typing import Dict, Tuple
+from collections import OrderedDict
+import os
+import threading
+from .region import Region
+
+class RegionCache:
+    """
+    Pool of opened regions shared by the whole process, so reading the same
+    region file again doesn't go back to the disk.
+
+    Regions are opened with :meth:`Region.open_mmap` and keyed by path, file modification time and size,
+    so a region that changed on disk is reopened automatically.
+    Once the total size of the cached files goes over ``max_bytes``,
+    the least recently used regions are dropped.
+
+    Regions are never closed by the cache, as callers may still be using them,
+    they are unmapped once nothing references them anymore.
+
+    Attributes
+    ----------
+    max_bytes: :class:`int`
+        Byte budget of the cache
+    """
+    __slots__ = ('max_bytes', '_regions', '_size', '_lock')
+    def __init__(self, max_bytes: int=1024 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        # path -> ((mtime, size), region), least recently used first
+        self._regions: Dict[str, Tuple[Tuple[int, int], Region]] = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._regions)
+
+    @property
+    def size(self) -> int:
+        """Total size in bytes of the cached region files"""
+        return self._size
+
+    def get(self, path: str) -> Region:
+        """
+        Returns the region at given path, opening it if it isn't cached
+        or if the file changed since it was
+
+        Parameters
+        ----------
+        path
+            Path to the region file
+        """
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        key = (stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            entry = self._regions.get(path)
+            if entry is not None:
+                if entry[0] == key:
+                    self._regions.move_to_end(path)
+                    return entry[1]
+                self._discard(path)
+
+        region = Region.open_mmap(path)
+        with self._lock:
+            if path in self._regions:
+                self._discard(path)
+            self._regions[path] = (key, region)
+            self._size += stat.st_size
+            # Always keep the region that was just opened
+            while self._size > self.max_bytes and len(self._regions) > 1:
+                self._discard(next(iter(self._regions)))
+        return region
+
+    def invalidate(self, path: str=None):
+        """
+        Drops given region from the cache, or every region if no path is given
+
+        Parameters
+        ----------
+        path
+            Path to the region file
+        """
+        with self._lock:
+            if path is None:
+                self._regions.clear()
+                self._size = 0
+            else:
+                path = os.path.abspath(path)
+                if path in self._regions:
+                    self._discard(path)
+
+    def _discard(self, path: str):
+        """Removes a region from the cache, the lock must be held"""
+        (_, size), _ = self._regions.pop(path)
+        self._size -= size
+
+# Cache used by default across the process
+default_cache = RegionCache()
@@ -0,0 +1,217 @@
+"""
+On disk index of the world coordinates of chosen blocks (spawners, chests,
+diamond blocks...), built during a world analysis so finding them afterwards
+doesn't read any region file.
+"""
+# Standard library imports
+import os
+import tempfile
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# Third-party imports
+import numpy as np
+
+# Local imports
+from nationsglory.bots.xray import chunks
+from nationsglory.bots.xray.scan_manifest import RegionScan
+
+# Constants
+DEFAULT_INDEX_DIRECTORY = os.path.join('nationsglory', 'config', 'xray_index')
+
+# Names of the blocks indexed by default, spawners and beacons aren't in ids.json
+INDEXED_BLOCK_NAMES = {52: "Monster Spawner", 54: "Chest", 146: "Trapped Chest", 130: "Ender Chest", 138: "Beacon",
+                       57: "Block of Diamond", 133: "Block of Emerald", 41: "Block of Gold", 42: "Block of Iron"}
+# Every block data of these blocks, chests face any way
+DEFAULT_INDEXED_BLOCKS = tuple((block_id, None) for block_id in INDEXED_BLOCK_NAMES)
+
+
+def default_index_path(server: str, dimension: str) -> str:
+    """
+    Returns the path of the default block index file of a server's dimension.
+
+    :param server: The name of the server.
+    :type server: str
+    :param dimension: The name of the dimension.
+    :type dimension: str
+    :rtype: str
+    """
+    return os.path.join(DEFAULT_INDEX_DIRECTORY, f"{server.lower()}_{dimension.lower().replace(' ', '_')}.npz")
+
+
+def index_keys(blocks: Iterable[Tuple[int, Optional[int]]]) -> Tuple[int, ...]:
+    """
+    Returns the sorted ``id * 16 + data`` keys of ``(block_id, block_data)`` pairs,
+    a ``None`` block data standing for the 16 block data values.
+
+    :param blocks: The ``(block_id, block_data)`` pairs.
+    :type blocks: Iterable[Tuple[int, Optional[int]]]
+    :rtype: Tuple[int, ...]
+    """
+    keys = set()
+    for block_id, block_data in blocks:
+        if block_data is None:
+            keys.update(range(block_id * 16, block_id * 16 + 16))
+        else:
+            keys.add(block_id * 16 + block_data)
+    return tuple(sorted(keys))
+
+
+class BlockIndex:
+    """
+    Inverted index from ``(block_id, block_data)`` to the world coordinates of
+    every block of that type in a dimension, for a chosen set of blocks.
+
+    `analyze_world_chunks` fills it when given one. Coordinates are kept as
+    sorted ``(n, 3)`` ``int32`` arrays of ``(x, y, z)``, and saved to a compressed
+    ``.npz`` file.
+
+    :ivar path: The path to the index file.
+    :ivar keys: The ``id * 16 + data`` keys of the indexed blocks.
+    """
+    __slots__ = ("path", "keys", "_positions")
+
+    def __init__(self, path: str, blocks: Iterable[Tuple[int, Optional[int]]] = DEFAULT_INDEXED_BLOCKS):
+        """
+        Makes an empty index.
+
+        :param path: The path to the index file.
+        :type path: str
+        :param blocks: The ``(block_id, block_data)`` pairs to index, a ``None``
+            block data indexing every block data.
+        :type blocks: Iterable[Tuple[int, Optional[int]]], optional
+        """
+        self.path = path
+        self.keys = index_keys(blocks)
+        # id * 16 + data -> (n, 3) coordinates
+        self._positions: Dict[int, np.ndarray] = {}
+
+    @classmethod
+    def load(cls, path: str) -> "BlockIndex":
+        """
+        Loads an index file.
+
+        :param path: The path to the index file.
+        :type path: str
+        :rtype: BlockIndex
+        :raises OSError: If the file can't be read.
+        """
+        index = cls(path, ())
+        with np.load(path) as saved:
+            index.keys = tuple(saved["keys"].tolist())
+            for name in saved.files:
+                if name != "keys":
+                    index._positions[int(name)] = saved[name]
+        return index
+
+    @classmethod
+    def load_or_create(cls, path: str, blocks: Iterable[Tuple[int, Optional[int]]] = DEFAULT_INDEXED_BLOCKS) -> "BlockIndex":
+        """
+        Loads an index file, or makes an empty index if there is none or if it
+        doesn't index the same blocks.
+
+        :param path: The path to the index file.
+        :type path: str
+        :param blocks: The ``(block_id, block_data)`` pairs to index.
+        :type blocks: Iterable[Tuple[int, Optional[int]]], optional
+        :rtype: BlockIndex
+        """
+        index = cls(path, blocks)
+        try:
+            saved = cls.load(path)
+        except (OSError, ValueError, KeyError):
+            return index
+        return saved if saved.keys == index.keys else index
+
+    def save(self):
+        """Writes the index file, replacing the previous one atomically."""
+        directory = os.path.dirname(self.path) or "."
+        os.makedirs(directory, exist_ok=True)
+        fd, temp = tempfile.mkstemp(dir=directory, suffix=".npz")
+        try:
+            with os.fdopen(fd, "wb") as file:
+                np.savez_compressed(file, keys=np.array(self.keys, dtype=np.int32),
+                                    **{str(key): positions for key, positions in self._positions.items()})
+            os.replace(temp, self.path)
+        except BaseException:
+            os.remove(temp)
+            raise
+
+    def update(self, region_files: Iterable[str], region_scans: Iterable[RegionScan],
+               area: Optional[chunks.ChunkArea] = None):
+        """
+        Replaces the blocks of the given region files with the positions recorded
+        in their analysis. Blocks of other region files are kept, and when an
+        area is given, only the blocks of the area are replaced.
+
+        :param region_files: The analyzed region files.
+        :type region_files: Iterable[str]
+        :param region_scans: Their analysis, with positions recorded for this index's keys.
+        :type region_scans: Iterable[RegionScan]
+        :param area: The area that was analyzed.
+        :type area: chunks.ChunkArea, optional
+        """
+        regions = np.array([chunks.region_coordinates(file) for file in region_files], dtype=np.int64).reshape(-1, 2)
+        found: Dict[int, List[np.ndarray]] = {}
+        for region_scan in region_scans:
+            for chunk_positions in region_scan.block_positions.values():
+                for key, positions in chunk_positions.items():
+                    found.setdefault(key, []).append(positions)
+
+        for key in set(self._positions) | set(found):
+            kept = self._positions.get(key, np.zeros((0, 3), dtype=np.int32))
+            if len(kept):
+                chunk_xs, chunk_zs = kept[:, 0] >> 4, kept[:, 2] >> 4
+                replaced = ((chunk_xs >> 5)[:, None] == regions[:, 0]) & ((chunk_zs >> 5)[:, None] == regions[:, 1])
+                replaced = replaced.any(axis=1)
+                if area is not None:
+                    replaced &= area.contains_chunks(chunk_xs, chunk_zs)
+                kept = kept[~replaced]
+
+            added = np.concatenate(found.get(key, [np.zeros((0, 3), dtype=np.int32)]))
+            if area is not None:
+                # Region analyses may hold chunks outside of the area from previous analyses
+                added = added[area.contains_chunks(added[:, 0] >> 4, added[:, 2] >> 4)]
+
+            positions = np.concatenate([kept, added])
+            if len(positions):
+                # Sorted rows compress better, and keep the file stable between runs
+                self._positions[key] = positions[np.lexsort(positions.T[::-1])]
+            else:
+                self._positions.pop(key, None)
+
+    def find(self, block_id: int, block_data: Optional[int] = None,
+             area: Optional[chunks.ChunkArea] = None) -> np.ndarray:
+        """
+        Returns the world coordinates of the blocks of a type.
+
+        :param block_id: The block's ID.
+        :type block_id: int
+        :param block_data: The block's metadata, any metadata if ``None``.
+        :type block_data: int, optional
+        :param area: Only return the blocks of this area.
+        :type area: chunks.ChunkArea, optional
+        :return: A sorted ``(n, 3)`` array of ``(x, y, z)`` coordinates.
+        :rtype: np.ndarray
+        :raises KeyError: If the block isn't indexed.
+        """
+        keys = index_keys([(block_id, block_data)])
+        if not set(keys) <= set(self.keys):
+            raise KeyError(f"Block {block_id}:{'*' if block_data is None else block_data} isn't indexed")
+
+        parts = [self._positions[key] for key in keys if key in self._positions]
+        if not parts:
+            return np.zeros((0, 3), dtype=np.int32)
+        positions = np.concatenate(parts)
+        if block_data is None and len(parts) > 1:
+            positions = positions[np.lexsort(positions.T[::-1])]
+        if area is not None:
+            positions = positions[area.contains_chunks(positions[:, 0] >> 4, positions[:, 2] >> 4)]
+        return positions
+
+    def counts(self) -> Dict[Tuple[int, int], int]:
+        """
+        Returns the number of indexed blocks of each ``(block_id, block_data)``.
+
+        :rtype: Dict[Tuple[int, int], int]
+        """
+        return {(key >> 4, key & 0b1111): len(positions) for key, positions in sorted(self._positions.items())}
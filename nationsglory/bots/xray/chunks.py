@@ -3,10 +3,23 @@ Utilities for working with Minecraft chunk data and schematics.
 """
 # Standard library imports
 import glob
-from typing import List
+import hashlib
+import io
+import os
+import queue
+import threading
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple, Union
 
 # Third-party imports
 import anvil
+import numpy as np
+from anvil.chunk_cache import ChunkCache
+from anvil.errors import CorruptChunk, UnknownChunkCompression
+from anvil.region_cache import default_cache
+from nbt.nbt import MalformedFileError
+from nbtlib import ByteArray
 from nbtschematic import SchematicFile
 
 # Local imports
@@ -21,11 +34,130 @@ DIMENSION_PATHS = {
     "overworld": "region"  # Default dimension
 }
 
+# Decoded chunks saved by the xray tools, see anvil.ChunkCache
+DEFAULT_CHUNK_CACHE_DIRECTORY = os.path.join('nationsglory', 'config', 'xray_chunks')
+
+# Errors raised by chunks whose payload can't be decoded
+UNREADABLE_CHUNK_ERRORS = (UnknownChunkCompression, CorruptChunk, zlib.error, MalformedFileError)
+
+# (chunk_x, chunk_z, block ids, block data) of a decoded chunk
+Volume = Tuple[int, int, np.ndarray, np.ndarray]
+
 # Initialize path manager
 path_manager = PathGestion()
 
 
-def get_mca_files(server: str, dimension: str = "overworld") -> List[str]:
+class ChunkArea:
+    """
+    Selection of chunks, either a rectangle or a disk, used to only read the
+    region files and chunks of the part of a world being analysed.
+
+    Areas are checked against region file names and region headers, so chunks
+    outside of them are never decompressed.
+
+    :ivar min_x: The smallest selected chunk X coordinate.
+    :ivar min_z: The smallest selected chunk Z coordinate.
+    :ivar max_x: The largest selected chunk X coordinate, inclusive.
+    :ivar max_z: The largest selected chunk Z coordinate, inclusive.
+    :ivar center: The ``(x, z)`` block coordinates of the disk's center, or
+        ``None`` for a rectangle.
+    :ivar radius: The disk's radius in blocks, or ``None`` for a rectangle.
+    """
+    __slots__ = ("min_x", "min_z", "max_x", "max_z", "center", "radius")
+
+    def __init__(self, min_x: int, min_z: int, max_x: int, max_z: int):
+        """
+        Selects the chunks between two corners, in chunk coordinates.
+        Corners are included and can be given in any order.
+        """
+        self.min_x, self.max_x = sorted((min_x, max_x))
+        self.min_z, self.max_z = sorted((min_z, max_z))
+        self.center: Optional[Tuple[int, int]] = None
+        self.radius: Optional[int] = None
+
+    @classmethod
+    def from_blocks(cls, x1: int, z1: int, x2: int, z2: int) -> "ChunkArea":
+        """
+        Selects the chunks holding any block between two corners, in block
+        coordinates.
+        """
+        return cls(x1 >> 4, z1 >> 4, x2 >> 4, z2 >> 4)
+
+    @classmethod
+    def around(cls, x: int, z: int, radius: int) -> "ChunkArea":
+        """
+        Selects the chunks holding any block within `radius` blocks of the
+        ``(x, z)`` block coordinates.
+        """
+        area = cls.from_blocks(x - radius, z - radius, x + radius, z + radius)
+        area.center = (x, z)
+        area.radius = radius
+        return area
+
+    def __repr__(self) -> str:
+        if self.radius is not None:
+            return f"ChunkArea.around({self.center[0]}, {self.center[1]}, {self.radius})"
+        return f"ChunkArea({self.min_x}, {self.min_z}, {self.max_x}, {self.max_z})"
+
+    def contains(self, chunk_x: int, chunk_z: int) -> bool:
+        """
+        Checks whether a chunk is selected.
+
+        :param chunk_x: The chunk's X coordinate.
+        :param chunk_z: The chunk's Z coordinate.
+        :rtype: bool
+        """
+        return bool(self._mask(np.asarray(chunk_x), np.asarray(chunk_z)))
+
+    def contains_chunks(self, chunk_xs: np.ndarray, chunk_zs: np.ndarray) -> np.ndarray:
+        """
+        Checks whether each of several chunks is selected, at once.
+
+        :param chunk_xs: The chunks' X coordinates.
+        :param chunk_zs: The chunks' Z coordinates, same shape as `chunk_xs`.
+        :return: A boolean array of the same shape.
+        :rtype: np.ndarray
+        """
+        return self._mask(np.asarray(chunk_xs), np.asarray(chunk_zs))
+
+    def intersects_region(self, region_x: int, region_z: int) -> bool:
+        """
+        Checks whether any chunk of a region is selected, from the region's
+        bounding box only.
+
+        :param region_x: The region's X coordinate.
+        :param region_z: The region's Z coordinate.
+        :rtype: bool
+        """
+        return (region_x * 32 <= self.max_x and self.min_x < region_x * 32 + 32
+                and region_z * 32 <= self.max_z and self.min_z < region_z * 32 + 32)
+
+    def region_mask(self, region_x: int, region_z: int) -> np.ndarray:
+        """
+        Returns the selected chunks of a region as a 32x32 boolean mask indexed
+        ``mask[z, x]``, like `anvil.Region.present_chunks`.
+
+        :param region_x: The region's X coordinate.
+        :param region_z: The region's Z coordinate.
+        :rtype: np.ndarray
+        """
+        xs = np.arange(32) + region_x * 32
+        zs = np.arange(32) + region_z * 32
+        return self._mask(xs[None, :], zs[:, None])
+
+    def _mask(self, xs: np.ndarray, zs: np.ndarray) -> np.ndarray:
+        """Returns whether the chunks at given, broadcast together, coordinates are selected"""
+        mask = (self.min_x <= xs) & (xs <= self.max_x) & (self.min_z <= zs) & (zs <= self.max_z)
+        if self.radius is not None:
+            # Distance from the center to the nearest block of each chunk
+            dx = np.clip(self.center[0], xs * 16, xs * 16 + 15) - self.center[0]
+            dz = np.clip(self.center[1], zs * 16, zs * 16 + 15) - self.center[1]
+            mask &= dx ** 2 + dz ** 2 <= self.radius ** 2
+        return mask
+
+
+def get_mca_files(server: str, dimension: str = "overworld",
+                  area: Optional[ChunkArea] = None) -> List[str]:
     """
     Retrieve a list of .mca file paths corresponding to a specified server and
     dimension. Useful for accessing region files for a Minecraft server's world.
@@ -35,6 +167,9 @@ def get_mca_files(server: str, dimension: str = "overworld") -> List[str]:
     :param dimension: The dimension for which to retrieve .mca files. Options
        include "overworld", "nether", or "end". Defaults to "overworld".
     :type dimension: str, optional
+    :param area: Only keep the region files holding chunks of this area,
+       based on their ``r.X.Z.mca`` name. Files not named this way are dropped.
+    :type area: ChunkArea, optional
     :return: A list of file paths to .mca files for the specified server and
        dimension. If the dimension is not found, it defaults to the overworld.
     :rtype: List[str]
@@ -46,7 +181,63 @@ def get_mca_files(server: str, dimension: str = "overworld") -> List[str]:
     dim_path = DIMENSION_PATHS.get(dimension_name, DIMENSION_PATHS["overworld"])
 
     glob_pattern = f"{path_manager.ng_dir}/versions/stable/saves/mapwriter_mp_worlds/{server_name}*/{dim_path}/*.mca"
-    return glob.glob(glob_pattern)
+    files = glob.glob(glob_pattern)
+    if area is None:
+        return files
+    return [file for file in files if _region_in_area(file, area)]
+
+
+def _region_in_area(region_file_path: str, area: ChunkArea) -> bool:
+    """Checks from its file name whether a region file holds chunks of an area"""
+    try:
+        return area.intersects_region(*region_coordinates(region_file_path))
+    except ValueError:
+        return False
+
+
+def _region_chunk_coordinates(region: anvil.Region, region_file_path: str,
+                              area: Optional[ChunkArea]) -> List[Tuple[int, int]]:
+    """
+    Returns the region relative coordinates of the chunks of a region that
+    exist and are in the area, from the region header only.
+    """
+    if area is None:
+        return region.get_chunk_coordinates()
+    mask = region.present_chunks() & area.region_mask(*region_coordinates(region_file_path))
+    xs, zs = np.nonzero(mask.T)
+    return list(zip(xs.tolist(), zs.tolist()))
+
+
+def iter_chunks_from_region_file(region_file_path: str,
+                                 area: Optional[ChunkArea] = None) -> Iterator[anvil.Chunk]:
+    """
+    Yields the valid chunks of a Minecraft region file one at a time, so only
+    the chunk being processed is kept in memory.
+
+    A chunk is considered valid if it has defined `x` and `z` coordinates.
+    Chunks that can't be decoded (unknown compression, corrupted payload) are
+    skipped so one bad chunk doesn't stop the analysis of a whole server.
+
+    :param region_file_path: The file path to the `.mca` region file to be
+        processed.
+    :type region_file_path: str
+    :param area: Only read the chunks of this area, the others are skipped
+        from the region header without being decompressed.
+    :type area: ChunkArea, optional
+    :return: An iterator over the valid chunks of the region file.
+    :rtype: Iterator[anvil.Chunk]
+    :raises ValueError: If an area is given and the file name doesn't follow
+        the ``r.X.Z.mca`` format.
+    """
+    region = default_cache.get(region_file_path)
+    for x, z in _region_chunk_coordinates(region, region_file_path, area):
+        # Only Sections and the position get used, skip the rest of the NBT
+        try:
+            chunk = region.get_chunk(x, z, lazy=True)
+        except UNREADABLE_CHUNK_ERRORS:
+            continue
+        if chunk.x is not None and chunk.z is not None:
+            yield chunk
 
 
 def extract_chunks_from_region_file(region_file_path: str) -> List[anvil.Chunk]:
@@ -54,8 +245,7 @@ def extract_chunks_from_region_file(region_file_path: str) -> List[anvil.Chunk]:
     Extracts all valid chunks from a given Minecraft region file.
 
     This function processes a `.mca` region file, identifying and retrieving
-    all valid chunks within it. A chunk is considered valid if its location
-    is not `(0, 0)` and it has defined `x` and `z` coordinates.
+    all valid chunks within it (see `iter_chunks_from_region_file`).
 
     :param region_file_path: The file path to the `.mca` region file to be
         processed.
@@ -63,17 +253,226 @@ def extract_chunks_from_region_file(region_file_path: str) -> List[anvil.Chunk]:
     :return: A list of valid chunks extracted from the region file.
     :rtype: List[anvil.Chunk]
     """
-    region = anvil.Region.from_file(region_file_path)
-    chunks = []
+    return list(iter_chunks_from_region_file(region_file_path))
+
+
+def region_coordinates(region_file_path: str) -> Tuple[int, int]:
+    """
+    Returns the region coordinates encoded in a region file name, ``r.X.Z.mca``.
+
+    :param region_file_path: The path to the region file.
+    :type region_file_path: str
+    :return: The region's ``(x, z)`` coordinates.
+    :rtype: Tuple[int, int]
+    :raises ValueError: If the file name doesn't follow the ``r.X.Z.mca`` format.
+    """
+    parts = os.path.basename(region_file_path).split(".")
+    if len(parts) != 4 or parts[0] != "r" or parts[3] != "mca":
+        raise ValueError(f"Not a region file name: {region_file_path}")
+    return int(parts[1]), int(parts[2])
+
+
+def iter_volumes_from_region_file(region_file_path: str, cache: Optional[ChunkCache] = None,
+                                  area: Optional[ChunkArea] = None) -> Iterator[Volume]:
+    """
+    Decodes the chunks of a region file one at a time into dense block id and
+    block data arrays (see `anvil.Chunk.to_volume`), without building any
+    block object.
+
+    When a `anvil.ChunkCache` is given, chunks whose header timestamp and
+    location didn't change since they were cached are not decoded again.
+    Chunks that can't be decoded are skipped.
+
+    :param region_file_path: The file path to the `.mca` region file.
+    :type region_file_path: str
+    :param cache: The decoded chunk cache to use, chunks are always decoded
+        if not given.
+    :type cache: anvil.ChunkCache, optional
+    :param area: Only decode the chunks of this area, the others are skipped
+        from the region header.
+    :type area: ChunkArea, optional
+    :return: An iterator over ``(chunk_x, chunk_z, ids, data)`` tuples, with
+        world chunk coordinates and ``(256, 16, 16)`` arrays indexed ``[y, z, x]``.
+    :rtype: Iterator[Tuple[int, int, np.ndarray, np.ndarray]]
+    """
+    region_x, region_z = region_coordinates(region_file_path)
+    region = default_cache.get(region_file_path)
+
+    for x, z in _region_chunk_coordinates(region, region_file_path, area):
+        try:
+            if cache is None:
+                ids, data = region.get_chunk(x, z, lazy=True).to_volume()
+            else:
+                ids, data = cache.get_volume(region, x, z)
+        except UNREADABLE_CHUNK_ERRORS:
+            continue
+        yield region_x * 32 + x, region_z * 32 + z, ids, data
+
+
+def extract_volumes_from_region_file(region_file_path: str,
+                                     cache: Optional[ChunkCache] = None) -> List[Volume]:
+    """
+    Decodes every chunk of a region file into dense block id and block data
+    arrays, see `iter_volumes_from_region_file`.
+
+    :param region_file_path: The file path to the `.mca` region file.
+    :type region_file_path: str
+    :param cache: The decoded chunk cache to use, chunks are always decoded
+        if not given.
+    :type cache: anvil.ChunkCache, optional
+    :return: A list of ``(chunk_x, chunk_z, ids, data)`` tuples.
+    :rtype: List[Tuple[int, int, np.ndarray, np.ndarray]]
+    """
+    return list(iter_volumes_from_region_file(region_file_path, cache))
 
-    for x in range(32):
-        for z in range(32):
-            if region.chunk_location(x, z) != (0, 0):
-                chunk = region.get_chunk(x, z)
-                if chunk.x is not None and chunk.z is not None:
-                    chunks.append(chunk)
 
-    return chunks
+def iter_dimension(server: str, dimension: str = "overworld", volumes: bool = False,
+                   prefetch: int = 8, cache: Optional[ChunkCache] = None,
+                   area: Optional[ChunkArea] = None) -> Iterator[Union[anvil.Chunk, Volume]]:
+    """
+    Streams the chunks of every region file of a server's dimension (see
+    `get_mca_files`), so a whole dimension can be scanned in constant memory.
+
+    With a `prefetch` depth, a background thread reads and decodes up to that
+    many chunks ahead of the caller, zlib releasing the GIL while the caller
+    analyses the previous chunks. Stopping the iteration early stops the
+    thread as well.
+
+    :param server: The name of the server.
+    :type server: str
+    :param dimension: The dimension to scan. Defaults to "overworld".
+    :type dimension: str, optional
+    :param volumes: Yield ``(chunk_x, chunk_z, ids, data)`` arrays (see
+        `iter_volumes_from_region_file`) instead of `anvil.Chunk` objects.
+    :type volumes: bool, optional
+    :param prefetch: The maximum number of chunks decoded ahead, chunks are
+        read on the calling thread if ``0``. Defaults to 8.
+    :type prefetch: int, optional
+    :param cache: The decoded chunk cache used when yielding volumes.
+    :type cache: anvil.ChunkCache, optional
+    :param area: Only read the region files and chunks of this area.
+    :type area: ChunkArea, optional
+    :return: An iterator over the chunks, or volumes, of the dimension.
+    :rtype: Iterator[Union[anvil.Chunk, Tuple[int, int, np.ndarray, np.ndarray]]]
+    """
+    def read_all():
+        for region_file_path in get_mca_files(server, dimension, area):
+            if volumes:
+                yield from iter_volumes_from_region_file(region_file_path, cache, area)
+            else:
+                yield from iter_chunks_from_region_file(region_file_path, area)
+
+    if prefetch <= 0:
+        return read_all()
+    return _prefetch(read_all(), prefetch)
+
+
+def _prefetch(items: Iterator, depth: int) -> Iterator:
+    """
+    Runs an iterator on a background thread, keeping at most `depth` items
+    ready in a queue. Errors raised by the iterator are raised again on the
+    caller's side.
+    """
+    ready = queue.Queue(maxsize=depth)
+    stop = threading.Event()
+    done = object()
+
+    def put(item) -> bool:
+        # Wake up regularly to notice if the consumer is gone
+        while not stop.is_set():
+            try:
+                ready.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def produce():
+        try:
+            for item in items:
+                if not put((item, None)):
+                    return
+        except BaseException as e:
+            put((done, e))
+        else:
+            put((done, None))
+
+    thread = threading.Thread(target=produce, daemon=True)
+    thread.start()
+    try:
+        while True:
+            item, error = ready.get()
+            if item is done:
+                if error is not None:
+                    raise error
+                return
+            yield item
+    finally:
+        stop.set()
+        thread.join()
+
+
+def section_digest(section) -> Optional[bytes]:
+    """
+    Hashes the raw ``Blocks``, ``Add`` and ``Data`` bytes of a pre-flattening
+    chunk section, so identical sections can be recognized without decoding
+    their blocks.
+
+    :param section: The section NBT tag, as `anvil.Chunk.get_section` returns.
+    :type section: nbt.TAG_Compound
+    :return: A 16 byte digest, or ``None`` for a missing or empty section.
+    :rtype: Optional[bytes]
+    """
+    if section is None or "Blocks" not in section:
+        return None
+    digest = hashlib.blake2b(section["Blocks"].value, digest_size=16)
+    if "Add" in section:
+        digest.update(section["Add"].value)
+    digest.update(section["Data"].value)
+    return digest.digest()
+
+
+def index_tile_entities(server: str, dimension: str = "overworld",
+                        tile_entity_ids: Optional[Iterable[str]] = None,
+                        workers: Optional[int] = None) -> Dict[str, List[Tuple[int, int, int]]]:
+    """
+    Groups the world coordinates of every tile entity of a server's dimension
+    by tile entity id, so finding all the chests, safes or mod machines of a
+    dimension is a dictionary lookup instead of a scan of every chunk's NBT.
+
+    Only the ``TileEntities`` tag of each chunk is parsed, chunks that can't be
+    read (see `UNREADABLE_CHUNK_ERRORS`) are skipped.
+
+    :param server: The name of the server.
+    :type server: str
+    :param dimension: The dimension to index. Defaults to "overworld".
+    :type dimension: str, optional
+    :param tile_entity_ids: Only index these tile entity ids (e.g. ``{"Chest"}``),
+        every tile entity is indexed if not given.
+    :type tile_entity_ids: Iterable[str], optional
+    :param workers: The number of threads decompressing chunks ahead, started once for
+        the whole dimension (see `anvil.Region.iter_chunks`). Chunks are read one
+        by one if not given.
+    :type workers: int, optional
+    :return: A dictionary mapping tile entity ids to the list of their ``(x, y, z)``
+        world coordinates.
+    :rtype: Dict[str, List[Tuple[int, int, int]]]
+    """
+    index = {}
+    executor = ThreadPoolExecutor(workers) if workers else None
+    try:
+        for region_file_path in get_mca_files(server, dimension):
+            region_index = default_cache.get(region_file_path).index_tile_entities(
+                tile_entity_ids, workers=workers, executor=executor, skip_errors=UNREADABLE_CHUNK_ERRORS)
+            for tile_id, tile_entities in region_index.items():
+                index.setdefault(tile_id, []).extend(
+                    (tile_entity["x"].value, tile_entity["y"].value, tile_entity["z"].value)
+                    for tile_entity in tile_entities
+                )
+    finally:
+        if executor is not None:
+            executor.shutdown()
+    return index
 
 
 def extract_blocks_from_chunk(chunk: anvil.Chunk) -> List[anvil.block]:
@@ -93,29 +492,56 @@ def extract_blocks_from_chunk(chunk: anvil.Chunk) -> List[anvil.block]:
     return list(chunk.stream_chunk())
 
 
-def save_chunks_as_schematic(chunk_block_lists: List[List[anvil.block]]) -> SchematicFile:
+def save_chunks_as_schematic(chunk_list: List[anvil.Chunk]) -> SchematicFile:
     """
-    Saves a list of chunk blocks as a schematic file. Each chunk consists of a list
-    of blocks, and their data is processed to create a schematic representation.
-    The schematic is saved to the specified output path using the provided blocks'
-    coordinates, data, and metadata. The function assumes a 3D grid-like structure
-    and arranges blocks within the schematic accordingly.
+    Builds a schematic from a list of chunks. Each chunk is decoded as a whole
+    with `anvil.Chunk.to_volume` and copied at its position relative to the
+    most north-western chunk of the list, so neighbouring chunks stay joined.
 
-    :param chunk_block_lists: A list of chunks where each chunk is a list of
-        `anvil.block` objects representing the structure of blocks and containing
-        data such as their coordinates and metadata.
+    Block ids above 255 (mod blocks) keep their high bits in the ``AddBlocks``
+    nibble array, in the layout MCEdit and Schematica read: the first block of
+    each pair in the high nibble. WorldEdit reads the nibbles the other way round.
 
-    :return: None
+    :param chunk_list: The chunks to put in the schematic.
+    :type chunk_list: List[anvil.Chunk]
+    :return: The schematic, with a height of 256 blocks.
+    :rtype: SchematicFile
     """
+    min_x = min(chunk.x for chunk in chunk_list)
+    min_z = min(chunk.z for chunk in chunk_list)
+    width = max(chunk.x for chunk in chunk_list) - min_x + 1
+    length = max(chunk.z for chunk in chunk_list) - min_z + 1
 
-
-    
     # Shape: (y, z, x)
-    schematic = SchematicFile(shape=(256, 16 * len(chunk_block_lists), 16 * len(chunk_block_lists)))
+    shape = (256, 16 * length, 16 * width)
+    block_ids = np.zeros(shape, dtype=np.uint16)
+    blocks_data = np.zeros(shape, dtype=np.uint8)
 
-    for chunk_blocks in chunk_block_lists:
-        for block in chunk_blocks:
-            schematic.blocks[block.y, block.z, block.x] = block.y
-            schematic.data[block.y, block.z, block.x] = block.data
+    for chunk in chunk_list:
+        ids, data = chunk.to_volume()
+        x = (chunk.x - min_x) * 16
+        z = (chunk.z - min_z) * 16
+        block_ids[:, z:z + 16, x:x + 16] = ids
+        blocks_data[:, z:z + 16, x:x + 16] = data
 
-    return schematic
\ No newline at end of file
+    schematic = SchematicFile(shape=shape, blocks=(block_ids & 0xFF).astype(np.uint8), data=blocks_data)
+    if block_ids.max() > 0xFF:
+        # Two blocks per byte: the even block in the high nibble, the odd one in the low nibble
+        add = (block_ids.ravel() >> 8).astype(np.uint8)
+        if len(add) % 2:
+            add = np.append(add, 0)
+        schematic.root["AddBlocks"] = ByteArray((add[0::2] << 4 | add[1::2]).view(np.int8))
+    return schematic
+
+
+def schematic_to_bytes(schematic: SchematicFile) -> bytes:
+    """
+    Returns the gzipped NBT content of a schematic, as it's written to a ``.schematic`` file.
+
+    :param schematic: The schematic to serialize.
+    :type schematic: SchematicFile
+    :rtype: bytes
+    """
+    buffer = io.BytesIO()
+    schematic.save(buffer)
+    return buffer.getvalue()
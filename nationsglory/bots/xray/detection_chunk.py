@@ -1,9 +1,29 @@
 from nationsglory.bots.xray import chunks
+from nationsglory.bots.xray.block_index import BlockIndex
+from nationsglory.bots.xray.scan_manifest import RegionScan, ScanManifest
+from nationsglory.bots.xray.scan_store import ScanStore, parse_chunk_key
+from anvil.region_cache import default_cache
 import anvil
-from typing import Dict, List, Tuple
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from functools import lru_cache
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
 import json
 import os
+import threading
+import numpy as np
 
+# (block id, block data) searched for, None block data matching any block data
+BlockTarget = Tuple[int, Optional[int]]
+
+# Number of keys the histograms memoized by section_histogram hold together. A key and its count
+# take 16 bytes and a section has up to 4096 distinct keys (64 KB), so this is about 64 MB at most
+SECTION_HISTOGRAMS_KEYS = 4 * 1024 * 1024
+# Section digest -> (keys, counts), least recently used first
+_SECTION_HISTOGRAMS: Dict[bytes, Tuple[np.ndarray, np.ndarray]] = OrderedDict()
+_section_histograms_keys = 0
+# Streamlit runs sessions on several threads of the same process
+_section_histograms_lock = threading.Lock()
 
 
 def load_block_id():
@@ -34,13 +54,78 @@ def find_blocks_by_id(block_id: int, block_data:int, blocks: List[anvil.block])
             cpt += 1
     return cpt
 
+def find_blocks_in_volume(ids: np.ndarray, data: np.ndarray, targets: Iterable[BlockTarget],
+                          chunk_x: int = 0, chunk_z: int = 0) -> Dict[BlockTarget, List[Tuple[int, int, int]]]:
+    """
+    Finds the coordinates of the blocks matching any of several ``(block_id, block_data)``
+    targets in block id and block data arrays, such as `anvil.Chunk.to_volume` returns.
+
+    All targets are searched at once: a lookup table over ``id * 16 + data`` marks
+    the blocks matching any target in a single vectorized pass over the chunk,
+    then each target only sorts out the matching blocks.
+
+    :param ids: The block ids, a ``(256, 16, 16)`` array indexed ``[y, z, x]``.
+    :type ids: np.ndarray
+    :param data: The block data, same shape as `ids`.
+    :type data: np.ndarray
+    :param targets: The ``(block_id, block_data)`` pairs to search for, a
+        ``None`` block data matches any block data.
+    :type targets: Iterable[Tuple[int, Optional[int]]]
+    :param chunk_x: The chunk's X coordinate, to return world coordinates.
+    :type chunk_x: int, optional
+    :param chunk_z: The chunk's Z coordinate, to return world coordinates.
+    :type chunk_z: int, optional
+    :return: A dictionary mapping each target to the ``(x, y, z)`` coordinates of
+        the blocks matching it, the number of blocks found being the list's length.
+        A block can match several targets.
+    :rtype: Dict[Tuple[int, Optional[int]], List[Tuple[int, int, int]]]
+    """
+    targets = tuple(dict.fromkeys(targets))
+    target_table = _target_table(targets)
+
+    keys = (ids.astype(np.intp) << 4 | data).ravel()
+    found = np.flatnonzero(target_table.any(axis=0)[keys])
+    found_keys = keys[found]
+    # Flat indices are y * 256 + z * 16 + x
+    xs = (found & 0b1111) + chunk_x * 16
+    ys = found >> 8
+    zs = (found >> 4 & 0b1111) + chunk_z * 16
+
+    results = {}
+    for target, table in zip(targets, target_table):
+        matches = table[found_keys]
+        results[target] = list(zip(xs[matches].tolist(), ys[matches].tolist(), zs[matches].tolist()))
+    return results
+
+
+@lru_cache(maxsize=32)
+def _target_table(targets: Tuple[BlockTarget, ...]) -> np.ndarray:
+    """
+    Returns a ``(len(targets), 4096 * 16)`` boolean table of the
+    ``id * 16 + data`` keys each target matches, cached as the same targets
+    are usually searched in many chunks
+    """
+    table = np.zeros((len(targets), 4096 * 16), dtype=bool)
+    for i, (block_id, block_data) in enumerate(targets):
+        # Items of ids.json can't be in a chunk
+        if not 0 <= block_id < 4096 or block_data is not None and not 0 <= block_data < 16:
+            continue
+        if block_data is None:
+            table[i, block_id * 16:block_id * 16 + 16] = True
+        else:
+            table[i, block_id * 16 + block_data] = True
+    table.flags.writeable = False
+    return table
+
+
 def find_blocks_in_chunks(block_id: int, chunk_list: List[anvil.Chunk]) -> List[Dict[Tuple[int, int], int]]:
     """
     Finds the occurrences of a specific block ID within a list of chunks and returns
     a summary of the count of those blocks per chunk.
 
     This function scans through a list of chunks, analyzes their block matrices,
-    and determines the number of occurrences for the specified block ID.
+    and determines the number of occurrences for the specified block ID, whatever
+    the block data (see `find_blocks_in_volume`).
     The result provides a mapping of chunk coordinates to the count of the block's
     presence, making it useful for summarizing block distributions.
 
@@ -53,90 +138,425 @@ def find_blocks_in_chunks(block_id: int, chunk_list: List[anvil.Chunk]) -> List[
         coordinates (x, z) to the count of matching blocks within the corresponding chunk.
     :rtype: List[Dict[Tuple[int, int], int]]
     """
+    target = (block_id, None)
     results = []
     for chunk in chunk_list:
-        coordinates = find_blocks_by_id(block_id, chunks.extract_blocks_from_chunk(chunk))
-        results.append({(chunk.x, chunk.z): coordinates})
+        found = find_blocks_in_volume(*chunk.to_volume(), [target], chunk.x, chunk.z)
+        results.append({(chunk.x, chunk.z): len(found[target])})
     return results
 
 
+@lru_cache(maxsize=None)
+def block_name_table() -> Tuple[np.ndarray, Tuple[str, ...]]:
+    """
+    Compiles the ``(item_id, metadata) -> name`` mapping of ids.json once into a
+    dense lookup table, indexed by ``block_id * 16 + block_data``.
+
+    Blocks whose metadata isn't listed use the name of metadata 0, as
+    `count_blocks_in_chunk` always did. Entries of ids.json outside of the block
+    range (item ids above 4095, metadata above 15) can't appear in a chunk and
+    are left out.
+
+    :return: The ``(4096 * 16,)`` table of indices into the names tuple, ``-1``
+        for unknown blocks, and the names tuple.
+    :rtype: Tuple[np.ndarray, Tuple[str, ...]]
+    """
+    names = []
+    name_indices = {}
+    table = np.full((4096, 16), -1, dtype=np.int32)
+    for item in load_block_id():
+        block_id, block_data = item["item_id"], item["metadata"]
+        if block_id < 4096 and block_data < 16:
+            if item["name"] not in name_indices:
+                name_indices[item["name"]] = len(names)
+                names.append(item["name"])
+            table[block_id, block_data] = name_indices[item["name"]]
+
+    # Fall back to metadata 0 when the specific metadata isn't listed
+    table = np.where(table == -1, table[:, :1], table)
+    table.flags.writeable = False
+    return table.ravel(), tuple(names)
+
+
+def block_name(block_id: int, block_data: int) -> str:
+    """
+    Returns the name of a block from ids.json, see `block_name_table`.
+
+    :param block_id: The block's ID.
+    :type block_id: int
+    :param block_data: The block's metadata.
+    :type block_data: int
+    :return: The block's name, or ``"Unknown Block (ID: x, Data: y)"`` if it isn't known.
+    :rtype: str
+    """
+    table, names = block_name_table()
+    if 0 <= block_id < 4096 and 0 <= block_data < 16:
+        index = table[block_id * 16 + block_data]
+        if index >= 0:
+            return names[index]
+    return f"Unknown Block (ID: {block_id}, Data: {block_data})"
+
+
+def block_targets(block_id: int, block_data: int) -> List[BlockTarget]:
+    """
+    Returns the ``(block_id, block_data)`` targets matching every block named
+    like a block of ids.json, through the metadata 0 fallback of
+    `block_name_table`: a chest (54:0) also matches chests facing any way.
+
+    :param block_id: The block's ID.
+    :type block_id: int
+    :param block_data: The block's metadata, as listed in ids.json.
+    :type block_data: int
+    :return: The targets to search, ``[(block_id, None)]`` when every metadata has
+        the same name.
+    :rtype: List[Tuple[int, Optional[int]]]
+    """
+    if not 0 <= block_id < 4096 or not 0 <= block_data < 16:
+        return [(block_id, block_data)]
+    table, _ = block_name_table()
+    row = table[block_id * 16:block_id * 16 + 16]
+    same = np.flatnonzero(row == row[block_data])
+    if len(same) == 16:
+        return [(block_id, None)]
+    return [(block_id, int(data)) for data in same]
+
+
+def count_blocks_in_volume(ids: np.ndarray, data: np.ndarray) -> Dict[str, int]:
+    """
+    Counts the occurrences of each block type in block id and block data arrays,
+    such as `anvil.Chunk.to_volume` returns, and returns a dictionary mapping
+    block names to their counts. Air blocks are skipped.
+
+    Blocks are counted with a single `np.bincount` over ``id * 16 + data``,
+    names are only looked up for the block types that are present.
+
+    :param ids: The block ids.
+    :type ids: np.ndarray
+    :param data: The block data, same shape as `ids`.
+    :type data: np.ndarray
+    :return: A dictionary where keys are block names and values are their
+             corresponding counts.
+    :rtype: Dict[str, int]
+    """
+    return _name_bins(np.bincount((ids.astype(np.intp) << 4 | data).ravel()))
+
+
+def _name_bins(bins: np.ndarray) -> Dict[str, int]:
+    """Converts counts per ``id * 16 + data`` key to counts per block name, skipping air"""
+    # Skip air blocks, whatever their data
+    bins[:16] = 0
+
+    block_counts = {}
+    for key in np.flatnonzero(bins).tolist():
+        name = block_name(key >> 4, key & 0b1111)
+        block_counts[name] = block_counts.get(name, 0) + int(bins[key])
+    return block_counts
+
+
+def section_histogram(chunk: anvil.Chunk, section) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Counts the blocks of a pre-flattening chunk section, by ``id * 16 + data`` key.
+
+    Histograms are memoized by the hash of the section's raw bytes (see
+    `chunks.section_digest`): the all stone or all air sections found everywhere
+    in a dimension are only decoded and counted once per process. The memo holds
+    at most `SECTION_HISTOGRAMS_KEYS` keys, least recently used sections first out.
+
+    :param chunk: The chunk the section belongs to.
+    :type chunk: anvil.Chunk
+    :param section: The section NBT tag, as `anvil.Chunk.get_section` returns.
+    :type section: nbt.TAG_Compound
+    :return: The keys present in the section and their counts, both read only.
+    :rtype: Tuple[np.ndarray, np.ndarray]
+    """
+    global _section_histograms_keys
+    digest = chunks.section_digest(section)
+    with _section_histograms_lock:
+        histogram = _SECTION_HISTOGRAMS.get(digest)
+        if histogram is not None:
+            _SECTION_HISTOGRAMS.move_to_end(digest)
+            return histogram
+
+    ids, data = chunk.section_array(section)
+    bins = np.bincount((ids.astype(np.intp) << 4 | data).ravel())
+    keys = np.flatnonzero(bins)
+    histogram = (keys, bins[keys])
+    for array in histogram:
+        array.flags.writeable = False
+
+    with _section_histograms_lock:
+        # Another thread may have counted the same section meanwhile
+        old = _SECTION_HISTOGRAMS.pop(digest, None)
+        if old is not None:
+            _section_histograms_keys -= len(old[0])
+        _SECTION_HISTOGRAMS[digest] = histogram
+        _section_histograms_keys += len(keys)
+        while _section_histograms_keys > SECTION_HISTOGRAMS_KEYS and len(_SECTION_HISTOGRAMS) > 1:
+            _, (evicted, _) = _SECTION_HISTOGRAMS.popitem(last=False)
+            _section_histograms_keys -= len(evicted)
+    return histogram
+
+
+def count_blocks_in_sections(chunk: anvil.Chunk) -> Dict[str, int]:
+    """
+    Counts the occurrences of each block type in a pre-flattening chunk, like
+    `count_blocks_in_volume`, adding up the memoized histograms of its sections
+    (see `section_histogram`) instead of decoding every section.
+
+    :param chunk: The chunk to count the blocks of.
+    :type chunk: anvil.Chunk
+    :return: A dictionary where keys are block names and values are their
+             corresponding counts.
+    :rtype: Dict[str, int]
+    """
+    histograms = [section_histogram(chunk, section)
+                  for section in map(chunk.get_section, range(16)) if section is not None and "Blocks" in section]
+    if not histograms:
+        return {}
+    keys = np.concatenate([keys for keys, _ in histograms])
+    counts = np.concatenate([counts for _, counts in histograms])
+    return _name_bins(np.bincount(keys, weights=counts).astype(np.int64))
+
+
+def locate_blocks_in_sections(chunk: anvil.Chunk, index_keys: Tuple[int, ...]) -> Dict[int, np.ndarray]:
+    """
+    Finds the world coordinates of the blocks of a pre-flattening chunk matching
+    some ``id * 16 + data`` keys, to fill a `BlockIndex`.
+
+    Only the sections whose memoized histogram (see `section_histogram`) holds
+    one of the keys are decoded, which leaves out nearly all of them.
+
+    :param chunk: The chunk to search.
+    :type chunk: anvil.Chunk
+    :param index_keys: The sorted ``id * 16 + data`` keys to search for.
+    :type index_keys: Tuple[int, ...]
+    :return: The ``(n, 3)`` ``(x, y, z)`` coordinates of the blocks of each key found.
+    :rtype: Dict[int, np.ndarray]
+    """
+    wanted = np.array(index_keys, dtype=np.intp)
+    found: Dict[int, List[np.ndarray]] = {}
+    for y in range(16):
+        section = chunk.get_section(y)
+        if section is None or "Blocks" not in section:
+            continue
+        keys, _ = section_histogram(chunk, section)
+        if not np.isin(keys, wanted, assume_unique=True).any():
+            continue
+
+        ids, data = chunk.section_array(section)
+        section_keys = (ids.astype(np.intp) << 4 | data).ravel()
+        matches = np.flatnonzero(np.isin(section_keys, wanted))
+        # Flat indices are y * 256 + z * 16 + x
+        positions = np.stack([(matches & 0b1111) + chunk.x * 16,
+                              (matches >> 8) + y * 16,
+                              (matches >> 4 & 0b1111) + chunk.z * 16], axis=1).astype(np.int32)
+        for key in np.unique(section_keys[matches]).tolist():
+            found.setdefault(key, []).append(positions[section_keys[matches] == key])
+    return {key: np.concatenate(parts) for key, parts in found.items()}
+
+
 def count_blocks_in_chunk(chunk_blocks: List[anvil.block]) -> Dict[str, int]:
     """
     Counts the occurrences of each block type in a chunk and returns a dictionary
     mapping block names to their counts. Non-air blocks are considered, and block
-    names are retrieved from ids.json. If a block name is not available
-    in the mapping, the string representation of its ID is used.
+    names are retrieved from ids.json (see `block_name`).
+
+    Prefer `count_blocks_in_volume` when the chunk's arrays are available.
 
     :param chunk_blocks: A list of block objects from the chunk.
     :return: A dictionary where keys are block names and values are their
              corresponding counts.
     :rtype: Dict[str, int]
     """
-    block_counts = {}
-    block_data = load_block_id()
+    ids = np.fromiter((block.id for block in chunk_blocks), dtype=np.uint16)
+    data = np.fromiter((block.data for block in chunk_blocks), dtype=np.uint8)
+    return count_blocks_in_volume(ids, data)
 
-    # Create a dictionary to map (item_id, metadata) to block name
-    block_mapping = {}
-    for item in block_data:
-        key = (item["item_id"], item["metadata"])
-        block_mapping[key] = item["name"]
 
-    for block in chunk_blocks:
-        # Skip air blocks
-        if block.id == 0:
-            continue
+def analyze_region_file(region_file_path: str, area: chunks.ChunkArea = None) -> Dict[str, Dict[str, int]]:
+    """
+    Counts the blocks of every chunk of a region file, see `analyze_world_chunks`.
+    Chunks are read one at a time and counted section by section (see
+    `count_blocks_in_sections`), so only one of them is in memory at once.
 
-        # Get block name from the mapping or use string ID as fallback
-        block_key = (block.id, block.data)
-        block_name = block_mapping.get(block_key)
+    :param region_file_path: The file path to the `.mca` region file.
+    :type region_file_path: str
+    :param area: Only analyze the chunks of this area.
+    :type area: chunks.ChunkArea, optional
+    :return: A dictionary mapping ``"x:<block x>, z:<block z>"`` chunk keys to their block counts.
+    :rtype: Dict[str, Dict[str, int]]
+    """
+    return rescan_region_file(region_file_path, area=area).blocks_by_location
 
-        # Try with metadata 0 as fallback if specific metadata not found
-        if block_name is None:
-            block_key = (block.id, 0)
-            block_name = block_mapping.get(block_key)
 
-        # Use block ID as string if no mapping found
-        if block_name is None:
-            block_name = f"Unknown Block (ID: {block.id}, Data: {block.data})"
+def rescan_region_file(region_file_path: str, previous: Optional[RegionScan] = None,
+                       area: chunks.ChunkArea = None, index_keys: Tuple[int, ...] = ()) -> RegionScan:
+    """
+    Counts the blocks of the chunks of a region file that changed since a
+    previous analysis, and merges them with the previous counts of the others.
 
-        # Increment counter for this block type
-        if block_name in block_counts:
-            block_counts[block_name] += 1
-        else:
-            block_counts[block_name] = 1
+    The region file isn't even opened if its modification time and size didn't
+    change. Otherwise chunks are compared with their stamp in the region header
+    (see `anvil.Region.chunk_stamps`), and only new or saved again chunks are
+    decoded. Chunks that were removed from the region file are dropped.
 
-    return block_counts
+    With `index_keys`, the positions of the blocks of these keys are recorded
+    too (see `locate_blocks_in_sections`). A previous analysis that didn't
+    record the same keys is ignored.
 
+    :param region_file_path: The file path to the `.mca` region file.
+    :type region_file_path: str
+    :param previous: The previous analysis of the region file, every chunk is
+        analyzed if not given.
+    :type previous: RegionScan, optional
+    :param area: Only analyze the chunks of this area, the previous counts of
+        the other chunks are kept as they are.
+    :type area: chunks.ChunkArea, optional
+    :param index_keys: The sorted ``id * 16 + data`` keys of the blocks to record the positions of.
+    :type index_keys: Tuple[int, ...], optional
+    :return: The updated analysis of the region file.
+    :rtype: RegionScan
+    """
+    stat = os.stat(region_file_path)
+    if previous is not None and previous.index_keys != index_keys:
+        previous = None
+    if previous is not None and previous.matches(stat):
+        return previous
+
+    region = default_cache.get(region_file_path)
+    region_x, region_z = chunks.region_coordinates(region_file_path)
+    current = region.chunk_stamps()
+    present = region.present_chunks()
+
+    if previous is None:
+        stamps = np.zeros((32, 32), dtype=np.uint64)
+        blocks_by_location = {}
+        block_positions = {}
+    else:
+        stamps = previous.stamps.copy()
+        blocks_by_location = dict(previous.blocks_by_location)
+        block_positions = dict(previous.block_positions)
+
+    wanted = present if area is None else present & area.region_mask(region_x, region_z)
+    stale = wanted & (current != stamps)
+    removed = ~present & (stamps != 0)
+
+    for x, z in zip(*np.nonzero((stale | removed).T)):
+        chunk_x, chunk_z = region_x * 32 + int(x), region_z * 32 + int(z)
+        chunk_key = f"x:{chunk_x*16}, z:{chunk_z*16}"
+        blocks_by_location.pop(chunk_key, None)
+        block_positions.pop(chunk_key, None)
+        stamps[z, x] = 0
+        if removed[z, x]:
+            continue
 
-def analyze_world_chunks(server: str, dimension: str = "overworld"):
+        try:
+            chunk = region.get_chunk(int(x), int(z), lazy=True)
+            block_counts = count_blocks_in_sections(chunk)
+            positions = locate_blocks_in_sections(chunk, index_keys) if index_keys else {}
+        except chunks.UNREADABLE_CHUNK_ERRORS:
+            # Leave its stamp at 0, so it's tried again next time
+            continue
+        if block_counts:
+            blocks_by_location[chunk_key] = block_counts
+        if positions:
+            block_positions[chunk_key] = positions
+        stamps[z, x] = current[z, x]
+
+    complete = bool((stamps == current).all())
+    return RegionScan(stat.st_mtime_ns, stat.st_size, stamps, blocks_by_location, complete,
+                      index_keys, block_positions)
+
+
+def analyze_world_chunks(server: str, dimension: str = "overworld", area: chunks.ChunkArea = None,
+                         workers: Optional[int] = None,
+                         progress: Optional[Callable[[int, int], None]] = None,
+                         store: Optional[ScanStore] = None,
+                         manifest: Optional[ScanManifest] = None,
+                         index: Optional[BlockIndex] = None) -> Dict[str, Dict[str, int]]:
     """
     Analyzes Minecraft world chunks for specific blocks and their counts. It processes MCA files
     to retrieve chunks, evaluates block matrices within those chunks, and calculates the count of
     specific blocks like chests, obsidian, and RF blocks. Results are categorized by location and
     summarized with total counts for each block type.
 
+    An area restricts the analysis to a part of the world, for example
+    ``ChunkArea(116, -186, 128, -175)`` for the Earth region or
+    ``ChunkArea(-27, -24, -25, -22)`` for the Moon region. Region files and chunks
+    outside of it are skipped from their name and header, without being decompressed.
+
+    With `workers`, region files are analyzed in parallel by a pool of processes
+    (see `analyze_region_file`) and their results merged at the end, in the same
+    order as a serial analysis.
+
+    With a `manifest`, only the region files and chunks that changed since the
+    last analysis are analyzed again (see `rescan_region_file`), the manifest
+    is then updated and saved.
+
+    With an `index`, the positions of the blocks it indexes are recorded along
+    the way, the index is then updated and saved.
+
+    :param server: The name of the server.
+    :type server: str
+    :param dimension: The dimension to analyze. Defaults to "overworld".
+    :type dimension: str, optional
+    :param area: Only analyze the chunks of this area, the whole dimension if not given.
+    :type area: chunks.ChunkArea, optional
+    :param workers: The number of processes analyzing region files, region files are
+        analyzed one by one in the calling process if not given.
+    :type workers: int, optional
+    :param progress: Called with the number of region files analyzed so far and
+        the total number of region files, each time one of them is done.
+    :type progress: Callable[[int, int], None], optional
+    :param store: Also save the results as a new scan of this database.
+    :type store: ScanStore, optional
+    :param manifest: The results of the previous analyses, to only analyze what changed since.
+    :type manifest: ScanManifest, optional
+    :param index: The block index to update with the positions of its blocks.
+    :type index: BlockIndex, optional
     :raises Exception: If there is an issue with loading MCA files or processing the chunks.
 
-    :return: None
+    :return: A dictionary mapping ``"x:<block x>, z:<block z>"`` chunk keys to their block counts.
+    :rtype: Dict[str, Dict[str, int]]
     """
-    files = chunks.get_mca_files(server, dimension)
-    blocks_by_location = {}
+    files = chunks.get_mca_files(server, dimension, area)
+    previous = [None if manifest is None else manifest.get(file) for file in files]
+    results: List[Optional[RegionScan]] = [None] * len(files)
+    index_keys = () if index is None else index.keys
 
-    # Process all files and chunks
-    for file in files:
-        chunk_list = chunks.extract_chunks_from_region_file(file)
+    if not workers:
+        for i, file in enumerate(files):
+            results[i] = rescan_region_file(file, previous[i], area, index_keys)
+            if progress is not None:
+                progress(i + 1, len(files))
+    else:
+        with ProcessPoolExecutor(workers) as pool:
+            futures = {pool.submit(rescan_region_file, file, previous[i], area, index_keys): i for i, file in enumerate(files)}
+            for done, future in enumerate(as_completed(futures), 1):
+                results[futures[future]] = future.result()
+                if progress is not None:
+                    progress(done, len(files))
 
-        for chunk in chunk_list:
-            # Optional filtering by chunk coordinates:
-            # Earth region: 116 <= chunk.x <= 128 and -175 >= chunk.z >= -186
-            # Moon region: -27 <= chunk.x <= -25 and -24 <= chunk.z <= -22
+    if manifest is not None:
+        for file, region_scan in zip(files, results):
+            manifest.update(file, region_scan)
+        manifest.prune()
+        manifest.save()
 
-            block_list = chunks.extract_blocks_from_chunk(chunk)
-            block_counts = count_blocks_in_chunk(block_list)
-
-            if block_counts:
-                chunk_key = f"x:{chunk.x*16}, z:{chunk.z*16}"
-                blocks_by_location[chunk_key] = block_counts
+    if index is not None:
+        index.update(files, results, area)
+        index.save()
 
+    blocks_by_location = {}
+    for region_scan in results:
+        if area is None:
+            blocks_by_location.update(region_scan.blocks_by_location)
+        else:
+            # The manifest may hold chunks outside of the area from previous analyses
+            blocks_by_location.update(
+                (chunk_key, block_counts) for chunk_key, block_counts in region_scan.blocks_by_location.items()
+                if area.contains(*parse_chunk_key(chunk_key)))
 
+    if store is not None:
+        store.save_scan(server, dimension, blocks_by_location)
     return blocks_by_location
@@ -5,8 +5,60 @@ Minecraft Chunk Analyzer - Command Line Interface
 import os
 import argparse
 from nationsglory.bots.xray import chunks
-from nationsglory.bots.xray.detection_chunk import count_blocks_in_chunk, find_blocks_by_id, BLOCK_ID_NAMES, analyze_world_chunks
-import anvil
+from nationsglory.bots.xray.detection_chunk import count_blocks_in_volume, find_blocks_in_volume, block_name as get_block_name, analyze_world_chunks
+from nationsglory.bots.xray.block_index import BlockIndex
+from nationsglory.bots.xray.overview_map import (OVERLAYS, default_tile_directory, load_region_tile, render_dimension,
+                                                 save_png, shade_tile)
+from nationsglory.bots.xray.profiles import DEFAULT_DEPTH, find_suspicious_chunks
+from nationsglory.bots.xray.scan_manifest import ScanManifest
+from nationsglory.bots.xray.snapshot_diff import diff_snapshots, get_snapshot_files, take_snapshot
+from nationsglory.bots.xray.scan_store import DEFAULT_DATABASE_PATH, ScanStore
+from anvil.chunk_cache import ChunkCache
+from anvil.region_cache import default_cache
+
+def parse_block_target(value):
+    """Parses a block target given as ID or ID:DATA, any data if not given"""
+    block_id, _, block_data = value.partition(":")
+    try:
+        return int(block_id), int(block_data) if block_data else None
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Expected ID or ID:DATA, got {value}")
+
+
+def add_area_arguments(parser):
+    """Adds the options restricting a command to a part of the world"""
+    area_group = parser.add_mutually_exclusive_group()
+    area_group.add_argument("--chunks", type=int, nargs=4, metavar=("X1", "Z1", "X2", "Z2"),
+                            help="Only analyze the chunks between two corners, in chunk coordinates")
+    area_group.add_argument("--blocks", type=int, nargs=4, metavar=("X1", "Z1", "X2", "Z2"),
+                            help="Only analyze the chunks between two corners, in block coordinates")
+    area_group.add_argument("--around", type=int, nargs=3, metavar=("X", "Z", "RADIUS"),
+                            help="Only analyze the chunks within a radius around a block position")
+
+
+def area_from_arguments(args):
+    """Returns the area given by the options of add_area_arguments, None for the whole world"""
+    if args.chunks:
+        return chunks.ChunkArea(*args.chunks)
+    if args.blocks:
+        return chunks.ChunkArea.from_blocks(*args.blocks)
+    if args.around:
+        return chunks.ChunkArea.around(*args.around)
+    return None
+
+
+def add_chunk_cache_argument(parser):
+    """Adds the option keeping decoded chunks on disk between runs"""
+    parser.add_argument("--chunk-cache", nargs="?", const=chunks.DEFAULT_CHUNK_CACHE_DIRECTORY, default=None,
+                        metavar="DIRECTORY",
+                        help="Keep decoded chunks in this directory, so the next runs only decode the chunks "
+                             f"saved since (default directory: {chunks.DEFAULT_CHUNK_CACHE_DIRECTORY})")
+
+
+def chunk_cache_from_arguments(args):
+    """Returns the cache given by the option of add_chunk_cache_argument, None if not given"""
+    return ChunkCache(directory=args.chunk_cache) if args.chunk_cache else None
+
 
 def main():
     parser = argparse.ArgumentParser(description="Analyze Minecraft chunks and regions")
@@ -33,10 +85,14 @@ def main():
 
     # Find blocks command
     find_blocks_parser = subparsers.add_parser("find-blocks", help="Find specific blocks")
-    find_blocks_parser.add_argument("--file", required=True, help="Path to MCA file")
-    find_blocks_parser.add_argument("--chunk-x", type=int, required=True, help="Chunk X coordinate")
-    find_blocks_parser.add_argument("--chunk-z", type=int, required=True, help="Chunk Z coordinate")
-    find_blocks_parser.add_argument("--block-id", type=int, required=True, help="Block ID to find")
+    find_blocks_parser.add_argument("--file", help="Path to MCA file")
+    find_blocks_parser.add_argument("--chunk-x", type=int, help="Chunk X coordinate")
+    find_blocks_parser.add_argument("--chunk-z", type=int, help="Chunk Z coordinate")
+    find_blocks_parser.add_argument("--block-id", type=parse_block_target, action="append", required=True,
+                                    help="Block to find, as ID or ID:DATA (any data if not given). Can be repeated")
+    find_blocks_parser.add_argument("--index", default=None,
+                                    help="Search this block index, built by the world command, instead of a chunk")
+    add_area_arguments(find_blocks_parser)
 
     # Generate schematic command
     schematic_parser = subparsers.add_parser("schematic", help="Generate schematic from chunk")
@@ -47,6 +103,82 @@ def main():
 
     # Full world analysis command
     world_parser = subparsers.add_parser("world", help="Run full world analysis")
+    world_parser.add_argument("--server", required=True, help="Server name")
+    world_parser.add_argument("--dimension", default="overworld",
+                              choices=["overworld", "lune", "mars", "edora", "edora asteroide"],
+                              help="Dimension name")
+    add_area_arguments(world_parser)
+    world_parser.add_argument("--workers", type=int, default=None,
+                              help="Number of processes analyzing region files in parallel")
+    world_parser.add_argument("--database", default=None,
+                              help="Save the results to this SQLite database")
+    world_parser.add_argument("--manifest", default=None,
+                              help="Only analyze what changed since the last analysis recorded in this manifest file")
+    world_parser.add_argument("--index", default=None,
+                              help="Also update the block index of this file, see find-blocks")
+
+    # Suspicious chunks command
+    suspicious_parser = subparsers.add_parser("suspicious", help="Rank chunks that stand out from their dimension underground")
+    suspicious_parser.add_argument("--server", required=True, help="Server name")
+    suspicious_parser.add_argument("--dimension", default="overworld",
+                                   choices=["overworld", "lune", "mars", "edora", "edora asteroide"],
+                                   help="Dimension name")
+    add_area_arguments(suspicious_parser)
+    suspicious_parser.add_argument("--depth", type=int, default=DEFAULT_DEPTH,
+                                   help="Y level under which chunks are scored")
+    suspicious_parser.add_argument("--limit", type=int, default=50, help="Number of chunks to list")
+    suspicious_parser.add_argument("--workers", type=int, default=None,
+                                   help="Number of processes reading region files in parallel")
+    add_chunk_cache_argument(suspicious_parser)
+
+    # Snapshot commands
+    snapshot_parser = subparsers.add_parser("snapshot", help="Copy the region files of a dimension to compare them later")
+    snapshot_parser.add_argument("--server", required=True, help="Server name")
+    snapshot_parser.add_argument("--dimension", default="overworld",
+                                 choices=["overworld", "lune", "mars", "edora", "edora asteroide"],
+                                 help="Dimension name")
+    snapshot_parser.add_argument("--output", required=True, help="Snapshot directory")
+
+    diff_parser = subparsers.add_parser("diff", help="List the chunks that changed between two snapshots")
+    diff_parser.add_argument("--old", required=True, help="Old snapshot directory")
+    diff_parser.add_argument("--new", help="New snapshot directory, the current world of --server if not given")
+    diff_parser.add_argument("--server", help="Server name, when comparing with the current world")
+    diff_parser.add_argument("--dimension", default="overworld",
+                             choices=["overworld", "lune", "mars", "edora", "edora asteroide"],
+                             help="Dimension name, when comparing with the current world")
+    add_area_arguments(diff_parser)
+    diff_parser.add_argument("--limit", type=int, default=50, help="Number of chunks to list")
+    diff_parser.add_argument("--workers", type=int, default=None,
+                             help="Number of processes comparing region files in parallel")
+    add_chunk_cache_argument(diff_parser)
+
+    # Overview map command
+    map_parser = subparsers.add_parser("map", help="Draw a top-down map of a dimension")
+    map_parser.add_argument("--server", required=True, help="Server name")
+    map_parser.add_argument("--dimension", default="overworld",
+                            choices=["overworld", "lune", "mars", "edora", "edora asteroide"],
+                            help="Dimension name")
+    add_area_arguments(map_parser)
+    map_parser.add_argument("--output", required=True, help="Output path for the PNG map")
+    map_parser.add_argument("--overlay", choices=OVERLAYS, default=None,
+                            help="Tint the chunks by their number of ore blocks, or by how suspicious they are")
+    map_parser.add_argument("--scale", type=int, default=4, choices=[1, 2, 4, 8, 16],
+                            help="Number of blocks per pixel side")
+    map_parser.add_argument("--tiles", default=None,
+                            help="Also save a PNG map of each region file, at one block per pixel, to this directory")
+    map_parser.add_argument("--workers", type=int, default=None,
+                            help="Number of processes reading region files in parallel")
+    add_chunk_cache_argument(map_parser)
+
+    # Query stored scans command
+    top_parser = subparsers.add_parser("top", help="List the chunks with the most blocks of a type from a stored scan")
+    top_parser.add_argument("--server", required=True, help="Server name")
+    top_parser.add_argument("--dimension", default="overworld",
+                            choices=["overworld", "lune", "mars", "edora", "edora asteroide"],
+                            help="Dimension name")
+    top_parser.add_argument("--block", required=True, help="Block name, as in ids.json")
+    top_parser.add_argument("--limit", type=int, default=50, help="Number of chunks to list")
+    top_parser.add_argument("--database", default=DEFAULT_DATABASE_PATH, help="Path to the SQLite database")
 
     # Parse the arguments
     args = parser.parse_args()
@@ -67,42 +199,136 @@ def main():
             print(f"{i+1}. Chunk at (x:{chunk.x}, z:{chunk.z})")
 
     elif args.command == "analyze":
-        region = anvil.Region.from_file(args.file)
-        chunk = region.get_chunk(args.chunk_x, args.chunk_z)
-        block_list = chunks.extract_blocks_from_chunk(chunk)
-        block_counts = count_blocks_in_chunk(block_list)
+        region = default_cache.get(args.file)
+        chunk = region.get_chunk(args.chunk_x, args.chunk_z, lazy=True)
+        block_counts = count_blocks_in_volume(*chunk.to_volume())
 
         print(f"Block counts for chunk (x:{args.chunk_x}, z:{args.chunk_z}):")
         for block_name, count in sorted(block_counts.items(), key=lambda x: x[1], reverse=True):
             print(f"{block_name}: {count}")
 
-    elif args.command == "find-blocks":
-        region = anvil.Region.from_file(args.file)
-        chunk = region.get_chunk(args.chunk_x, args.chunk_z)
-        block_list = chunks.extract_blocks_from_chunk(chunk)
+    elif args.command == "find-blocks" and args.index:
+        index = BlockIndex.load(args.index)
+        area = area_from_arguments(args)
+        for block_id, block_data in args.block_id:
+            try:
+                coordinates = index.find(block_id, block_data, area)
+            except KeyError as error:
+                parser.error(error.args[0])
+            name = get_block_name(block_id, block_data or 0)
+            print(f"Found {len(coordinates)} of {name} in {'the index' if area is None else area}")
+            for x, y, z in coordinates.tolist():
+                print(f"  x:{x}, y:{y}, z:{z}")
 
-        block_name = BLOCK_ID_NAMES.get(args.block_id, f"Unknown (ID: {args.block_id})")
-        cpt_blocks = find_blocks_by_id(args.block_id, block_list)
+    elif args.command == "find-blocks":
+        if args.file is None or args.chunk_x is None or args.chunk_z is None:
+            parser.error("find-blocks needs either --index, or --file, --chunk-x and --chunk-z")
+        region = default_cache.get(args.file)
+        chunk = region.get_chunk(args.chunk_x, args.chunk_z, lazy=True)
+        found = find_blocks_in_volume(*chunk.to_volume(), args.block_id, chunk.x, chunk.z)
 
-        print(f"Found {cpt_blocks} of {block_name} in chunk (x:{args.chunk_x}, z:{args.chunk_z})")
+        for (block_id, block_data), coordinates in found.items():
+            name = get_block_name(block_id, block_data or 0)
+            print(f"Found {len(coordinates)} of {name} in chunk (x:{args.chunk_x}, z:{args.chunk_z})")
+            for x, y, z in coordinates:
+                print(f"  x:{x}, y:{y}, z:{z}")
 
 
     elif args.command == "schematic":
-        region = anvil.Region.from_file(args.file)
+        region = default_cache.get(args.file)
         chunk = region.get_chunk(args.chunk_x, args.chunk_z)
-        block_list = chunks.extract_blocks_from_chunk(chunk)
 
         # Ensure the output directory exists
         os.makedirs(os.path.dirname(args.output), exist_ok=True)
 
         # Generate the schematic file
-        chunks.save_chunks_as_schematic([block_list], args.output)
+        chunks.save_chunks_as_schematic([chunk]).save(args.output)
         print(f"Schematic file generated successfully at {args.output}")
 
     elif args.command == "world":
-        print("Running full world analysis (this may take a while)...")
-        analyze_world_chunks()
-        print("Analysis complete!")
+        area = area_from_arguments(args)
+        if area is None:
+            print("Running full world analysis (this may take a while)...")
+        else:
+            print(f"Running world analysis of {area}...")
+        store = ScanStore(args.database) if args.database else None
+        manifest = ScanManifest.load(args.manifest) if args.manifest else None
+        index = BlockIndex.load_or_create(args.index) if args.index else None
+        try:
+            blocks_by_location = analyze_world_chunks(
+                args.server, args.dimension, area, workers=args.workers,
+                progress=lambda done, total: print(f"{done}/{total} region files analyzed", end="\r"),
+                store=store, manifest=manifest, index=index)
+        finally:
+            if store is not None:
+                store.close()
+        print()
+        for chunk_key, block_counts in blocks_by_location.items():
+            print(f"Chunk at ({chunk_key}):")
+            for block_name, count in sorted(block_counts.items(), key=lambda x: x[1], reverse=True):
+                print(f"  {block_name}: {count}")
+        print(f"Analysis complete! {len(blocks_by_location)} chunks analyzed.")
+
+    elif args.command == "suspicious":
+        suspicious_chunks = find_suspicious_chunks(
+            args.server, args.dimension, area_from_arguments(args), args.depth, args.limit, args.workers,
+            progress=lambda done, total: print(f"{done}/{total} region files read", end="\r"),
+            cache=chunk_cache_from_arguments(args))
+        print()
+        for row in suspicious_chunks:
+            print(f"Chunk at (x:{row['x']}, z:{row['z']}): score {row['score']} "
+                  f"(air {row['air']}, natural {row['natural']}, other {row['other']}, "
+                  f"{row['containers']} containers)")
+
+    elif args.command == "snapshot":
+        files = take_snapshot(args.server, args.dimension, args.output)
+        print(f"Copied {len(files)} MCA files to {args.output}")
+
+    elif args.command == "diff":
+        if args.new:
+            new_files = get_snapshot_files(args.new)
+        elif args.server:
+            new_files = chunks.get_mca_files(args.server, args.dimension)
+        else:
+            parser.error("diff needs either --new or --server")
+        changed_chunks = diff_snapshots(
+            get_snapshot_files(args.old), new_files, area_from_arguments(args), args.workers,
+            progress=lambda done, total: print(f"{done}/{total} region files compared", end="\r"),
+            cache=chunk_cache_from_arguments(args))
+        print()
+        for changed_chunk in changed_chunks[:args.limit]:
+            print(f"Chunk at (x:{changed_chunk['x']}, z:{changed_chunk['z']}): {changed_chunk['changed']} blocks changed")
+            for name, delta in sorted(changed_chunk["deltas"].items(), key=lambda x: abs(x[1]), reverse=True):
+                print(f"  {delta:+} {name}")
+        print(f"{len(changed_chunks)} chunks changed.")
+
+    elif args.command == "map":
+        area = area_from_arguments(args)
+        image, (origin_x, origin_z) = render_dimension(
+            args.server, args.dimension, area, args.overlay, args.scale, workers=args.workers,
+            progress=lambda done, total: print(f"{done}/{total} region files drawn", end="\r"),
+            cache=chunk_cache_from_arguments(args))
+        print()
+        save_png(image, args.output)
+        print(f"Map of {image.shape[1] * args.scale}x{image.shape[0] * args.scale} blocks from "
+              f"(x:{origin_x}, z:{origin_z}) saved at {args.output}")
+
+        if args.tiles:
+            # The tiles were just made, they are loaded back from the tile directory
+            directory = default_tile_directory(args.server, args.dimension)
+            for file in chunks.get_mca_files(args.server, args.dimension, area):
+                tile = load_region_tile(file, directory)
+                save_png(shade_tile(tile), os.path.join(args.tiles, f"r.{tile.region_x}.{tile.region_z}.png"))
+            print(f"Region maps saved in {args.tiles}")
+
+    elif args.command == "top":
+        with ScanStore(args.database) as store:
+            scan_id = store.latest_scan(args.server, args.dimension)
+            if scan_id is None:
+                print(f"No scan of {args.server}/{args.dimension} in {args.database}")
+                return
+            for chunk_x, chunk_z, count in store.top_chunks(scan_id, args.block, args.limit):
+                print(f"Chunk at (x:{chunk_x}, z:{chunk_z}): {count}")
 
     else:
         parser.print_help()
@@ -0,0 +1,378 @@
+"""
+Top-down overview maps of a dimension, drawn from the highest block of each
+column, with optional overlays of the ore density or of the suspicion score
+of each chunk.
+"""
+# Standard library imports
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from functools import lru_cache
+from typing import Callable, Iterable, List, Optional, Sequence, Tuple
+
+# Third-party imports
+import numpy as np
+from anvil.chunk_cache import ChunkCache
+from PIL import Image
+
+# Local imports
+from nationsglory.bots.xray import chunks
+from nationsglory.bots.xray.profiles import DEFAULT_CATEGORY_TABLE, ORE, find_suspicious_chunks
+
+# Constants
+DEFAULT_TILE_DIRECTORY = os.path.join('nationsglory', 'config', 'xray_tiles')
+OVERLAYS = ("ores", "score")
+
+# Map colors of the most common vanilla blocks, other blocks get a color of their own from their id
+BLOCK_COLORS = {
+    1: (125, 125, 125), 2: (95, 159, 53), 3: (134, 96, 67), 4: (110, 110, 110), 5: (157, 128, 79),
+    7: (60, 60, 60), 8: (48, 84, 196), 9: (48, 84, 196), 10: (207, 92, 20), 11: (207, 92, 20),
+    12: (219, 207, 163), 13: (136, 126, 126), 17: (102, 81, 50), 18: (48, 110, 30), 24: (216, 203, 155),
+    31: (80, 140, 45), 35: (220, 220, 220), 37: (200, 200, 40), 38: (190, 40, 40), 43: (160, 160, 160),
+    44: (160, 160, 160), 49: (20, 18, 30), 54: (160, 110, 40), 78: (250, 250, 250), 79: (160, 190, 255),
+    80: (250, 250, 250), 81: (15, 110, 25), 82: (160, 166, 179), 83: (120, 170, 80), 87: (111, 54, 52),
+    88: (84, 64, 51), 89: (250, 210, 120), 98: (122, 122, 122), 110: (110, 98, 110), 111: (30, 120, 30),
+    121: (221, 223, 165), 159: (150, 90, 70), 161: (60, 120, 30), 162: (100, 80, 50), 172: (150, 92, 66),
+}
+# Brightness of a column higher, level with, or lower than its northern neighbour, like in game maps
+RELIEF_SHADES = (1.1, 1.0, 0.85)
+
+
+class RegionTile:
+    """
+    The highest block of each column of a region file, and the number of ore
+    blocks of each of its chunks, from which maps are drawn.
+
+    Tiles are saved next to each other in a tile directory, and only made again
+    once their region file is modified (see `load_region_tile`).
+
+    :ivar region_x: The region's X coordinate.
+    :ivar region_z: The region's Z coordinate.
+    :ivar mtime_ns: The modification time of the region file the tile was made from.
+    :ivar keys: The ``id * 16 + data`` key of the highest block of each column,
+        a ``(512, 512)`` array indexed ``[z, x]``.
+    :ivar heights: The Y level of the highest block of each column, ``-1`` for
+        empty columns and missing chunks.
+    :ivar ores: The number of ore blocks of each chunk, a ``(32, 32)`` array indexed ``[z, x]``.
+    """
+    __slots__ = ("region_x", "region_z", "mtime_ns", "keys", "heights", "ores")
+
+    def __init__(self, region_x: int, region_z: int, mtime_ns: int,
+                 keys: np.ndarray, heights: np.ndarray, ores: np.ndarray):
+        self.region_x = region_x
+        self.region_z = region_z
+        self.mtime_ns = mtime_ns
+        self.keys = keys
+        self.heights = heights
+        self.ores = ores
+
+
+def default_tile_directory(server: str, dimension: str) -> str:
+    """
+    Returns the default tile directory of a server's dimension.
+
+    :param server: The name of the server.
+    :type server: str
+    :param dimension: The name of the dimension.
+    :type dimension: str
+    :rtype: str
+    """
+    return os.path.join(DEFAULT_TILE_DIRECTORY, f"{server.lower()}_{dimension.lower().replace(' ', '_')}")
+
+
+def column_tops(ids: np.ndarray, data: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Finds the highest non-air block of each column of a chunk.
+
+    :param ids: The block ids, a ``(256, 16, 16)`` array indexed ``[y, z, x]``
+        such as `anvil.Chunk.to_volume` returns.
+    :type ids: np.ndarray
+    :param data: The block data, same shape as `ids`.
+    :type data: np.ndarray
+    :return: The ``id * 16 + data`` key and the Y level of the highest block of
+        each column, two ``(16, 16)`` arrays indexed ``[z, x]``, the Y level
+        being ``-1`` for empty columns.
+    :rtype: Tuple[np.ndarray, np.ndarray]
+    """
+    solid = ids != 0
+    # First solid block from the top
+    heights = (255 - solid[::-1].argmax(axis=0)).astype(np.int16)
+    heights[~solid.any(axis=0)] = -1
+
+    top = np.maximum(heights, 0)[None].astype(np.intp)
+    keys = (np.take_along_axis(ids, top, axis=0)[0].astype(np.uint16) << 4
+            | np.take_along_axis(data, top, axis=0)[0])
+    keys[heights < 0] = 0
+    return keys, heights
+
+
+def make_region_tile(region_file_path: str, cache: Optional[ChunkCache] = None) -> RegionTile:
+    """
+    Makes the tile of a region file, decoding its chunks one at a time.
+
+    :param region_file_path: The file path to the `.mca` region file.
+    :type region_file_path: str
+    :param cache: The decoded chunk cache, only the chunks that changed since
+        they were cached are decoded.
+    :type cache: anvil.ChunkCache, optional
+    :rtype: RegionTile
+    """
+    mtime_ns = os.stat(region_file_path).st_mtime_ns
+    region_x, region_z = chunks.region_coordinates(region_file_path)
+    keys = np.zeros((512, 512), dtype=np.uint16)
+    heights = np.full((512, 512), -1, dtype=np.int16)
+    ores = np.zeros((32, 32), dtype=np.uint16)
+
+    for chunk_x, chunk_z, ids, data in chunks.iter_volumes_from_region_file(region_file_path, cache):
+        x, z = chunk_x - region_x * 32, chunk_z - region_z * 32
+        columns = np.s_[z * 16:z * 16 + 16, x * 16:x * 16 + 16]
+        keys[columns], heights[columns] = column_tops(ids, data)
+        ores[z, x] = np.count_nonzero(DEFAULT_CATEGORY_TABLE[ids] == ORE)
+    return RegionTile(region_x, region_z, mtime_ns, keys, heights, ores)
+
+
+def load_region_tile(region_file_path: str, directory: str, cache: Optional[ChunkCache] = None) -> RegionTile:
+    """
+    Returns the tile of a region file from a tile directory, making it and
+    saving it there first if the region file was modified since.
+
+    :param region_file_path: The file path to the `.mca` region file.
+    :type region_file_path: str
+    :param directory: The tile directory, one per dimension, created if needed.
+    :type directory: str
+    :param cache: The decoded chunk cache used to make the tile.
+    :type cache: anvil.ChunkCache, optional
+    :rtype: RegionTile
+    """
+    region_x, region_z = chunks.region_coordinates(region_file_path)
+    tile_path = os.path.join(directory, f"r.{region_x}.{region_z}.npz")
+    try:
+        with np.load(tile_path) as saved:
+            if int(saved["mtime_ns"]) == os.stat(region_file_path).st_mtime_ns:
+                return RegionTile(region_x, region_z, int(saved["mtime_ns"]),
+                                  saved["keys"], saved["heights"], saved["ores"])
+    except (OSError, ValueError, KeyError):
+        pass
+
+    tile = make_region_tile(region_file_path, cache)
+    os.makedirs(directory, exist_ok=True)
+    fd, temp = tempfile.mkstemp(dir=directory, suffix=".npz")
+    try:
+        with os.fdopen(fd, "wb") as file:
+            np.savez_compressed(file, mtime_ns=np.int64(tile.mtime_ns),
+                                keys=tile.keys, heights=tile.heights, ores=tile.ores)
+        os.replace(temp, tile_path)
+    except BaseException:
+        os.remove(temp)
+        raise
+    return tile
+
+
+@lru_cache(maxsize=1)
+def color_table() -> np.ndarray:
+    """
+    Returns the map color of each block id, `BLOCK_COLORS` or a muted color
+    of its own for the others, and black for air.
+
+    :return: A read only ``(4096, 3)`` ``uint8`` array.
+    :rtype: np.ndarray
+    """
+    # Spread the ids over the color cube, then pull towards grey
+    spread = np.arange(4096, dtype=np.uint32) * np.uint32(2654435761)
+    table = np.stack([spread >> 24, spread >> 16 & 255, spread >> 8 & 255], axis=1) // 2 + 64
+    table = table.astype(np.uint8)
+    for block_id, color in BLOCK_COLORS.items():
+        table[block_id] = color
+    table[0] = 0
+    table.flags.writeable = False
+    return table
+
+
+def shade_tile(tile: RegionTile) -> np.ndarray:
+    """
+    Draws a tile, coloring each column by its highest block and shading it by
+    the relief.
+
+    :param tile: The tile to draw.
+    :type tile: RegionTile
+    :return: A ``(512, 512, 3)`` ``uint8`` RGB image, north up.
+    :rtype: np.ndarray
+    """
+    colors = color_table()[tile.keys >> 4].astype(np.float32)
+    heights = tile.heights
+    north = np.vstack([heights[:1], heights[:-1]])
+    shades = np.select([heights > north, heights < north], RELIEF_SHADES[::2], RELIEF_SHADES[1])
+    return np.clip(colors * shades[..., None], 0, 255).astype(np.uint8)
+
+
+def mosaic(tiles: Sequence[RegionTile], scale: int = 1,
+           area: Optional[chunks.ChunkArea] = None) -> Tuple[np.ndarray, Tuple[int, int]]:
+    """
+    Stitches tiles together into a map of a dimension.
+
+    :param tiles: The tiles to stitch.
+    :type tiles: Sequence[RegionTile]
+    :param scale: The number of blocks per pixel side, a power of two up to 16.
+        A map of a whole dimension at one block per pixel can be huge.
+    :type scale: int, optional
+    :param area: Leave the chunks outside of this area black.
+    :type area: chunks.ChunkArea, optional
+    :return: The ``(height, width, 3)`` ``uint8`` RGB image, north up, and the
+        block coordinates of its north-west corner.
+    :rtype: Tuple[np.ndarray, Tuple[int, int]]
+    :raises ValueError: If `scale` doesn't divide 512.
+    """
+    if 512 % scale:
+        raise ValueError(f"The scale must divide 512, got {scale}")
+    if not tiles:
+        return np.zeros((0, 0, 3), dtype=np.uint8), (0, 0)
+
+    min_x = min(tile.region_x for tile in tiles)
+    min_z = min(tile.region_z for tile in tiles)
+    width = max(tile.region_x for tile in tiles) - min_x + 1
+    height = max(tile.region_z for tile in tiles) - min_z + 1
+    size = 512 // scale
+
+    image = np.zeros((height * size, width * size, 3), dtype=np.uint8)
+    for tile in tiles:
+        pixels = shade_tile(tile)[::scale, ::scale]
+        if area is not None:
+            pixels *= _chunk_of_pixels(area.region_mask(tile.region_x, tile.region_z), size, size, scale)
+        top, left = (tile.region_z - min_z) * size, (tile.region_x - min_x) * size
+        image[top:top + size, left:left + size] = pixels
+    return image, (min_x * 512, min_z * 512)
+
+
+def overlay_chunks(image: np.ndarray, origin: Tuple[int, int], scale: int, chunk_xs: Iterable[int],
+                   chunk_zs: Iterable[int], values: Iterable[float],
+                   color: Tuple[int, int, int] = (255, 0, 0), opacity: float = 0.7) -> np.ndarray:
+    """
+    Tints the chunks of a map in proportion to a value of each of them, the
+    highest value being drawn at full `opacity`.
+
+    :param image: The map, see `mosaic`.
+    :type image: np.ndarray
+    :param origin: The block coordinates of the map's north-west corner.
+    :type origin: Tuple[int, int]
+    :param scale: The number of blocks per pixel side of the map.
+    :type scale: int
+    :param chunk_xs: The X coordinates of the chunks.
+    :type chunk_xs: Iterable[int]
+    :param chunk_zs: The Z coordinates of the chunks.
+    :type chunk_zs: Iterable[int]
+    :param values: The non negative value of each chunk.
+    :type values: Iterable[float]
+    :param color: The tint's RGB color. Defaults to red.
+    :type color: Tuple[int, int, int], optional
+    :param opacity: The tint's opacity over the chunk with the highest value.
+    :type opacity: float, optional
+    :return: A new tinted image.
+    :rtype: np.ndarray
+    """
+    height, width = image.shape[:2]
+    rows, columns = -(-height * scale // 16), -(-width * scale // 16)
+    chunk_xs = np.asarray(list(chunk_xs), dtype=np.int64) - (origin[0] >> 4)
+    chunk_zs = np.asarray(list(chunk_zs), dtype=np.int64) - (origin[1] >> 4)
+    values = np.asarray(list(values), dtype=np.float32)
+
+    grid = np.zeros((rows, columns), dtype=np.float32)
+    inside = (0 <= chunk_xs) & (chunk_xs < columns) & (0 <= chunk_zs) & (chunk_zs < rows)
+    grid[chunk_zs[inside], chunk_xs[inside]] = values[inside]
+    if grid.max() > 0:
+        grid *= opacity / grid.max()
+
+    weights = _chunk_of_pixels(grid, height, width, scale)
+    return (image * (1 - weights) + np.array(color, dtype=np.float32) * weights).astype(np.uint8)
+
+
+def _chunk_of_pixels(chunk_grid: np.ndarray, height: int, width: int, scale: int) -> np.ndarray:
+    """Spreads a ``[z, x]`` grid of chunk values over the ``(height, width, 1)`` pixels of a map"""
+    return chunk_grid[(np.arange(height) * scale) >> 4][:, (np.arange(width) * scale) >> 4, None]
+
+
+def render_dimension(server: str, dimension: str = "overworld", area: Optional[chunks.ChunkArea] = None,
+                     overlay: Optional[str] = None, scale: int = 4, directory: Optional[str] = None,
+                     workers: Optional[int] = None,
+                     progress: Optional[Callable[[int, int], None]] = None,
+                     cache: Optional[ChunkCache] = None) -> Tuple[np.ndarray, Tuple[int, int]]:
+    """
+    Draws the map of a server's dimension. Tiles are loaded from the tile
+    directory, and only the region files modified since they were last drawn
+    are read (see `load_region_tile`).
+
+    :param server: The name of the server.
+    :type server: str
+    :param dimension: The dimension to draw. Defaults to "overworld".
+    :type dimension: str, optional
+    :param area: Only draw the chunks of this area.
+    :type area: chunks.ChunkArea, optional
+    :param overlay: Tint the chunks by their number of ore blocks (``"ores"``), or
+        by how suspicious they are (``"score"``, see `find_suspicious_chunks`, which
+        reads every chunk again).
+    :type overlay: str, optional
+    :param scale: The number of blocks per pixel side. Defaults to 4.
+    :type scale: int, optional
+    :param directory: The tile directory, `default_tile_directory` if not given.
+    :type directory: str, optional
+    :param workers: The number of processes making tiles, tiles are made one by
+        one in the calling process if not given.
+    :type workers: int, optional
+    :param progress: Called with the number of region files done so far and
+        the total number of region files, each time one of them is done.
+    :type progress: Callable[[int, int], None], optional
+    :param cache: The decoded chunk cache, used to make the tiles of modified
+        region files and for the ``"score"`` overlay. Worker processes get an
+        empty in memory copy of it, so give it a directory for them to share its files.
+    :type cache: anvil.ChunkCache, optional
+    :return: The ``(height, width, 3)`` ``uint8`` RGB image, north up, and the
+        block coordinates of its north-west corner.
+    :rtype: Tuple[np.ndarray, Tuple[int, int]]
+    :raises ValueError: If the overlay is unknown, or `scale` doesn't divide 512.
+    """
+    if overlay is not None and overlay not in OVERLAYS:
+        raise ValueError(f"Unknown overlay {overlay}, expected one of {', '.join(OVERLAYS)}")
+    if directory is None:
+        directory = default_tile_directory(server, dimension)
+
+    files = chunks.get_mca_files(server, dimension, area)
+    tiles: List[Optional[RegionTile]] = [None] * len(files)
+    if not workers:
+        for i, file in enumerate(files):
+            tiles[i] = load_region_tile(file, directory, cache)
+            if progress is not None:
+                progress(i + 1, len(files))
+    else:
+        with ProcessPoolExecutor(workers) as pool:
+            futures = {pool.submit(load_region_tile, file, directory, cache): i for i, file in enumerate(files)}
+            for done, future in enumerate(as_completed(futures), 1):
+                tiles[futures[future]] = future.result()
+                if progress is not None:
+                    progress(done, len(files))
+
+    image, origin = mosaic(tiles, scale, area)
+    if overlay == "ores" and tiles:
+        chunk_zs, chunk_xs = np.indices((32, 32)).reshape(2, -1)
+        image = overlay_chunks(image, origin, scale,
+                               np.concatenate([chunk_xs + tile.region_x * 32 for tile in tiles]),
+                               np.concatenate([chunk_zs + tile.region_z * 32 for tile in tiles]),
+                               np.concatenate([tile.ores.ravel() for tile in tiles]), color=(0, 220, 255))
+    elif overlay == "score":
+        scored = find_suspicious_chunks(server, dimension, area, limit=None, workers=workers, cache=cache)
+        image = overlay_chunks(image, origin, scale, [chunk["x"] >> 4 for chunk in scored],
+                               [chunk["z"] >> 4 for chunk in scored], [chunk["score"] for chunk in scored])
+    return image, origin
+
+
+def save_png(image: np.ndarray, path: str):
+    """
+    Saves a map as a PNG file.
+
+    :param image: The ``(height, width, 3)`` ``uint8`` RGB image.
+    :type image: np.ndarray
+    :param path: The path to the PNG file.
+    :type path: str
+    """
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    Image.fromarray(image, "RGB").save(path)
@@ -0,0 +1,249 @@
+"""
+Per Y level block profiles of chunks, and scoring of the chunks that stand out
+from the rest of their dimension (tunnels, stash rooms, hidden containers).
+"""
+# Standard library imports
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+# Third-party imports
+import numpy as np
+from anvil.chunk_cache import ChunkCache
+
+# Local imports
+from nationsglory.bots.xray import chunks
+
+# Constants
+PROFILE_CATEGORIES = ("air", "natural", "ore", "container", "other")
+AIR, NATURAL, ORE, CONTAINER, OTHER = range(len(PROFILE_CATEGORIES))
+
+# Blocks a dimension is naturally made of: stone, dirt, bedrock, sand, gravel,
+# sandstone, netherrack, soul sand, end stone, and water and lava
+NATURAL_BLOCK_IDS = (1, 3, 7, 8, 9, 10, 11, 12, 13, 24, 87, 88, 121)
+# Coal, iron, gold, diamond, redstone, lapis, emerald and quartz ores
+ORE_BLOCK_IDS = (14, 15, 16, 21, 56, 73, 74, 129, 153)
+# Chests, trapped chests, ender chests, dispensers, droppers, furnaces and hoppers
+CONTAINER_BLOCK_IDS = (23, 54, 61, 62, 130, 146, 154, 158)
+
+# Y level under which chunks are scored, players dig their bases below it
+DEFAULT_DEPTH = 40
+# Container blocks are rare underground, each of them weighs this much in the score
+CONTAINER_WEIGHT = 2.0
+
+
+def category_table(natural_ids: Iterable[int] = NATURAL_BLOCK_IDS, ore_ids: Iterable[int] = ORE_BLOCK_IDS,
+                   container_ids: Iterable[int] = CONTAINER_BLOCK_IDS) -> np.ndarray:
+    """
+    Builds the lookup table giving the profile category (see `PROFILE_CATEGORIES`)
+    of each block id. Block ids that aren't listed, other than air, are in the
+    ``other`` category.
+
+    :param natural_ids: The block ids a dimension is naturally made of.
+    :type natural_ids: Iterable[int], optional
+    :param ore_ids: The ore block ids.
+    :type ore_ids: Iterable[int], optional
+    :param container_ids: The container block ids, modded ones included.
+    :type container_ids: Iterable[int], optional
+    :return: A ``(4096,)`` array of category indices.
+    :rtype: np.ndarray
+    """
+    table = np.full(4096, OTHER, dtype=np.intp)
+    table[list(natural_ids)] = NATURAL
+    table[list(ore_ids)] = ORE
+    table[list(container_ids)] = CONTAINER
+    table[0] = AIR
+    return table
+
+
+DEFAULT_CATEGORY_TABLE = category_table()
+DEFAULT_CATEGORY_TABLE.flags.writeable = False
+
+# Offset of each block's Y level in a flattened (256, categories) histogram
+_Y_OFFSETS = np.repeat(np.arange(256) * len(PROFILE_CATEGORIES), 256)
+
+
+def y_profile(ids: np.ndarray, table: np.ndarray = DEFAULT_CATEGORY_TABLE) -> np.ndarray:
+    """
+    Counts the blocks of each category at each Y level of a chunk, with a single
+    `np.bincount` over the chunk's block ids.
+
+    :param ids: The block ids, a ``(256, 16, 16)`` array indexed ``[y, z, x]``
+        such as `anvil.Chunk.to_volume` returns.
+    :type ids: np.ndarray
+    :param table: The category of each block id, see `category_table`.
+    :type table: np.ndarray, optional
+    :return: A ``(256, len(PROFILE_CATEGORIES))`` array, each row adding up to 256.
+    :rtype: np.ndarray
+    """
+    bins = np.bincount(_Y_OFFSETS + table[ids.ravel()], minlength=256 * len(PROFILE_CATEGORIES))
+    return bins.reshape(256, len(PROFILE_CATEGORIES)).astype(np.uint16)
+
+
+def profile_region_file(region_file_path: str, area: Optional[chunks.ChunkArea] = None,
+                        table: np.ndarray = DEFAULT_CATEGORY_TABLE,
+                        cache: Optional[ChunkCache] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Computes the Y profile (see `y_profile`) of every chunk of a region file.
+
+    :param region_file_path: The file path to the `.mca` region file.
+    :type region_file_path: str
+    :param area: Only profile the chunks of this area.
+    :type area: chunks.ChunkArea, optional
+    :param table: The category of each block id, see `category_table`.
+    :type table: np.ndarray, optional
+    :param cache: The decoded chunk cache, only the chunks that changed since
+        they were cached are decoded.
+    :type cache: anvil.ChunkCache, optional
+    :return: The ``(n, 2)`` world coordinates of the chunks and their
+        ``(n, 256, len(PROFILE_CATEGORIES))`` profiles.
+    :rtype: Tuple[np.ndarray, np.ndarray]
+    """
+    coordinates = []
+    profiles = []
+    for chunk_x, chunk_z, ids, _ in chunks.iter_volumes_from_region_file(region_file_path, cache, area):
+        coordinates.append((chunk_x, chunk_z))
+        profiles.append(y_profile(ids, table))
+
+    if not profiles:
+        return np.zeros((0, 2), dtype=np.int32), np.zeros((0, 256, len(PROFILE_CATEGORIES)), dtype=np.uint16)
+    return np.array(coordinates, dtype=np.int32), np.stack(profiles)
+
+
+def profile_dimension(server: str, dimension: str = "overworld", area: Optional[chunks.ChunkArea] = None,
+                      workers: Optional[int] = None, progress: Optional[Callable[[int, int], None]] = None,
+                      table: np.ndarray = DEFAULT_CATEGORY_TABLE,
+                      cache: Optional[ChunkCache] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Computes the Y profile of every chunk of a server's dimension, see `profile_region_file`.
+    Profiles take 2.5 KB per chunk.
+
+    :param server: The name of the server.
+    :type server: str
+    :param dimension: The dimension to profile. Defaults to "overworld".
+    :type dimension: str, optional
+    :param area: Only profile the chunks of this area.
+    :type area: chunks.ChunkArea, optional
+    :param workers: The number of processes profiling region files, region files are
+        profiled one by one in the calling process if not given.
+    :type workers: int, optional
+    :param progress: Called with the number of region files profiled so far and
+        the total number of region files, each time one of them is done.
+    :type progress: Callable[[int, int], None], optional
+    :param table: The category of each block id, see `category_table`.
+    :type table: np.ndarray, optional
+    :param cache: The decoded chunk cache. Worker processes get an empty in memory
+        copy of it, so give it a directory for them to share its files.
+    :type cache: anvil.ChunkCache, optional
+    :return: The ``(n, 2)`` world coordinates of the chunks and their
+        ``(n, 256, len(PROFILE_CATEGORIES))`` profiles.
+    :rtype: Tuple[np.ndarray, np.ndarray]
+    """
+    files = chunks.get_mca_files(server, dimension, area)
+    results: List[Optional[Tuple[np.ndarray, np.ndarray]]] = [None] * len(files)
+
+    if not workers:
+        for i, file in enumerate(files):
+            results[i] = profile_region_file(file, area, table, cache)
+            if progress is not None:
+                progress(i + 1, len(files))
+    else:
+        with ProcessPoolExecutor(workers) as pool:
+            futures = {pool.submit(profile_region_file, file, area, table, cache): i for i, file in enumerate(files)}
+            for done, future in enumerate(as_completed(futures), 1):
+                results[futures[future]] = future.result()
+                if progress is not None:
+                    progress(done, len(files))
+
+    if not results:
+        return np.zeros((0, 2), dtype=np.int32), np.zeros((0, 256, len(PROFILE_CATEGORIES)), dtype=np.uint16)
+    return (np.concatenate([coordinates for coordinates, _ in results]),
+            np.concatenate([profiles for _, profiles in results]))
+
+
+def score_chunks(coordinates: np.ndarray, profiles: np.ndarray, depth: int = DEFAULT_DEPTH,
+                 limit: Optional[int] = 50) -> List[Dict[str, float]]:
+    """
+    Scores how much each chunk stands out from its dimension below a Y level,
+    and returns the most suspicious chunks first.
+
+    The baseline is the mean and standard deviation of each category at each Y
+    level over all given chunks. Below `depth`, a chunk scores for every level
+    where it has more air or more ``other`` blocks, or fewer natural blocks,
+    than the baseline (in standard deviations, averaged over the levels), plus
+    `CONTAINER_WEIGHT` per container block. All chunks are scored at once.
+
+    :param coordinates: The ``(n, 2)`` chunk coordinates, see `profile_dimension`.
+    :type coordinates: np.ndarray
+    :param profiles: The ``(n, 256, len(PROFILE_CATEGORIES))`` chunk profiles.
+    :type profiles: np.ndarray
+    :param depth: The Y level under which chunks are scored. Defaults to 40.
+    :type depth: int, optional
+    :param limit: The maximum number of chunks to return, all of them if ``None``.
+    :type limit: int, optional
+    :return: A list of dictionaries with the chunk's block coordinates (``x``, ``z``),
+        its ``score``, the parts of the score due to ``air``, ``natural`` and ``other``
+        blocks, and its number of ``containers`` below `depth`, highest score first.
+    :rtype: List[Dict[str, float]]
+    """
+    if len(profiles) == 0:
+        return []
+
+    # Bedrock level hides nothing
+    fractions = profiles[:, 1:depth].astype(np.float32) / 256
+    mean = fractions.mean(axis=0)
+    # Levels where every chunk looks the same would divide by zero
+    std = np.maximum(fractions.std(axis=0), 1 / 256)
+    deviations = (fractions - mean) / std
+
+    air = np.clip(deviations[..., AIR], 0, None).mean(axis=1)
+    natural = np.clip(-deviations[..., NATURAL], 0, None).mean(axis=1)
+    other = np.clip(deviations[..., OTHER], 0, None).mean(axis=1)
+    containers = profiles[:, :depth, CONTAINER].sum(axis=1)
+    scores = air + natural + other + CONTAINER_WEIGHT * containers
+
+    ranking = np.argsort(-scores, kind="stable")
+    if limit is not None:
+        ranking = ranking[:limit]
+    return [{
+        "x": int(coordinates[i, 0]) * 16,
+        "z": int(coordinates[i, 1]) * 16,
+        "score": round(float(scores[i]), 3),
+        "air": round(float(air[i]), 3),
+        "natural": round(float(natural[i]), 3),
+        "other": round(float(other[i]), 3),
+        "containers": int(containers[i]),
+    } for i in ranking.tolist()]
+
+
+def find_suspicious_chunks(server: str, dimension: str = "overworld", area: Optional[chunks.ChunkArea] = None,
+                           depth: int = DEFAULT_DEPTH, limit: Optional[int] = 50, workers: Optional[int] = None,
+                           progress: Optional[Callable[[int, int], None]] = None,
+                           cache: Optional[ChunkCache] = None) -> List[Dict[str, float]]:
+    """
+    Profiles a server's dimension and ranks its chunks by how suspicious they
+    are, see `profile_dimension` and `score_chunks`.
+
+    When an area is given, the baseline is computed from the chunks of the area only.
+
+    :param server: The name of the server.
+    :type server: str
+    :param dimension: The dimension to analyze. Defaults to "overworld".
+    :type dimension: str, optional
+    :param area: Only analyze the chunks of this area.
+    :type area: chunks.ChunkArea, optional
+    :param depth: The Y level under which chunks are scored. Defaults to 40.
+    :type depth: int, optional
+    :param limit: The maximum number of chunks to return, all of them if ``None``.
+    :type limit: int, optional
+    :param workers: The number of processes profiling region files.
+    :type workers: int, optional
+    :param progress: Called with the number of region files profiled so far and
+        the total number of region files.
+    :type progress: Callable[[int, int], None], optional
+    :param cache: The decoded chunk cache, see `profile_dimension`.
+    :type cache: anvil.ChunkCache, optional
+    :return: The most suspicious chunks first, see `score_chunks`.
+    :rtype: List[Dict[str, float]]
+    """
+    coordinates, profiles = profile_dimension(server, dimension, area, workers, progress, cache=cache)
+    return score_chunks(coordinates, profiles, depth, limit)
@@ -0,0 +1,137 @@
+"""
+Manifest of the region files and chunks already analyzed, used to only
+analyze again what changed since the last world analysis.
+"""
+# Standard library imports
+import os
+import pickle
+import tempfile
+from typing import Dict, Optional, Tuple
+
+# Third-party imports
+import numpy as np
+
+# Constants
+DEFAULT_MANIFEST_PATH = os.path.join('nationsglory', 'config', 'xray_manifest.pickle')
+# Bumped whenever RegionScan changes, older manifests are then ignored
+MANIFEST_VERSION = 2
+
+
+class RegionScan:
+    """
+    Analysis results of a region file, along with what identifies the version
+    of the file and of each chunk that was analyzed.
+
+    :ivar mtime_ns: The modification time of the region file, in nanoseconds.
+    :ivar size: The size of the region file, in bytes.
+    :ivar stamps: The 32x32 chunk stamps (see `anvil.Region.chunk_stamps`) of
+        the analyzed chunks, indexed ``[z, x]``. Chunks that weren't analyzed
+        have a stamp of ``0``.
+    :ivar blocks_by_location: The block counts of each analyzed chunk, keyed by
+        ``"x:<block x>, z:<block z>"`` like `analyze_world_chunks` returns.
+    :ivar complete: Whether every chunk of the region file was analyzed.
+    :ivar index_keys: The ``id * 16 + data`` keys of the blocks whose positions were
+        recorded, see `BlockIndex`.
+    :ivar block_positions: The ``(n, 3)`` world coordinates of the blocks of each
+        recorded key, by chunk key.
+    """
+    __slots__ = ("mtime_ns", "size", "stamps", "blocks_by_location", "complete", "index_keys", "block_positions")
+
+    def __init__(self, mtime_ns: int, size: int, stamps: np.ndarray,
+                 blocks_by_location: Dict[str, Dict[str, int]], complete: bool,
+                 index_keys: Tuple[int, ...] = (),
+                 block_positions: Optional[Dict[str, Dict[int, np.ndarray]]] = None):
+        self.mtime_ns = mtime_ns
+        self.size = size
+        self.stamps = stamps
+        self.blocks_by_location = blocks_by_location
+        self.complete = complete
+        self.index_keys = index_keys
+        self.block_positions: Dict[str, Dict[int, np.ndarray]] = {} if block_positions is None else block_positions
+
+    def matches(self, stat: os.stat_result) -> bool:
+        """
+        Checks whether the region file is unchanged since it was analyzed,
+        and every chunk of it was.
+
+        :param stat: The current `os.stat` of the region file.
+        :rtype: bool
+        """
+        return self.complete and self.mtime_ns == stat.st_mtime_ns and self.size == stat.st_size
+
+
+class ScanManifest:
+    """
+    Analysis results of every region file analyzed so far, keyed by absolute
+    path, saved to a pickle file between runs.
+
+    `analyze_world_chunks` uses it to skip the region files whose modification
+    time and size didn't change, and, in the others, the chunks whose header
+    timestamp and location didn't change.
+
+    :ivar path: The path to the manifest file.
+    :ivar regions: The analysis results of each region file, by absolute path.
+    """
+    __slots__ = ("path", "regions")
+
+    def __init__(self, path: str = DEFAULT_MANIFEST_PATH, regions: Optional[Dict[str, RegionScan]] = None):
+        self.path = path
+        self.regions: Dict[str, RegionScan] = {} if regions is None else regions
+
+    @classmethod
+    def load(cls, path: str = DEFAULT_MANIFEST_PATH) -> "ScanManifest":
+        """
+        Loads a manifest file, or returns an empty manifest if there is none
+        or if it can't be read.
+
+        :param path: The path to the manifest file.
+        :type path: str
+        :rtype: ScanManifest
+        """
+        try:
+            with open(path, "rb") as file:
+                version, regions = pickle.load(file)
+        except (OSError, pickle.UnpicklingError, EOFError, AttributeError, TypeError, ValueError):
+            return cls(path)
+        if version != MANIFEST_VERSION or not isinstance(regions, dict):
+            return cls(path)
+        return cls(path, regions)
+
+    def save(self):
+        """Writes the manifest file, replacing the previous one atomically."""
+        directory = os.path.dirname(self.path) or "."
+        os.makedirs(directory, exist_ok=True)
+        fd, temp = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as file:
+                pickle.dump((MANIFEST_VERSION, self.regions), file, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(temp, self.path)
+        except BaseException:
+            os.remove(temp)
+            raise
+
+    def get(self, region_file_path: str) -> Optional[RegionScan]:
+        """
+        Returns the previous analysis of a region file.
+
+        :param region_file_path: The path to the region file.
+        :type region_file_path: str
+        :rtype: Optional[RegionScan]
+        """
+        return self.regions.get(os.path.abspath(region_file_path))
+
+    def update(self, region_file_path: str, region_scan: RegionScan):
+        """
+        Records the analysis of a region file.
+
+        :param region_file_path: The path to the region file.
+        :type region_file_path: str
+        :param region_scan: The analysis results.
+        :type region_scan: RegionScan
+        """
+        self.regions[os.path.abspath(region_file_path)] = region_scan
+
+    def prune(self):
+        """Forgets the region files that don't exist anymore."""
+        self.regions = {path: region_scan for path, region_scan in self.regions.items()
+                        if os.path.exists(path)}
@@ -0,0 +1,233 @@
+"""
+Persistent storage of world analysis results in a local SQLite database.
+"""
+# Standard library imports
+import os
+import re
+import sqlite3
+import time
+from typing import Dict, List, Optional, Tuple
+
+# Constants
+DEFAULT_DATABASE_PATH = os.path.join('nationsglory', 'config', 'xray_scans.db')
+
+# Chunk keys of analyze_world_chunks results, in block coordinates
+CHUNK_KEY_PATTERN = re.compile(r"x:(-?\d+), z:(-?\d+)")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS scans (
+    id INTEGER PRIMARY KEY,
+    server TEXT NOT NULL,
+    dimension TEXT NOT NULL,
+    scanned_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS scans_by_world ON scans (server, dimension, scanned_at);
+
+CREATE TABLE IF NOT EXISTS block_names (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE
+);
+
+CREATE TABLE IF NOT EXISTS chunk_blocks (
+    scan_id INTEGER NOT NULL REFERENCES scans (id) ON DELETE CASCADE,
+    chunk_x INTEGER NOT NULL,
+    chunk_z INTEGER NOT NULL,
+    block_id INTEGER NOT NULL REFERENCES block_names (id),
+    count INTEGER NOT NULL,
+    PRIMARY KEY (scan_id, chunk_x, chunk_z, block_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS chunk_blocks_by_count ON chunk_blocks (scan_id, block_id, count DESC);
+"""
+
+
+class ScanStore:
+    """
+    SQLite database of per-chunk block counts, as returned by
+    `analyze_world_chunks`, keyed by server, dimension, chunk and scan time.
+
+    Every scan is kept, so results survive a reload of the page and can be
+    compared across servers or over time. Queries such as the chunks holding
+    the most diamond ore of a scan are answered from indices, without
+    scanning the world again.
+
+    :ivar path: The path to the database file.
+    """
+    __slots__ = ("path", "_connection")
+
+    def __init__(self, path: str = DEFAULT_DATABASE_PATH):
+        """
+        Opens the database, creating it and its tables if needed.
+
+        :param path: The path to the database file.
+        :type path: str
+        """
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._connection = sqlite3.connect(path)
+        self._connection.execute("PRAGMA foreign_keys = ON")
+        self._connection.execute("PRAGMA journal_mode = WAL")
+        self._connection.executescript(SCHEMA)
+
+    def __enter__(self) -> "ScanStore":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        """Closes the database connection."""
+        self._connection.close()
+
+    def save_scan(self, server: str, dimension: str, blocks_by_location: Dict[str, Dict[str, int]],
+                  scanned_at: Optional[float] = None) -> int:
+        """
+        Stores the results of a world analysis as a new scan, with bulk inserts
+        in a single transaction.
+
+        :param server: The name of the server.
+        :type server: str
+        :param dimension: The name of the dimension.
+        :type dimension: str
+        :param blocks_by_location: The block counts of each chunk, keyed by
+            ``"x:<block x>, z:<block z>"`` like `analyze_world_chunks` returns.
+        :type blocks_by_location: Dict[str, Dict[str, int]]
+        :param scanned_at: The scan's UNIX time, now if not given.
+        :type scanned_at: float, optional
+        :return: The id of the new scan.
+        :rtype: int
+        :raises ValueError: If a chunk key isn't formatted like `analyze_world_chunks` does.
+        """
+        if scanned_at is None:
+            scanned_at = time.time()
+
+        with self._connection:
+            cursor = self._connection.execute(
+                "INSERT INTO scans (server, dimension, scanned_at) VALUES (?, ?, ?)",
+                (server.lower(), dimension.lower(), scanned_at))
+            scan_id = cursor.lastrowid
+
+            names = {name for block_counts in blocks_by_location.values() for name in block_counts}
+            block_ids = self._block_ids(names)
+
+            rows = []
+            for chunk_key, block_counts in blocks_by_location.items():
+                chunk_x, chunk_z = parse_chunk_key(chunk_key)
+                rows.extend((scan_id, chunk_x, chunk_z, block_ids[name], count)
+                            for name, count in block_counts.items())
+            self._connection.executemany(
+                "INSERT INTO chunk_blocks (scan_id, chunk_x, chunk_z, block_id, count) VALUES (?, ?, ?, ?, ?)",
+                rows)
+        return scan_id
+
+    def list_scans(self, server: Optional[str] = None, dimension: Optional[str] = None) -> List[Tuple[int, str, str, float]]:
+        """
+        Lists the stored scans, most recent first.
+
+        :param server: Only list the scans of this server.
+        :type server: str, optional
+        :param dimension: Only list the scans of this dimension.
+        :type dimension: str, optional
+        :return: A list of ``(scan_id, server, dimension, scanned_at)`` tuples.
+        :rtype: List[Tuple[int, str, str, float]]
+        """
+        query = "SELECT id, server, dimension, scanned_at FROM scans"
+        conditions, parameters = [], []
+        if server is not None:
+            conditions.append("server = ?")
+            parameters.append(server.lower())
+        if dimension is not None:
+            conditions.append("dimension = ?")
+            parameters.append(dimension.lower())
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        query += " ORDER BY scanned_at DESC"
+        return self._connection.execute(query, parameters).fetchall()
+
+    def latest_scan(self, server: str, dimension: str) -> Optional[int]:
+        """
+        Returns the id of the most recent scan of a server's dimension.
+
+        :param server: The name of the server.
+        :type server: str
+        :param dimension: The name of the dimension.
+        :type dimension: str
+        :return: The scan id, or ``None`` if the dimension was never scanned.
+        :rtype: Optional[int]
+        """
+        row = self._connection.execute(
+            "SELECT id FROM scans WHERE server = ? AND dimension = ? ORDER BY scanned_at DESC LIMIT 1",
+            (server.lower(), dimension.lower())).fetchone()
+        return None if row is None else row[0]
+
+    def load_scan(self, scan_id: int) -> Dict[str, Dict[str, int]]:
+        """
+        Returns the results of a scan, in the same format as `analyze_world_chunks`.
+
+        :param scan_id: The id of the scan.
+        :type scan_id: int
+        :return: The block counts of each chunk, keyed by ``"x:<block x>, z:<block z>"``.
+        :rtype: Dict[str, Dict[str, int]]
+        """
+        rows = self._connection.execute(
+            "SELECT chunk_x, chunk_z, name, count FROM chunk_blocks"
+            " JOIN block_names ON block_names.id = chunk_blocks.block_id"
+            " WHERE scan_id = ? ORDER BY chunk_x, chunk_z, count DESC",
+            (scan_id,))
+        blocks_by_location = {}
+        for chunk_x, chunk_z, name, count in rows:
+            blocks_by_location.setdefault(f"x:{chunk_x*16}, z:{chunk_z*16}", {})[name] = count
+        return blocks_by_location
+
+    def top_chunks(self, scan_id: int, block_name: str, limit: int = 50) -> List[Tuple[int, int, int]]:
+        """
+        Returns the chunks of a scan holding the most blocks of a type.
+
+        :param scan_id: The id of the scan.
+        :type scan_id: int
+        :param block_name: The name of the block, as in ids.json.
+        :type block_name: str
+        :param limit: The maximum number of chunks to return. Defaults to 50.
+        :type limit: int, optional
+        :return: A list of ``(chunk_x, chunk_z, count)`` tuples, highest count first.
+        :rtype: List[Tuple[int, int, int]]
+        """
+        return self._connection.execute(
+            "SELECT chunk_x, chunk_z, count FROM chunk_blocks"
+            " WHERE scan_id = ? AND block_id = (SELECT id FROM block_names WHERE name = ?)"
+            " ORDER BY count DESC LIMIT ?",
+            (scan_id, block_name, limit)).fetchall()
+
+    def delete_scan(self, scan_id: int):
+        """
+        Deletes a scan and its results.
+
+        :param scan_id: The id of the scan.
+        :type scan_id: int
+        """
+        with self._connection:
+            self._connection.execute("DELETE FROM scans WHERE id = ?", (scan_id,))
+
+    def _block_ids(self, names) -> Dict[str, int]:
+        """Returns the ids of block names, adding the missing names to the database"""
+        self._connection.executemany("INSERT OR IGNORE INTO block_names (name) VALUES (?)",
+                                     ((name,) for name in names))
+        return dict(self._connection.execute("SELECT name, id FROM block_names"))
+
+
+def parse_chunk_key(chunk_key: str) -> Tuple[int, int]:
+    """
+    Returns the chunk coordinates of a ``"x:<block x>, z:<block z>"`` chunk key,
+    as used by `analyze_world_chunks`.
+
+    :param chunk_key: The chunk key.
+    :type chunk_key: str
+    :return: The chunk's ``(x, z)`` coordinates.
+    :rtype: Tuple[int, int]
+    :raises ValueError: If the key isn't formatted this way.
+    """
+    match = CHUNK_KEY_PATTERN.fullmatch(chunk_key)
+    if match is None:
+        raise ValueError(f"Not a chunk key: {chunk_key}")
+    return int(match.group(1)) >> 4, int(match.group(2)) >> 4
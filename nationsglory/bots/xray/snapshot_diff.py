@@ -0,0 +1,282 @@
+"""
+Comparison of two snapshots of a world's region files, listing the chunks whose
+blocks changed in between.
+"""
+# Standard library imports
+import glob
+import os
+import shutil
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+# Third-party imports
+import anvil
+import numpy as np
+from anvil.chunk_cache import ChunkCache
+from anvil.region_cache import default_cache
+
+# Local imports
+from nationsglory.bots.xray import chunks
+from nationsglory.bots.xray.detection_chunk import block_name
+
+
+def get_snapshot_files(directory: str) -> List[str]:
+    """
+    Retrieve the .mca files of a snapshot directory, such as a copy of a
+    dimension's region folder made by `take_snapshot`.
+
+    :param directory: The snapshot directory.
+    :type directory: str
+    :return: A list of file paths to the .mca files of the directory.
+    :rtype: List[str]
+    """
+    return glob.glob(os.path.join(directory, "*.mca"))
+
+
+def take_snapshot(server: str, dimension: str, directory: str) -> List[str]:
+    """
+    Copies the region files of a server's dimension (see `chunks.get_mca_files`)
+    to a directory, keeping their modification times, so the world can later be
+    compared with this state.
+
+    :param server: The name of the server.
+    :type server: str
+    :param dimension: The dimension to copy.
+    :type dimension: str
+    :param directory: The snapshot directory, created if needed.
+    :type directory: str
+    :return: A list of file paths to the copied .mca files.
+    :rtype: List[str]
+    """
+    os.makedirs(directory, exist_ok=True)
+    return [shutil.copy2(file, directory) for file in chunks.get_mca_files(server, dimension)]
+
+
+def diff_chunks(old_chunk: Optional[anvil.Chunk], new_chunk: Optional[anvil.Chunk]) -> Tuple[int, np.ndarray]:
+    """
+    Compares the blocks of two versions of a chunk, section by section.
+    Sections whose raw bytes hash the same (see `chunks.section_digest`) are
+    skipped without being decoded.
+
+    :param old_chunk: The old version of the chunk, ``None`` if it didn't exist.
+    :type old_chunk: anvil.Chunk, optional
+    :param new_chunk: The new version of the chunk, ``None`` if it doesn't exist anymore.
+    :type new_chunk: anvil.Chunk, optional
+    :return: The number of blocks that changed, and the change in the number of
+        blocks of each ``id * 16 + data`` key, as a ``(4096 * 16,)`` array.
+    :rtype: Tuple[int, np.ndarray]
+    """
+    changed = 0
+    deltas = np.zeros(4096 * 16, dtype=np.int64)
+    for y in range(16):
+        old_section = None if old_chunk is None else old_chunk.get_section(y)
+        new_section = None if new_chunk is None else new_chunk.get_section(y)
+        if chunks.section_digest(old_section) == chunks.section_digest(new_section):
+            continue
+
+        old_keys = _section_keys(old_chunk, old_section)
+        new_keys = _section_keys(new_chunk, new_section)
+        changed += int(np.count_nonzero(old_keys != new_keys))
+        deltas += np.bincount(new_keys, minlength=4096 * 16)
+        deltas -= np.bincount(old_keys, minlength=4096 * 16)
+    return changed, deltas
+
+
+def diff_volumes(old_volume: Optional[Tuple[np.ndarray, np.ndarray]],
+                 new_volume: Optional[Tuple[np.ndarray, np.ndarray]]) -> Tuple[int, np.ndarray]:
+    """
+    Compares the blocks of two versions of a chunk like `diff_chunks`, from
+    their decoded arrays (see `anvil.ChunkCache.get_volume`).
+
+    :param old_volume: The old block ids and block data, ``None`` if the chunk didn't exist.
+    :type old_volume: Tuple[np.ndarray, np.ndarray], optional
+    :param new_volume: The new block ids and block data, ``None`` if the chunk doesn't exist anymore.
+    :type new_volume: Tuple[np.ndarray, np.ndarray], optional
+    :return: The number of blocks that changed, and the change in the number of
+        blocks of each ``id * 16 + data`` key, as a ``(4096 * 16,)`` array.
+    :rtype: Tuple[int, np.ndarray]
+    """
+    old_keys = _volume_keys(old_volume)
+    new_keys = _volume_keys(new_volume)
+    # Only count the sections that differ
+    differ = (old_keys != new_keys).any(axis=1)
+    changed = int(np.count_nonzero(old_keys[differ] != new_keys[differ]))
+    deltas = (np.bincount(new_keys[differ].ravel(), minlength=4096 * 16)
+              - np.bincount(old_keys[differ].ravel(), minlength=4096 * 16))
+    return changed, deltas
+
+
+def _volume_keys(volume: Optional[Tuple[np.ndarray, np.ndarray]]) -> np.ndarray:
+    """Returns the ``(16, 4096)`` ``id * 16 + data`` keys of a volume's sections, zeros for a missing chunk"""
+    if volume is None:
+        return np.zeros((16, 4096), dtype=np.intp)
+    ids, data = volume
+    return (ids.astype(np.intp) << 4 | data).reshape(16, 4096)
+
+
+def _section_keys(chunk: Optional[anvil.Chunk], section) -> np.ndarray:
+    """Returns the ``id * 16 + data`` keys of a section's blocks, zeros for a missing section"""
+    if chunk is None or section is None:
+        return np.zeros(4096, dtype=np.intp)
+    ids, data = chunk.section_array(section)
+    return (ids.astype(np.intp) << 4 | data).ravel()
+
+
+def name_deltas(deltas: np.ndarray) -> Dict[str, int]:
+    """
+    Converts per ``id * 16 + data`` deltas (see `diff_chunks`) to per block name
+    deltas, skipping air and the names whose delta adds up to zero.
+
+    :param deltas: The ``(4096 * 16,)`` deltas.
+    :type deltas: np.ndarray
+    :return: A dictionary mapping block names to the change in their number.
+    :rtype: Dict[str, int]
+    """
+    by_name = {}
+    for key in np.flatnonzero(deltas[16:]).tolist():
+        key += 16
+        name = block_name(key >> 4, key & 0b1111)
+        by_name[name] = by_name.get(name, 0) + int(deltas[key])
+    return {name: delta for name, delta in by_name.items() if delta}
+
+
+def diff_region_files(old_file: Optional[str], new_file: Optional[str],
+                      area: Optional[chunks.ChunkArea] = None, cache: Optional[ChunkCache] = None) -> List[Dict]:
+    """
+    Compares two versions of a region file. Only the chunks whose stamp in the
+    region header (see `anvil.Region.chunk_stamps`) changed are read.
+
+    :param old_file: The file path to the old version of the region file,
+        ``None`` if it didn't exist.
+    :type old_file: str, optional
+    :param new_file: The file path to the new version of the region file,
+        ``None`` if it doesn't exist anymore.
+    :type new_file: str, optional
+    :param area: Only compare the chunks of this area.
+    :type area: chunks.ChunkArea, optional
+    :param cache: The decoded chunk cache, chunks are then compared from their
+        cached volumes (see `diff_volumes`) instead of section by section.
+    :type cache: anvil.ChunkCache, optional
+    :return: The changed chunks, see `diff_snapshots`.
+    :rtype: List[Dict]
+    """
+    region_x, region_z = chunks.region_coordinates(new_file or old_file)
+    old_region = None if old_file is None else default_cache.get(old_file)
+    new_region = None if new_file is None else default_cache.get(new_file)
+
+    no_chunks = np.zeros((32, 32), dtype=np.uint64)
+    old_stamps = no_chunks if old_region is None else old_region.chunk_stamps()
+    new_stamps = no_chunks if new_region is None else new_region.chunk_stamps()
+    old_present = old_stamps.astype(bool) if old_region is None else old_region.present_chunks()
+    new_present = new_stamps.astype(bool) if new_region is None else new_region.present_chunks()
+    candidates = (old_stamps != new_stamps) & (old_present | new_present)
+    if area is not None:
+        candidates &= area.region_mask(region_x, region_z)
+
+    results = []
+    for x, z in zip(*np.nonzero(candidates.T)):
+        x, z = int(x), int(z)
+        try:
+            if cache is None:
+                old_chunk = old_region.get_chunk(x, z, lazy=True) if old_present[z, x] else None
+                new_chunk = new_region.get_chunk(x, z, lazy=True) if new_present[z, x] else None
+                changed, deltas = diff_chunks(old_chunk, new_chunk)
+            else:
+                old_volume = cache.get_volume(old_region, x, z) if old_present[z, x] else None
+                new_volume = cache.get_volume(new_region, x, z) if new_present[z, x] else None
+                changed, deltas = diff_volumes(old_volume, new_volume)
+        except chunks.UNREADABLE_CHUNK_ERRORS:
+            continue
+
+        if changed:
+            results.append({
+                "x": (region_x * 32 + x) * 16,
+                "z": (region_z * 32 + z) * 16,
+                "changed": changed,
+                "deltas": name_deltas(deltas),
+            })
+    return results
+
+
+def diff_snapshots(old_files: Iterable[str], new_files: Iterable[str], area: Optional[chunks.ChunkArea] = None,
+                   workers: Optional[int] = None,
+                   progress: Optional[Callable[[int, int], None]] = None,
+                   cache: Optional[ChunkCache] = None) -> List[Dict]:
+    """
+    Lists the chunks whose blocks changed between two snapshots of a dimension,
+    for example `get_snapshot_files` of a snapshot directory and
+    `chunks.get_mca_files` of the current world.
+
+    Region files are matched by name. Within them, chunks with the same
+    header stamp are skipped, and within changed chunks, identical sections
+    are skipped (see `diff_region_files` and `diff_chunks`).
+
+    :param old_files: The region files of the old snapshot.
+    :type old_files: Iterable[str]
+    :param new_files: The region files of the new snapshot.
+    :type new_files: Iterable[str]
+    :param area: Only compare the chunks of this area.
+    :type area: chunks.ChunkArea, optional
+    :param workers: The number of processes comparing region files, region files are
+        compared one by one in the calling process if not given.
+    :type workers: int, optional
+    :param progress: Called with the number of region files compared so far and
+        the total number of region files, each time one of them is done.
+    :type progress: Callable[[int, int], None], optional
+    :param cache: The decoded chunk cache, see `diff_region_files`. Worker processes
+        get an empty in memory copy of it, so give it a directory for them to share its files.
+    :type cache: anvil.ChunkCache, optional
+    :return: A list of dictionaries with the chunk's block coordinates (``x``, ``z``),
+        the number of blocks that ``changed``, and the ``deltas`` of the number of
+        blocks of each name (e.g. ``{"Chest": 12, "Stone": -3000}``), most changed chunk first.
+    :rtype: List[Dict]
+    """
+    old_by_name = {os.path.basename(file): file for file in old_files}
+    new_by_name = {os.path.basename(file): file for file in new_files}
+    pairs = []
+    for name in sorted(old_by_name.keys() | new_by_name.keys()):
+        try:
+            region_x, region_z = chunks.region_coordinates(name)
+        except ValueError:
+            continue
+        if area is None or area.intersects_region(region_x, region_z):
+            pairs.append((old_by_name.get(name), new_by_name.get(name)))
+
+    results: List[Optional[List[Dict]]] = [None] * len(pairs)
+    if not workers:
+        for i, (old_file, new_file) in enumerate(pairs):
+            results[i] = diff_region_files(old_file, new_file, area, cache)
+            if progress is not None:
+                progress(i + 1, len(pairs))
+    else:
+        with ProcessPoolExecutor(workers) as pool:
+            futures = {pool.submit(diff_region_files, old_file, new_file, area, cache): i
+                       for i, (old_file, new_file) in enumerate(pairs)}
+            for done, future in enumerate(as_completed(futures), 1):
+                results[futures[future]] = future.result()
+                if progress is not None:
+                    progress(done, len(pairs))
+
+    changed_chunks = [chunk for region_chunks in results for chunk in region_chunks]
+    changed_chunks.sort(key=lambda chunk: chunk["changed"], reverse=True)
+    return changed_chunks
+
+
+def change_heatmap(changed_chunks: List[Dict]) -> Tuple[np.ndarray, Tuple[int, int]]:
+    """
+    Lays the number of changed blocks of each chunk (see `diff_snapshots`) out
+    on a grid, one cell per chunk, to display where a world changed.
+
+    :param changed_chunks: The changed chunks.
+    :type changed_chunks: List[Dict]
+    :return: The ``[z, x]`` grid of changed block counts, and the block
+        coordinates of its north-west corner.
+    :rtype: Tuple[np.ndarray, Tuple[int, int]]
+    """
+    if not changed_chunks:
+        return np.zeros((0, 0), dtype=np.int64), (0, 0)
+    xs = np.array([chunk["x"] for chunk in changed_chunks]) >> 4
+    zs = np.array([chunk["z"] for chunk in changed_chunks]) >> 4
+    heatmap = np.zeros((zs.max() - zs.min() + 1, xs.max() - xs.min() + 1), dtype=np.int64)
+    np.add.at(heatmap, (zs - zs.min(), xs - xs.min()), [chunk["changed"] for chunk in changed_chunks])
+    return heatmap, (int(xs.min()) * 16, int(zs.min()) * 16)
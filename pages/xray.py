@@ -1,8 +1,25 @@
+import os
+
+import matplotlib.pyplot as plt
 import streamlit as st
 
-from nationsglory.bots.xray.detection_chunk import analyze_world_chunks, load_block_id, find_blocks_by_id
+from nationsglory.bots.xray.detection_chunk import analyze_world_chunks, block_targets, load_block_id, find_blocks_in_volume
 from nationsglory.bots.xray import chunks
+from nationsglory.bots.xray.block_index import INDEXED_BLOCK_NAMES, BlockIndex, default_index_path
+from nationsglory.bots.xray.overview_map import render_dimension
+from nationsglory.bots.xray.profiles import DEFAULT_DEPTH, find_suspicious_chunks
+from nationsglory.bots.xray.scan_manifest import ScanManifest
+from nationsglory.bots.xray.snapshot_diff import change_heatmap, diff_snapshots, get_snapshot_files, take_snapshot
+from nationsglory.bots.xray.scan_store import ScanStore
 import anvil
+from anvil.chunk_cache import ChunkCache
+
+
+@st.cache_resource
+def chunk_cache() -> ChunkCache:
+    """Decoded chunks shared by every session and worker process, only chunks saved since are decoded again"""
+    return ChunkCache(directory=chunks.DEFAULT_CHUNK_CACHE_DIRECTORY)
+
 
 # Main page content
 st.markdown("# Xray 🔎")
@@ -10,7 +27,7 @@ st.sidebar.markdown("# Xray 🔎")
 
 
 
-analyser, findBlock, schematic = st.tabs(["Analyser un serveur", "Recherche", "Schematic"])
+analyser, suspects, changes, findBlock, schematic = st.tabs(["Analyser un serveur", "Suspects", "Changements", "Recherche", "Schematic"])
 st.session_state.list_block_xray = []
 st.session_state.list_block_xray_by_block_id = []
 
@@ -19,17 +36,112 @@ with analyser:
 
     server = st.selectbox("Choisissez un serveur", ["blue","orange", "yellow", "white", "black", "cyan","lime","coral","pink","purple","green","red", "mocha"])
     dimension = st.selectbox("Choisissez une dimension", ["Overworld", "Lune", "Mars", "Edora", "Edora asteroide"])
-    st.spinner("Analyse en cours...")
+    workers = st.number_input("Processus", min_value=1, max_value=os.cpu_count() or 1, value=os.cpu_count() or 1)
     if st.button("Analyser un serveur"):
-        st.session_state.xray_data = analyze_world_chunks(server, dimension)
-        analyser.dataframe(st.session_state.xray_data)
+        progress_bar = analyser.progress(0.0, text="Analyse en cours...")
+
+        def show_progress(done, total):
+            progress_bar.progress(done / total, text=f"Analyse en cours... {done}/{total} régions")
+
+        with ScanStore() as store:
+            # Only the regions and chunks that changed since the last analysis are read again
+            st.session_state.xray_data = analyze_world_chunks(server, dimension, workers=workers,
+                                                              progress=show_progress, store=store,
+                                                              manifest=ScanManifest.load(),
+                                                              index=BlockIndex.load_or_create(
+                                                                  default_index_path(server, dimension)))
+        progress_bar.empty()
+        analyser.expander("Blocs par chunk").dataframe(st.session_state.xray_data)
+    else:
+        # Show the last stored scan, it survives page reloads
+        with ScanStore() as store:
+            scan_id = store.latest_scan(server, dimension)
+            if scan_id is not None:
+                analyser.expander("Blocs par chunk").dataframe(store.load_scan(scan_id))
+
+                top_block = analyser.selectbox("Chunks avec le plus de", sorted({block["name"] for block in load_block_id()}))
+                top_chunks = store.top_chunks(scan_id, top_block)
+                analyser.dataframe([{"x": chunk_x * 16, "z": chunk_z * 16, "nombre": count}
+                                    for chunk_x, chunk_z, count in top_chunks])
+
+    # Region tiles are only drawn again once their region file is modified
+    overlays = {"Aucun": None, "Densité de minerais": "ores", "Score suspect": "score"}
+    overlay = analyser.radio("Calque", list(overlays), horizontal=True)
+    scale = analyser.select_slider("Blocs par pixel", [1, 2, 4, 8, 16], value=8)
+    if analyser.button("Afficher la carte"):
+        map_progress = analyser.progress(0.0, text="Dessin de la carte...")
+
+        def show_map_progress(done, total):
+            map_progress.progress(done / total, text=f"Dessin de la carte... {done}/{total} régions")
+
+        image, (origin_x, origin_z) = render_dimension(server, dimension, overlay=overlays[overlay], scale=scale,
+                                                       workers=workers, progress=show_map_progress,
+                                                       cache=chunk_cache())
+        map_progress.empty()
+        analyser.image(image, caption=f"Nord en haut, coin nord-ouest en x:{origin_x}, z:{origin_z}")
+
+with suspects:
+    suspects_server = st.selectbox("Serveur", ["blue","orange", "yellow", "white", "black", "cyan","lime","coral","pink","purple","green","red", "mocha"])
+    suspects_dimension = st.selectbox("Dimension", ["Overworld", "Lune", "Mars", "Edora", "Edora asteroide"])
+    depth = st.number_input("Sous la couche Y", min_value=2, max_value=256, value=DEFAULT_DEPTH)
+    if st.button("Chercher des chunks suspects"):
+        suspects_progress = suspects.progress(0.0, text="Analyse en cours...")
+
+        def show_suspects_progress(done, total):
+            suspects_progress.progress(done / total, text=f"Analyse en cours... {done}/{total} régions")
+
+        st.session_state.xray_suspects = find_suspicious_chunks(suspects_server, suspects_dimension, depth=depth,
+                                                                workers=workers,
+                                                                progress=show_suspects_progress,
+                                                                cache=chunk_cache())
+        suspects_progress.empty()
+    if "xray_suspects" in st.session_state:
+        suspects.dataframe(st.session_state.xray_suspects)
+
+with changes:
+    changes_server = st.selectbox("Serveur ", ["blue","orange", "yellow", "white", "black", "cyan","lime","coral","pink","purple","green","red", "mocha"])
+    changes_dimension = st.selectbox("Dimension ", ["Overworld", "Lune", "Mars", "Edora", "Edora asteroide"])
+    snapshot_directory = st.text_input("Dossier du snapshot",
+                                       os.path.join("snapshots", changes_server, changes_dimension.lower()))
+
+    snapshotContainer, diffContainer = st.columns(2)
+    if snapshotContainer.button("Prendre un snapshot"):
+        files = take_snapshot(changes_server, changes_dimension, snapshot_directory)
+        changes.success(f"{len(files)} régions copiées dans {snapshot_directory}")
+
+    if diffContainer.button("Comparer avec le monde actuel"):
+        changes_progress = changes.progress(0.0, text="Comparaison en cours...")
+
+        def show_changes_progress(done, total):
+            changes_progress.progress(done / total, text=f"Comparaison en cours... {done}/{total} régions")
+
+        st.session_state.xray_changes = diff_snapshots(get_snapshot_files(snapshot_directory),
+                                                       chunks.get_mca_files(changes_server, changes_dimension),
+                                                       workers=workers, progress=show_changes_progress,
+                                                       cache=chunk_cache())
+        changes_progress.empty()
+
+    if st.session_state.get("xray_changes"):
+        heatmap, (origin_x, origin_z) = change_heatmap(st.session_state.xray_changes)
+        figure, axes = plt.subplots()
+        image = axes.imshow(heatmap, cmap="hot", interpolation="nearest",
+                            extent=(origin_x, origin_x + heatmap.shape[1] * 16,
+                                    origin_z + heatmap.shape[0] * 16, origin_z))
+        figure.colorbar(image, ax=axes, label="Blocs changés")
+        axes.set_xlabel("X")
+        axes.set_ylabel("Z")
+        changes.pyplot(figure)
+
+        changes.dataframe([{"x": chunk["x"], "z": chunk["z"], "blocs changés": chunk["changed"],
+                            **{name: delta for name, delta in chunk["deltas"].items()}}
+                           for chunk in st.session_state.xray_changes])
 
 with findBlock:
     blocks_to_find = {}
 
     xrayFile = findBlock.file_uploader("Choisissez un fichier MCA", type="mca")
     if xrayFile:
-        list_of_coordinates_chunks = anvil.Region(xrayFile).get_chunk_coordinates()
+        list_of_coordinates_chunks = anvil.Region(xrayFile.getvalue()).get_chunk_coordinates()
         st.write(f"Nombre de chunks : {len(list_of_coordinates_chunks)}")
         st.write(f"chunks : {list_of_coordinates_chunks}")
 
@@ -53,15 +165,57 @@ with findBlock:
 
 
     if st.button("Rechercher des blocs"):
-        st.success("Recherche en cours...")
-        region = anvil.Region.from_file(xrayFile)
-
-        chunk = region.get_chunk(chunk_x, chunk_z)
-        block_list = chunks.extract_blocks_from_chunk(chunk)
-
-        for block_key in st.session_state.list_block_xray:
-            st.session_state.list_block_xray_by_block_id.append([block_key[3],find_blocks_by_id(block_key[0], block_key[1],block_list)])
-        st.dataframe(st.session_state.list_block_xray_by_block_id)
+        if xrayFile is None:
+            st.warning("Choisissez d'abord un fichier MCA")
+        else:
+            st.success("Recherche en cours...")
+            region = anvil.Region(xrayFile.getvalue())
+            chunk = region.get_chunk(chunk_x, chunk_z, lazy=True)
+
+            # Every selected block is searched in a single pass over the chunk, whatever
+            # its metadata when ids.json doesn't name it (chests facing any way)
+            targets = {name: block_targets(block_id, block_data)
+                       for block_id, block_data, name in st.session_state.list_block_xray}
+            found = find_blocks_in_volume(*chunk.to_volume(), [target for name_targets in targets.values()
+                                                               for target in name_targets], chunk.x, chunk.z)
+
+            for name, name_targets in targets.items():
+                coordinates = [position for target in name_targets for position in found[target]]
+                st.session_state.list_block_xray_by_block_id.append({
+                    "bloc": name,
+                    "nombre": len(coordinates),
+                    "coordonnées": ", ".join(f"({x}, {y}, {z})" for x, y, z in coordinates),
+                })
+            st.dataframe(st.session_state.list_block_xray_by_block_id)
+
+    # Spawners, chests, diamond blocks... are indexed by the server analysis, no file needed
+    index_server = st.selectbox("Serveur de l'index", ["blue","orange", "yellow", "white", "black", "cyan","lime","coral","pink","purple","green","red", "mocha"])
+    index_dimension = st.selectbox("Dimension de l'index", ["Overworld", "Lune", "Mars", "Edora", "Edora asteroide"])
+    indexed_block_ids = st.multiselect("Blocs indexés", list(INDEXED_BLOCK_NAMES), default=list(INDEXED_BLOCK_NAMES),
+                                       format_func=INDEXED_BLOCK_NAMES.get)
+    bboxContainer1, bboxContainer2, bboxContainer3, bboxContainer4 = st.columns(4)
+    x1 = bboxContainer1.number_input("X1", value=-30000000)
+    z1 = bboxContainer2.number_input("Z1", value=-30000000)
+    x2 = bboxContainer3.number_input("X2", value=30000000)
+    z2 = bboxContainer4.number_input("Z2", value=30000000)
+
+    if st.button("Rechercher dans l'index"):
+        try:
+            index = BlockIndex.load(default_index_path(index_server, index_dimension))
+        except OSError:
+            st.warning("Analysez d'abord ce serveur pour construire son index")
+        else:
+            area = chunks.ChunkArea.from_blocks(x1, z1, x2, z2)
+            indexed_blocks = []
+            for block_id in indexed_block_ids:
+                # Indexed blocks are found whatever their metadata
+                coordinates = index.find(block_id, None, area)
+                indexed_blocks.append({
+                    "bloc": INDEXED_BLOCK_NAMES[block_id],
+                    "nombre": len(coordinates),
+                    "coordonnées": ", ".join(f"({x}, {y}, {z})" for x, y, z in coordinates.tolist()),
+                })
+            st.dataframe(indexed_blocks)
 
 with schematic:
     schematicFile = schematic.file_uploader("Choisissez un fichier pour créer un schematic", type="mca")
@@ -72,22 +226,19 @@ with schematic:
     chunk_z = chunkContainer3.number_input("Z", min_value=0, max_value=31, value=0)
 
     if st.button("Créer un schematic"):
-        region = anvil.Region.from_file(schematicFile)
-        chunk = region.get_chunk(chunk_x, chunk_z)
-        block_list = chunks.extract_blocks_from_chunk(chunk)
-
-
-        # Generate the schematic file
-        schematic = chunks.save_chunks_as_schematic([block_list])
-
-        st.download_button(
-            label="Télécharger le schematic",
-            data=schematic,
-            file_name=f"{xrayFile.name[:-4]}.schematic",
-            mime="text/schematic",
-            icon=":material/download:",
-        )
-
-
-
-
+        if schematicFile is None:
+            st.warning("Choisissez d'abord un fichier MCA")
+        else:
+            region = anvil.Region(schematicFile.getvalue())
+            chunk = region.get_chunk(chunk_x, chunk_z)
+
+            # Generate the schematic file
+            schematic_bytes = chunks.schematic_to_bytes(chunks.save_chunks_as_schematic([chunk]))
+
+            st.download_button(
+                label="Télécharger le schematic",
+                data=schematic_bytes,
+                file_name=f"{schematicFile.name[:-4]}.schematic",
+                mime="application/octet-stream",
+                icon=":material/download:",
+            )
@@ -0,0 +1,80 @@
+"""
+Shared helpers: small pre-flattening (1.6) region files written on the fly.
+"""
+import getpass
+import os
+import zlib
+from io import BytesIO
+from typing import Dict, Iterable, Optional, Sequence, Tuple
+
+from nbt import nbt
+
+# PathGestion reads the login name when nationsglory is imported, which fails without a terminal
+try:
+    os.getlogin()
+except OSError:
+    os.getlogin = getpass.getuser
+
+
+def chunk_nbt(chunk_x: int, chunk_z: int, tile_entities: Iterable[Tuple[str, int, int, int]] = (),
+              block_ids: Optional[Sequence[int]] = None) -> bytes:
+    """
+    Returns the uncompressed NBT of a chunk of stone up to Y 16, with the given ``(id, x, y, z)`` tile entities.
+    ``block_ids`` replaces the 4096 blocks of that section, in YZX order, ids above 255 going in its ``Add`` array
+    """
+    level = nbt.TAG_Compound(name="Level")
+    level.tags.append(nbt.TAG_Int(name="xPos", value=chunk_x))
+    level.tags.append(nbt.TAG_Int(name="zPos", value=chunk_z))
+
+    tile_entity_list = nbt.TAG_List(name="TileEntities", type=nbt.TAG_Compound)
+    for tile_id, x, y, z in tile_entities:
+        tile_entity = nbt.TAG_Compound()
+        tile_entity.tags.append(nbt.TAG_String(name="id", value=tile_id))
+        for name, value in (("x", x), ("y", y), ("z", z)):
+            tile_entity.tags.append(nbt.TAG_Int(name=name, value=value))
+        tile_entity_list.tags.append(tile_entity)
+    level.tags.append(tile_entity_list)
+
+    section = nbt.TAG_Compound()
+    section.tags.append(nbt.TAG_Byte(name="Y", value=0))
+    block_ids = [1] * 4096 if block_ids is None else block_ids
+    blocks = nbt.TAG_Byte_Array(name="Blocks")
+    blocks.value = bytearray(block_id & 0xFF for block_id in block_ids)
+    data = nbt.TAG_Byte_Array(name="Data")
+    data.value = bytearray(2048)
+    section.tags.extend([blocks, data])
+    if any(block_id > 0xFF for block_id in block_ids):
+        # Minecraft's nibble arrays hold the even block in the low nibble
+        add = nbt.TAG_Byte_Array(name="Add")
+        add.value = bytearray(block_ids[i] >> 8 | (block_ids[i + 1] >> 8) << 4 for i in range(0, 4096, 2))
+        section.tags.append(add)
+    sections = nbt.TAG_List(name="Sections", type=nbt.TAG_Compound)
+    sections.tags.append(section)
+    level.tags.append(sections)
+
+    root = nbt.NBTFile()
+    root.tags.append(level)
+    buffer = BytesIO()
+    root.write_file(buffer=buffer)
+    return buffer.getvalue()
+
+
+def write_region(path: str, chunks: Dict[Tuple[int, int], bytes], compression: int = 2) -> str:
+    """
+    Writes a region file holding the given chunk NBT, keyed by chunk coordinates in the region.
+    Chunks are written in key order, so truncating the file cuts the last ones.
+    """
+    locations, timestamps, body = bytearray(4096), bytearray(4096), bytearray()
+    for (x, z), raw in chunks.items():
+        payload = zlib.compress(raw) if compression == 2 else raw
+        entry = (len(payload) + 1).to_bytes(4, "big") + bytes([compression]) + payload
+        entry += bytes(-len(entry) % 4096)
+        index = 4 * (x + z * 32)
+        locations[index:index + 3] = (2 + len(body) // 4096).to_bytes(3, "big")
+        locations[index + 3] = len(entry) // 4096
+        timestamps[index:index + 4] = (1000 + index).to_bytes(4, "big")
+        body += entry
+    with open(path, "wb") as file:
+        file.write(locations + timestamps + body)
+    return path
+
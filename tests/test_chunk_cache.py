@@ -0,0 +1,44 @@
+import glob
+import os
+
+import numpy as np
+import pytest
+
+import anvil
+from anvil.chunk_cache import ChunkCache
+from conftest import chunk_nbt, write_region
+
+
+def break_truncate(file):
+    with open(file, "r+b") as f:
+        f.truncate(os.path.getsize(file) // 2)
+
+
+def break_garbage(file):
+    with open(file, "wb") as f:
+        f.write(b"not a numpy file")
+
+
+def break_shape(file):
+    np.save(file, np.arange(3, dtype=np.uint16))
+
+
+def break_rows(file):
+    saved = np.load(file)
+    saved[1, 0] = 40  # Section index past the 16 sections of a chunk
+    np.save(file, saved)
+
+
+@pytest.mark.parametrize("break_file", [break_truncate, break_garbage, break_shape, break_rows])
+def test_broken_cache_file_is_decoded_again(tmp_path, break_file):
+    region = anvil.Region.from_file(write_region(os.path.join(tmp_path, "r.0.0.mca"), {(0, 0): chunk_nbt(0, 0)}))
+    directory = os.path.join(tmp_path, "cache")
+    expected = ChunkCache(directory=directory).get_volume(region, 0, 0)
+    file, = glob.glob(os.path.join(directory, "*", "*.npy"))
+    break_file(file)
+
+    ids, data = ChunkCache(directory=directory).get_volume(region, 0, 0)
+
+    assert (ids == expected[0]).all() and (data == expected[1]).all()
+    # The broken file was replaced by a valid one
+    assert np.load(file).shape == (2, 4097)
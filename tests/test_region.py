@@ -0,0 +1,50 @@
+import multiprocessing
+import os
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+
+import pytest
+
+import anvil
+from conftest import chunk_nbt, write_region
+
+# Compression type only known to ReversedRegion
+COMPRESSION_REVERSED = 99
+
+
+def decompress_reversed(payload, bufsize):
+    return zlib.decompress(bytes(payload)[::-1], zlib.MAX_WBITS, bufsize)
+
+
+class ReversedRegion(anvil.Region):
+    pass
+
+
+ReversedRegion.register_codec(COMPRESSION_REVERSED, decompress_reversed)
+
+
+@pytest.fixture
+def reversed_region(tmp_path):
+    path = write_region(os.path.join(tmp_path, "r.0.0.mca"), {
+        (x, 0): zlib.compress(chunk_nbt(x, 0))[::-1] for x in range(3)
+    }, compression=COMPRESSION_REVERSED)
+    return ReversedRegion.from_file(path)
+
+
+def test_subclass_codec_isnt_registered_on_region():
+    assert COMPRESSION_REVERSED not in anvil.Region.codecs
+
+
+@pytest.mark.parametrize("start_method", ["fork", "spawn"])
+def test_subclass_codec_in_worker_processes(reversed_region, start_method):
+    if start_method not in multiprocessing.get_all_start_methods():
+        pytest.skip(f"{start_method} isn't available")
+    with ProcessPoolExecutor(2, mp_context=multiprocessing.get_context(start_method)) as executor:
+        read = [(chunk.x, chunk.z) for chunk in reversed_region.iter_chunks(workers=2, executor=executor)]
+    assert read == [(0, 0), (1, 0), (2, 0)]
+
+
+def test_executor_needs_workers(reversed_region):
+    with ProcessPoolExecutor(1) as executor:
+        with pytest.raises(ValueError):
+            next(reversed_region.iter_chunks(executor=executor))
@@ -0,0 +1,47 @@
+import gzip
+import os
+from io import BytesIO
+
+import nbtlib
+import numpy as np
+
+import anvil
+from conftest import chunk_nbt, write_region
+from nationsglory.bots.xray import chunks
+
+# The first four blocks of the section, at y 0, z 0 and x 0 to 3
+FIRST_BLOCK_IDS = [0x1A5, 0x2B0, 0x003, 0x3FF]
+
+
+def make_schematic(tmp_path):
+    block_ids = FIRST_BLOCK_IDS + [1] * 4092
+    region = anvil.Region.from_file(write_region(os.path.join(tmp_path, "r.0.0.mca"),
+                                                 {(0, 0): chunk_nbt(0, 0, block_ids=block_ids)}))
+    schematic = chunks.save_chunks_as_schematic([region.get_chunk(0, 0)])
+    with gzip.GzipFile(fileobj=BytesIO(chunks.schematic_to_bytes(schematic))) as file:
+        return nbtlib.File.parse(file).root
+
+
+def test_add_blocks_nibble_order(tmp_path):
+    root = make_schematic(tmp_path)
+    add_blocks = np.asarray(root["AddBlocks"]).view(np.uint8)
+
+    # MCEdit and Schematica layout: the even block in the high nibble
+    assert add_blocks[:2].tolist() == [0x12, 0x03]
+    assert len(add_blocks) == 256 * 16 * 16 // 2
+    assert not add_blocks[2:].any()
+
+
+def test_blocks_keep_low_byte(tmp_path):
+    root = make_schematic(tmp_path)
+    blocks = np.asarray(root["Blocks"]).view(np.uint8)
+
+    assert blocks[:4].tolist() == [0xA5, 0xB0, 0x03, 0xFF]
+    assert (root["Height"], root["Length"], root["Width"]) == (256, 16, 16)
+
+
+def test_no_add_blocks_for_vanilla_ids(tmp_path):
+    region = anvil.Region.from_file(write_region(os.path.join(tmp_path, "r.0.0.mca"), {(0, 0): chunk_nbt(0, 0)}))
+    schematic = chunks.save_chunks_as_schematic([region.get_chunk(0, 0)])
+
+    assert "AddBlocks" not in schematic.root
@@ -0,0 +1,48 @@
+import os
+
+import pytest
+
+import anvil
+from anvil.errors import CorruptChunk
+from conftest import chunk_nbt, write_region
+from nationsglory.bots.xray import chunks
+
+
+def write_dimension(directory):
+    """Writes two regions with a chest per chunk, the last chunk of the second one cut off"""
+    first = write_region(os.path.join(directory, "r.0.0.mca"), {
+        (0, 0): chunk_nbt(0, 0, [("Chest", 1, 10, 2)]),
+        (1, 0): chunk_nbt(1, 0, [("Chest", 17, 11, 3), ("MobSpawner", 18, 12, 4)]),
+    })
+    second = write_region(os.path.join(directory, "r.1.0.mca"), {
+        (0, 0): chunk_nbt(32, 0, [("Chest", 513, 13, 5)]),
+        (1, 0): chunk_nbt(33, 0, [("Chest", 529, 14, 6)]),
+    })
+    with open(second, "r+b") as file:
+        file.truncate(os.path.getsize(second) - 4096)
+    return [first, second]
+
+
+def test_truncated_region_raises_without_skip_errors(tmp_path):
+    _, truncated = write_dimension(tmp_path)
+    with pytest.raises(CorruptChunk):
+        anvil.Region.from_file(truncated).index_tile_entities()
+
+
+@pytest.mark.parametrize("workers, processes", [(None, False), (2, False), (2, True)])
+def test_iter_chunks_skips_unreadable_chunks(tmp_path, workers, processes):
+    _, truncated = write_dimension(tmp_path)
+    region = anvil.Region.from_file(truncated)
+    read = [(chunk.x, chunk.z) for chunk in region.iter_chunks(workers=workers, processes=processes,
+                                                                skip_errors=chunks.UNREADABLE_CHUNK_ERRORS)]
+    assert read == [(32, 0)]
+
+
+@pytest.mark.parametrize("workers", [None, 2])
+def test_index_dimension_with_truncated_region(tmp_path, monkeypatch, workers):
+    files = write_dimension(tmp_path)
+    monkeypatch.setattr(chunks, "get_mca_files", lambda server, dimension="overworld", area=None: files)
+
+    index = chunks.index_tile_entities("blue", "overworld", workers=workers)
+
+    assert index == {"Chest": [(1, 10, 2), (17, 11, 3), (513, 13, 5)], "MobSpawner": [(18, 12, 4)]}